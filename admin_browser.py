@@ -0,0 +1,113 @@
+# admin_browser.py
+# -*- coding: utf-8 -*-
+"""Prebuilt indexes over the master/log DataFrames for filtered, paginated admin views."""
+import threading
+from datetime import date, datetime, time
+
+import numpy as np
+import pandas as pd
+
+from config import RANK_COUNT
+from storage import normalize_id
+
+ID_COL = "תעודת זהות"
+DATE_COL = "תאריך שליחה"
+YEAR_COL = "שנת לימודים"
+NAME_COLS = ("שם פרטי", "שם משפחה")
+SITE_COLS = tuple(f"מקום הכשרה {i}" for i in range(1, RANK_COUNT + 1))
+DATE_FMT = "%d/%m/%Y %H:%M:%S"
+
+
+class SubmissionIndex:
+    """Hash index on ID, inverted index on the site columns, grouped index on study year,
+    and a sorted submission-time index. Queries return row positions, so a page is
+    cut from the frame without scanning it.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        n = len(df)
+        self.all = np.arange(n)
+
+        self.by_id: dict[str, np.ndarray] = {}
+        if ID_COL in df:
+            ids = df[ID_COL].map(normalize_id).to_numpy()
+            self.by_id = pd.Series(ids).groupby(ids).indices
+
+        # אינדקס הפוך: מוסד -> השורות שבהן הוא מופיע באחד מ"מקום הכשרה 1..3"
+        acc: dict[str, list] = {}
+        for c in (c for c in SITE_COLS if c in df):
+            values = df[c].to_numpy()
+            for site, idx in pd.Series(values).groupby(values).indices.items():
+                acc.setdefault(site, []).append(idx)
+        self.by_site = {site: np.unique(np.concatenate(v)) for site, v in acc.items()}
+
+        self.by_year: dict[str, np.ndarray] = {}
+        if YEAR_COL in df:
+            years = df[YEAR_COL].astype(str).to_numpy()
+            self.by_year = pd.Series(years).groupby(years).indices
+
+        self.names = None
+        if all(c in df for c in NAME_COLS):
+            self.names = (df[NAME_COLS[0]].fillna("").astype(str) + " " +
+                          df[NAME_COLS[1]].fillna("").astype(str)).str.lower().reset_index(drop=True)
+
+        self.dates_sorted = self.dates_order = None
+        if DATE_COL in df:
+            ts = pd.to_datetime(df[DATE_COL], format=DATE_FMT, errors="coerce").to_numpy()
+            order = np.argsort(ts, kind="stable")
+            valid = ~np.isnat(ts[order])
+            self.dates_order = order[valid]
+            self.dates_sorted = ts[order][valid]
+
+    def sites(self) -> list[str]:
+        return sorted(self.by_site)
+
+    def years(self) -> list[str]:
+        return sorted(self.by_year)
+
+    def query(self, nat_id: str = "", name: str = "", site: str = "", year: str = "",
+              date_from: date | None = None, date_to: date | None = None) -> np.ndarray:
+        """Row positions matching all given filters, in file order."""
+        sets = []
+        if nat_id.strip():
+            sets.append(self.by_id.get(normalize_id(nat_id), np.empty(0, dtype=int)))
+        if site:
+            sets.append(self.by_site.get(site, np.empty(0, dtype=int)))
+        if year:
+            sets.append(self.by_year.get(year, np.empty(0, dtype=int)))
+        if (date_from or date_to) and self.dates_sorted is not None:
+            lo = np.datetime64(datetime.combine(date_from, time.min)) if date_from else None
+            hi = np.datetime64(datetime.combine(date_to, time.max)) if date_to else None
+            a = np.searchsorted(self.dates_sorted, lo, "left") if lo is not None else 0
+            b = np.searchsorted(self.dates_sorted, hi, "right") if hi is not None else len(self.dates_sorted)
+            sets.append(np.sort(self.dates_order[a:b]))
+        rows = None
+        for s in sorted(sets, key=len):
+            rows = np.asarray(s) if rows is None else np.intersect1d(rows, s, assume_unique=True)
+        if rows is None:
+            rows = self.all
+        if name.strip() and self.names is not None:
+            # חיפוש שם רק על המועמדים שנותרו אחרי האינדקסים
+            hit = self.names.iloc[rows].str.contains(name.strip().lower(), regex=False).to_numpy()
+            rows = rows[hit]
+        return rows
+
+    def page(self, rows: np.ndarray, page: int, page_size: int) -> pd.DataFrame:
+        start = max(0, page - 1) * page_size
+        return self.df.iloc[rows[start:start + page_size]]
+
+
+class IndexCache:
+    """Keeps the index of the latest DataFrame per name (rebuilt when the loader returns a new frame)."""
+
+    def __init__(self):
+        self._items: dict[str, SubmissionIndex] = {}
+        self._mutex = threading.Lock()
+
+    def get(self, name: str, df: pd.DataFrame) -> SubmissionIndex:
+        with self._mutex:
+            index = self._items.get(name)
+            if index is None or index.df is not df:
+                index = self._items[name] = SubmissionIndex(df)
+            return index
@@ -0,0 +1,259 @@
+# backups.py
+# -*- coding: utf-8 -*-
+"""Incremental backups: periodic full snapshots + gzip delta segments, retention and restore.
+
+Layout of BACKUP_DIR:
+    snapshot_<stamp>_<seq>.csv.gz   full master up to (and including) row <seq>
+    delta_<stamp>_<seq>.jsonl.gz    rows appended after snapshot <seq>, one JSON line each
+
+Usage:
+    python backups.py list
+    python backups.py restore --at "2025-09-01 12:00" --out restored.csv
+    python backups.py prune
+"""
+import argparse
+import gzip
+import json
+import re
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from config import BACKUP_DIR, COLUMNS_ORDER
+from storage import normalize_id
+
+STAMP_FMT = "%Y%m%dT%H%M%S%f"
+_NAME_RE = re.compile(r"^(snapshot|delta)_(\d{8}T\d{12})_(\d+)\.(csv|jsonl)\.gz$")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass(frozen=True)
+class BackupFile:
+    kind: str          # "snapshot" / "delta"
+    stamp: datetime
+    seq: int           # מספר השורה האחרון בסנאפשוט (או הבסיס של הדלתא)
+    path: Path
+
+
+@dataclass
+class RetentionPolicy:
+    snapshot_every_rows: int = 200        # סנאפשוט מלא כל N שליחות
+    snapshot_every_minutes: float = 60.0  # או כל X דקות, המוקדם מביניהם
+    keep_snapshots: int = 24              # כמה סנאפשוטים מלאים לשמור
+    max_age_days: float | None = None     # מחיקת קבצים ישנים מ-X ימים (None = ללא הגבלה)
+
+    @classmethod
+    def from_mapping(cls, m) -> "RetentionPolicy":
+        fields = cls.__dataclass_fields__
+        return cls(**{k: m[k] for k in fields if k in m})
+
+
+class BackupManager:
+    """Writes one small compressed delta record per submission and a full snapshot periodically."""
+
+    def __init__(self, backup_dir: Path = BACKUP_DIR, columns: list[str] = COLUMNS_ORDER,
+                 policy: RetentionPolicy | None = None, id_column: str = "תעודת זהות"):
+        self.dir = Path(backup_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.columns = list(columns)
+        self.id_column = id_column
+        self.policy = policy or RetentionPolicy()
+        self._base: BackupFile | None = None
+        self._rows_since_snapshot = 0
+        self._load_state()
+
+    # =========================
+    # מצב
+    # =========================
+    def files(self) -> list[BackupFile]:
+        out = []
+        for p in self.dir.glob("*.gz"):
+            m = _NAME_RE.match(p.name)
+            if not m:
+                continue
+            stamp = datetime.strptime(m.group(2), STAMP_FMT).replace(tzinfo=timezone.utc)
+            out.append(BackupFile(m.group(1), stamp, int(m.group(3)), p))
+        return sorted(out, key=lambda f: (f.seq, f.stamp))
+
+    def snapshots(self) -> list[BackupFile]:
+        return [f for f in self.files() if f.kind == "snapshot"]
+
+    def _delta_path(self, base: BackupFile) -> Path:
+        return self.dir / f"delta_{base.stamp.strftime(STAMP_FMT)}_{base.seq:08d}.jsonl.gz"
+
+    def _load_state(self) -> None:
+        snaps = self.snapshots()
+        if not snaps:
+            return
+        self._base = snaps[-1]
+        self._rows_since_snapshot = 0
+        delta = self._delta_path(self._base)
+        if delta.exists():
+            with gzip.open(delta, "rt", encoding="utf-8") as f:
+                self._rows_since_snapshot = sum(1 for _ in f)
+
+    def refresh(self) -> None:
+        """Pick up a snapshot taken by another server process (call while holding the write lock)."""
+        snaps = self.snapshots()
+        if snaps and snaps[-1] != self._base:
+            self._load_state()
+
+    # =========================
+    # כתיבה
+    # =========================
+    def snapshot(self, df_master: pd.DataFrame, seq: int) -> BackupFile:
+        """Write a full compressed snapshot of the master up to row `seq` and start a new delta segment."""
+        stamp = _now()
+        path = self.dir / f"snapshot_{stamp.strftime(STAMP_FMT)}_{seq:08d}.csv.gz"
+        tmp = path.with_name(path.name + ".tmp")
+        df_master.reindex(columns=self.columns).to_csv(
+            tmp, index=False, encoding="utf-8-sig", compression="gzip")
+        tmp.replace(path)
+        self._base = BackupFile("snapshot", stamp, seq, path)
+        self._rows_since_snapshot = 0
+        self.prune()
+        return self._base
+
+    def snapshot_due(self) -> bool:
+        if self._base is None:
+            return True
+        p = self.policy
+        if self._rows_since_snapshot >= p.snapshot_every_rows:
+            return True
+        return _now() - self._base.stamp >= timedelta(minutes=p.snapshot_every_minutes)
+
+    def record(self, seq: int, row: dict) -> None:
+        """Append one submission to the current delta segment (one gzip member per record)."""
+        self.record_many([seq], [row])
+
+    def record_many(self, seqs: list[int], rows: list[dict],
+                    replaces: list[str | None] | None = None) -> None:
+        """Append several submissions to the current delta segment as a single gzip member.
+
+        `replaces` holds, per row, the ID whose earlier row this one supersedes
+        (keep_latest policy); restore drops those rows before appending.
+        """
+        if self._base is None:
+            raise RuntimeError("no base snapshot — call snapshot() first")
+        ts = _now().isoformat()
+        replaces = replaces or [None] * len(rows)
+        lines = "".join(
+            json.dumps({"seq": seq, "ts": ts, "row": {c: row.get(c) for c in self.columns},
+                        **({"replaces": rep} if rep else {})},
+                       ensure_ascii=False, default=str) + "\n"
+            for seq, row, rep in zip(seqs, rows, replaces)
+        )
+        with gzip.open(self._delta_path(self._base), "at", encoding="utf-8") as f:
+            f.write(lines)
+        self._rows_since_snapshot += len(rows)
+
+    def prune(self) -> list[Path]:
+        """Apply the retention policy; returns the removed files."""
+        p = self.policy
+        snaps = self.snapshots()
+        if not snaps:
+            return []
+        keep = snaps[-max(1, p.keep_snapshots):]
+        if p.max_age_days is not None:
+            cutoff = _now() - timedelta(days=p.max_age_days)
+            # תמיד משאירים לפחות את הסנאפשוט האחרון
+            keep = [s for s in keep if s.stamp >= cutoff] or keep[-1:]
+        oldest = keep[0]
+        removed = []
+        for f in self.files():
+            if f.seq < oldest.seq or (f.seq == oldest.seq and f.stamp < oldest.stamp):
+                f.path.unlink(missing_ok=True)
+                removed.append(f.path)
+        return removed
+
+    # =========================
+    # שחזור
+    # =========================
+    def restore(self, at: datetime | None = None) -> pd.DataFrame:
+        """Rebuild the master as it was at time `at` (default: latest)."""
+        at = at or _now()
+        if at.tzinfo is None:
+            at = at.replace(tzinfo=timezone.utc)
+        snaps = [s for s in self.snapshots() if s.stamp <= at]
+        if not snaps:
+            raise LookupError(f"no snapshot at or before {at.isoformat()}")
+        base = snaps[-1]
+        df = pd.read_csv(base.path, encoding="utf-8-sig", compression="gzip", dtype=object)
+        rows, replaced = [], set()
+        delta = self._delta_path(base)
+        if delta.exists():
+            with gzip.open(delta, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # רשומה אחרונה שנקטעה באמצע כתיבה
+                    if datetime.fromisoformat(entry["ts"]) > at:
+                        break
+                    rep = entry.get("replaces")
+                    if rep:
+                        # שורה קודמת עם אותה ת"ז הוחלפה (keep_latest)
+                        rows = [r for r in rows if normalize_id(r.get(self.id_column)) != rep]
+                        replaced.add(rep)
+                    rows.append(entry["row"])
+        if replaced and self.id_column in df:
+            df = df[~df[self.id_column].map(normalize_id).isin(replaced)]
+        if rows:
+            df = pd.concat([df, pd.DataFrame(rows, columns=self.columns)], ignore_index=True)
+        return df.reindex(columns=self.columns)
+
+
+# =========================
+# CLI
+# =========================
+def _parse_at(v: str) -> datetime:
+    dt = datetime.fromisoformat(v)
+    if dt.tzinfo is None:
+        # זמן מקומי של השרת
+        dt = dt.astimezone()
+    return dt.astimezone(timezone.utc)
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dir", type=Path, default=BACKUP_DIR)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list")
+    r = sub.add_parser("restore")
+    r.add_argument("--at", type=_parse_at, default=None, help="ISO time, e.g. '2025-09-01 12:00'")
+    r.add_argument("--out", type=Path, required=True)
+    pr = sub.add_parser("prune")
+    pr.add_argument("--keep", type=int, default=None)
+    pr.add_argument("--max-age-days", type=float, default=None)
+    args = ap.parse_args(argv)
+
+    mgr = BackupManager(args.dir)
+    if args.cmd == "list":
+        for f in mgr.files():
+            print(f"{f.kind:9} {f.stamp.isoformat()} seq={f.seq:<8} {f.path.stat().st_size:>10}  {f.path.name}")
+    elif args.cmd == "restore":
+        try:
+            df = mgr.restore(args.at)
+        except LookupError as e:
+            print(f"cannot restore: {e}", file=sys.stderr)
+            return 1
+        df.to_csv(args.out, index=False, encoding="utf-8-sig")
+        print(f"restored {len(df)} rows -> {args.out}")
+    elif args.cmd == "prune":
+        if args.keep is not None:
+            mgr.policy.keep_snapshots = args.keep
+        if args.max_age_days is not None:
+            mgr.policy.max_age_days = args.max_age_days
+        for p in mgr.prune():
+            print(f"removed {p.name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
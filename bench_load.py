@@ -0,0 +1,356 @@
+# bench_load.py
+# -*- coding: utf-8 -*-
+"""Load test: simulated students fill the six wizard steps and submit, concurrently.
+
+Every student is a Streamlit AppTest session that types synthetic valid
+answers into the widgets of each step, ticks the step's declaration, moves on
+with "הבא" and finally clicks "שליחה". Google Sheets is replaced by a
+worksheet kept in a local file (tests/fakes.py FakeWorksheet, optional per-call delay), so
+the background sync and the reconciliation run end to end without the network.
+
+AppTest swaps process-wide state on every run, so the sessions run in
+--concurrency worker processes sharing one data directory (like that many app
+replicas): their submits contend on the cross-process write lock, the SQLite
+master and the Sheets outbox.
+
+Each master size runs in a fresh interpreter inside an empty data directory
+that is first seeded with that many rows, and reports:
+    submit p50/p95/p99   wall time of the submit rerun, in ms
+    lost                 submitted IDs missing from the master / the log / the sheet
+    duplicated_sheet     rows appended to the sheet more than once
+    load_csv_ms          load_csv_safely of the master CSV
+    excel_ms             df_to_excel_bytes of the master
+
+Results go to --out (text) and --json; with --baseline the run fails (exit 1)
+when a timing regresses by more than --tolerance against an earlier --json.
+
+Usage:
+    python bench_load.py [--sizes 1000 10000 50000] [--students 40] [--concurrency 8]
+                         [--sheet-delay-ms 50] [--out bench_output.txt] [--json bench.json]
+                         [--baseline bench.json] [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from tests.fakes import FakeWorksheet, install_fake_sheets
+
+APP = Path(__file__).resolve().with_name("streamlit_app.py")
+GO_FILE = "go"
+SHEET_FILE = Path("fake_sheet.jsonl")
+BLOCK = 1_000_000          # ת"ז לכל תהליך עובד: first .. first + BLOCK - 1 (האחרונה לסשן החימום)
+TIMINGS = ("submit_p50_ms", "submit_p95_ms", "submit_p99_ms", "load_csv_ms", "excel_ms")
+ADDITIONAL_LANGS = ["עברית", "ערבית", "רוסית", "אנגלית"]
+
+
+# =========================
+# נתונים סינתטיים
+# =========================
+def national_id(n: int) -> str:
+    return f"{n:09d}"
+
+
+def answers(n: int, rng: random.Random) -> dict:
+    """Valid wizard answers (session keys -> values) for student number n."""
+    from config import DOMAINS, GENDERS, LIKERT, MOTHER_TONGUES, SITES, SOCIAL_AFFILIATIONS, STUDY_YEARS, TRACKS
+
+    domains = rng.sample([d for d in DOMAINS if "רווחה" not in d], 3)
+    sites = rng.sample(SITES, 3)
+    return {
+        "first_name": f"סטודנט{n}", "last_name": "בדיקה", "nat_id": national_id(n),
+        "gender": rng.choice(GENDERS), "social_affil": rng.choice(SOCIAL_AFFILIATIONS),
+        "mother_tongue": rng.choice(MOTHER_TONGUES), "extra_langs": rng.sample(ADDITIONAL_LANGS, 2),
+        "phone": f"05{rng.randrange(10)}-{rng.randrange(10**7):07d}", "address": "רחוב הבדיקה 1, חיפה",
+        "email": f"student{n}@example.com", "study_year": rng.choice(STUDY_YEARS), "track": rng.choice(TRACKS),
+        "prev_training": "לא", "chosen_domains": domains, "top_domain": domains[0],
+        "rank_1": sites[0], "rank_2": sites[1], "rank_3": sites[2], "special_request": "אין",
+        "avg_grade": round(rng.uniform(60, 100), 1), "adjustments": ["אין"],
+        "m1": rng.choice(LIKERT), "m2": rng.choice(LIKERT), "m3": rng.choice(LIKERT),
+    }
+
+
+def master_row(a: dict) -> dict:
+    """The master row the wizard would save for answers `a`."""
+    from config import COLUMNS_ORDER, SITES
+
+    row = dict.fromkeys(COLUMNS_ORDER, "")
+    row.update({
+        "תאריך שליחה": "01/09/2025 10:00:00", "שם פרטי": a["first_name"], "שם משפחה": a["last_name"],
+        "תעודת זהות": a["nat_id"], "מין": a["gender"], "שיוך חברתי": a["social_affil"], "שפת אם": a["mother_tongue"],
+        "שפות נוספות": "; ".join(a["extra_langs"]), "טלפון": a["phone"], "כתובת": a["address"],
+        "אימייל": a["email"], "שנת לימודים": a["study_year"], "מסלול לימודים": a["track"],
+        "הכשרה קודמת": a["prev_training"], "תחומים מועדפים": "; ".join(a["chosen_domains"]),
+        "תחום מוביל": a["top_domain"], "בקשה מיוחדת": a["special_request"], "ממוצע": a["avg_grade"],
+        "התאמות": "; ".join(a["adjustments"]), "מוטיבציה 1": a["m1"], "מוטיבציה 2": a["m2"],
+        "מוטיבציה 3": a["m3"], "אישור הגעה להכשרה": "כן",
+    })
+    for i in range(1, 4):
+        row[f"מקום הכשרה {i}"] = a[f"rank_{i}"]
+    for s in SITES:
+        ranks = [i for i in range(1, 4) if a[f"rank_{i}"] == s]
+        row[f"דירוג_{s}"] = ranks[0] if ranks else ""
+    return row
+
+
+def seed_master(rows: int, rng: random.Random) -> None:
+    """Write `rows` synthetic submissions as the legacy master CSV (imported on first start)
+    and as the sheet, which is in sync with it."""
+    import pandas as pd
+
+    from config import COLUMNS_ORDER, CSV_FILE, DATA_DIR
+    from sheets_sync import sheet_values
+
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    records = [master_row(answers(100_000_000 + i, rng)) for i in range(rows)]
+    pd.DataFrame(records, columns=COLUMNS_ORDER).to_csv(CSV_FILE, index=False, encoding="utf-8-sig")
+    FakeWorksheet(SHEET_FILE).reset([COLUMNS_ORDER] + [sheet_values(r, COLUMNS_ORDER) for r in records])
+
+
+# =========================
+# סטודנט אחד
+# =========================
+def _next(at) -> None:
+    step = at.session_state["step"]
+    at.checkbox(key=f"ack_{step}").check().run()
+    next(b for b in at.button if b.label.startswith("הבא")).click().run()
+
+
+def fill_and_submit(a: dict, timeout: float = 120) -> tuple[float, str | None]:
+    """Drive a fresh session through the wizard; returns (submit seconds, error or None)."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(APP), default_timeout=timeout)
+    at.secrets["sheets"] = {"spreadsheet_id": "benchmark"}
+    at.secrets["gcp_service_account"] = {}
+    at.run()
+    # סעיף 1
+    for key in ("first_name", "last_name", "nat_id", "phone", "address", "email"):
+        at.text_input(key=key).input(a[key])
+    for key in ("social_affil", "mother_tongue", "study_year", "track"):
+        at.selectbox(key=key).set_value(a[key])
+    at.radio(key="gender").set_value(a["gender"])
+    at.multiselect(key="extra_langs").set_value(a["extra_langs"])
+    _next(at)
+    # סעיף 2 — הבחירות המדורגות כובלות זו את זו, לכן ריצה אחרי כל אחת
+    at.selectbox(key="prev_training").set_value(a["prev_training"])
+    at.multiselect(key="chosen_domains").set_value(a["chosen_domains"]).run()
+    at.selectbox(key="top_domain").set_value(a["top_domain"])
+    for i in range(1, 4):
+        at.selectbox(key=f"rank_{i}_select_widget").set_value(a[f"rank_{i}"]).run()
+    at.text_area(key="special_request").input(a["special_request"])
+    _next(at)
+    # סעיפים 3–5
+    at.number_input(key="avg_grade").set_value(a["avg_grade"])
+    _next(at)
+    at.multiselect(key="adjustments").set_value(a["adjustments"])
+    _next(at)
+    for key in ("m1", "m2", "m3"):
+        at.radio(key=key).set_value(a[key])
+    _next(at)
+    # סעיף 6
+    at.checkbox(key="arrival_confirm").check()
+    at.checkbox(key="confirm").check().run()
+    button = next(b for b in at.button if b.label.startswith("שליחה"))
+    t = time.perf_counter()
+    button.click().run()
+    elapsed = time.perf_counter() - t
+    if at.exception:
+        return elapsed, at.exception[0].value
+    if not at.success:
+        shown = [e.value for e in at.error] + [m.value for m in at.markdown if m.value.startswith("- :red[")]
+        return elapsed, "; ".join(shown) or "no confirmation shown"
+    return elapsed, None
+
+
+# =========================
+# תהליך עובד: חלק מהסטודנטים, ברצף
+# =========================
+def _worker(first: int, students: int, sheet_delay: float, drain_timeout: float) -> dict:
+    """Submit `students` students after a warm-up session; waits for the GO file between the two."""
+    ws = FakeWorksheet(SHEET_FILE, sheet_delay)
+    install_fake_sheets(ws)
+    from config import COLUMNS_ORDER, OUTBOX_FILE
+    from sheets_sync import SheetsOutbox
+
+    rng = random.Random(first)
+    # סשן חימום: ייבוא המודולים ופתיחת המשאבים המשותפים אינם נספרים בזמני השליחה
+    warm = fill_and_submit(answers(first + BLOCK - 1, rng))
+    Path(f"ready_{first}").touch()
+    while not Path(GO_FILE).exists():
+        time.sleep(0.05)
+    outcomes = [fill_and_submit(answers(first + i, rng)) for i in range(students)]
+
+    # המתנה לריקון התור — תהליך שיוצא לפני כן משאיר את שורותיו לעובדים האחרים
+    outbox = SheetsOutbox(OUTBOX_FILE, COLUMNS_ORDER)
+    deadline = time.time() + drain_timeout
+    while outbox.status()["depth"] and time.time() < deadline:
+        time.sleep(0.2)
+    return {"latencies": [t for t, _ in outcomes], "errors": [e for _, e in outcomes if e] + ([warm[1]] if warm[1] else []),
+            "sheet_calls": ws.calls}
+
+
+# =========================
+# גודל מאסטר אחד (תהליך מתאם בתיקייה ריקה)
+# =========================
+def _quantile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float("nan")
+
+
+def _spawn(args: list[str]) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, str(Path(__file__).resolve()), *args],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+
+def _result(proc: subprocess.Popen) -> dict:
+    out, err = proc.communicate()
+    if proc.returncode:
+        raise RuntimeError(err[-2000:])
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _child(size: int, students: int, concurrency: int, sheet_delay_ms: float, drain_timeout: float) -> dict:
+    rng = random.Random(size)
+    seed_master(size, rng)
+
+    from config import COLUMNS_ORDER, CSV_FILE
+    from exports import df_to_excel_bytes
+    from loaders import load_csv_safely
+    from pipeline import open_master_store, open_submission_log
+
+    store = open_master_store()
+    t = time.perf_counter()
+    master = load_csv_safely(CSV_FILE)
+    load_csv = time.perf_counter() - t
+    t = time.perf_counter()
+    df_to_excel_bytes(master)
+    excel = time.perf_counter() - t
+
+    shares = [students // concurrency + (k < students % concurrency) for k in range(concurrency)]
+    firsts = [200_000_000 + k * BLOCK for k in range(concurrency)]
+    procs = [_spawn(["--worker", str(first), "--students", str(n), "--sheet-delay-ms", str(sheet_delay_ms),
+                     "--drain-timeout", str(drain_timeout)]) for first, n in zip(firsts, shares)]
+    while not all(Path(f"ready_{first}").exists() or p.poll() is not None for first, p in zip(firsts, procs)):
+        time.sleep(0.05)
+    started = time.perf_counter()
+    Path(GO_FILE).touch()
+    parts = [_result(p) for p in procs]
+    wall = time.perf_counter() - started
+
+    ids = {national_id(first + i) for first, n in zip(firsts, shares) for i in range(n)}
+    in_master = set(store.to_dataframe()["תעודת זהות"].astype(str)) & ids
+    in_log = set(open_submission_log().read_all()["תעודת זהות"].astype(str)) & ids
+    id_col = COLUMNS_ORDER.index("תעודת זהות")
+    sheet_ids = [str(r[id_col]) for r in FakeWorksheet(SHEET_FILE).rows[1:] if len(r) > id_col and str(r[id_col]) in ids]
+    latencies = [t for part in parts for t in part["latencies"]]
+    errors = [e for part in parts for e in part["errors"]]
+    return {
+        "size": size, "students": students, "concurrency": concurrency,
+        "submit_p50_ms": round(1e3 * _quantile(latencies, 0.50), 1),
+        "submit_p95_ms": round(1e3 * _quantile(latencies, 0.95), 1),
+        "submit_p99_ms": round(1e3 * _quantile(latencies, 0.99), 1),
+        "submit_mean_ms": round(1e3 * statistics.fmean(latencies), 1) if latencies else None,
+        "throughput_per_s": round(students / wall, 2),
+        "lost_master": len(ids - in_master), "lost_log": len(ids - in_log), "lost_sheet": len(ids - set(sheet_ids)),
+        "duplicated_sheet": len(sheet_ids) - len(set(sheet_ids)),
+        "errors": errors[:5], "error_count": len(errors),
+        "load_csv_ms": round(1e3 * load_csv, 1), "excel_ms": round(1e3 * excel, 1),
+        "sheet_calls": sum(part["sheet_calls"] for part in parts),
+    }
+
+
+def measure(size: int, args) -> dict:
+    """Run one master size in a fresh interpreter inside an empty working directory."""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(APP.parent), os.environ.get("PYTHONPATH", "")])}
+        cmd = [sys.executable, str(Path(__file__).resolve()), "--child", str(size),
+               "--students", str(args.students), "--concurrency", str(args.concurrency),
+               "--sheet-delay-ms", str(args.sheet_delay_ms), "--drain-timeout", str(args.drain_timeout)]
+        out = subprocess.run(cmd, cwd=tmp, env=env, capture_output=True, text=True)
+    if out.returncode:
+        raise RuntimeError(f"size {size} failed:\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+# =========================
+# דו"ח
+# =========================
+def report(results: list[dict]) -> str:
+    lines = [f"{'rows':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'subm/s':>7} {'lost m/l/s':>11} "
+             f"{'load_csv':>9} {'excel':>8}  errors"]
+    for r in results:
+        lines.append(f"{r['size']:>7} {r['submit_p50_ms']:>8.1f} {r['submit_p95_ms']:>8.1f} {r['submit_p99_ms']:>8.1f} "
+                     f"{r['throughput_per_s']:>7.2f} {r['lost_master']:>3}/{r['lost_log']}/{r['lost_sheet']:<5} "
+                     f"{r['load_csv_ms']:>9.1f} {r['excel_ms']:>8.1f}  {r['error_count']}")
+    return "\n".join(lines)
+
+
+def regressions(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    """Timings more than `tolerance` slower than the same master size in `baseline`."""
+    before = {r["size"]: r for r in baseline.get("results", [])}
+    found = []
+    for r in results:
+        old = before.get(r["size"])
+        if old is None:
+            continue
+        for key in TIMINGS:
+            if old.get(key) and r[key] > old[key] * (1 + tolerance):
+                found.append(f"{r['size']} rows: {key} {old[key]:.1f} -> {r[key]:.1f} ms")
+    return found
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="master rows before the test")
+    ap.add_argument("--students", type=int, default=40, help="submissions per master size")
+    ap.add_argument("--concurrency", type=int, default=8, help="students filling the form at once")
+    ap.add_argument("--sheet-delay-ms", type=float, default=50, help="latency of every fake Sheets call")
+    ap.add_argument("--drain-timeout", type=float, default=60, help="seconds to wait for the Sheets outbox")
+    ap.add_argument("--out", type=Path, default=Path("bench_output.txt"))
+    ap.add_argument("--json", type=Path, default=None)
+    ap.add_argument("--baseline", type=Path, default=None, help="earlier --json to compare timings with")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.worker is not None:
+        print(json.dumps(_worker(args.worker, args.students, args.sheet_delay_ms / 1e3, args.drain_timeout),
+                         ensure_ascii=False))
+        return 0
+    if args.child is not None:
+        print(json.dumps(_child(args.child, args.students, args.concurrency,
+                                args.sheet_delay_ms, args.drain_timeout), ensure_ascii=False))
+        return 0
+
+    results = []
+    for size in args.sizes:
+        results.append(measure(size, args))
+        print(report(results[-1:]).splitlines()[-1], flush=True)
+    failures = [f"{r['size']} rows: {r['lost_master'] + r['lost_log'] + r['lost_sheet']} rows lost" for r in results
+                if r["lost_master"] or r["lost_log"] or r["lost_sheet"]]
+    failures += [f"{r['size']} rows: {r['duplicated_sheet']} rows appended to the sheet twice" for r in results
+                 if r["duplicated_sheet"]]
+    failures += [f"{r['size']} rows: {r['error_count']} failed submits, e.g. {r['errors'][0]}" for r in results
+                 if r["error_count"]]
+    if args.baseline:
+        failures += regressions(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+
+    text = report(results) + "".join(f"\nFAIL {f}" for f in failures) + "\n"
+    args.out.write_text(text, encoding="utf-8")
+    if args.json:
+        args.json.write_text(json.dumps({"results": results, "failures": failures}, indent=1, ensure_ascii=False),
+                             encoding="utf-8")
+    print(text, end="")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# bench_startup.py
+# -*- coding: utf-8 -*-
+"""Cold-start benchmark for the Streamlit app (catches import-time regressions).
+
+Each page is run in a fresh interpreter (so nothing is imported or cached yet)
+with Streamlit's AppTest, in an empty temporary data directory, and reports:
+    cold_ms   first script run, including every import it triggers
+    warm_ms   median of the following full reruns
+    loaded    which of the heavy stacks (HEAVY) ended up imported
+
+The student page must stay under the budget and must not import any of the
+stacks reserved for submit / admin mode; otherwise the exit status is 1.
+
+Usage:
+    python bench_startup.py [--budget-ms 1500] [--runs 5] [--json out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+APP = Path(__file__).resolve().with_name("streamlit_app.py")
+HEAVY = ("pandas", "pyarrow", "gspread", "google.oauth2", "xlsxwriter")
+# מחסניות שאסור לטעון בעמוד הסטודנט (נטענות רק בשליחה או במצב מנהל)
+STUDENT_FORBIDDEN = HEAVY
+PAGES = ("student", "admin")
+
+
+def _child(page: str, runs: int) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(APP), default_timeout=120)
+    at.secrets["sheets"] = {"spreadsheet_id": "benchmark"}
+    at.secrets["gcp_service_account"] = {}
+    if page == "admin":
+        at.query_params["admin"] = "1"
+    before = set(sys.modules)
+    t = time.perf_counter()
+    at.run()
+    cold = time.perf_counter() - t
+    warm = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        at.run()
+        warm.append(time.perf_counter() - t)
+    loaded = [m for m in HEAVY if m in sys.modules and m not in before]
+    return {"page": page, "cold_ms": round(cold * 1e3, 1), "warm_ms": round(statistics.median(warm) * 1e3, 1),
+            "loaded": loaded, "errors": [e.value for e in at.exception]}
+
+
+def measure(page: str, runs: int) -> dict:
+    """Run one page in a fresh interpreter inside an empty working directory."""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(APP.parent), os.environ.get("PYTHONPATH", "")])}
+        out = subprocess.run([sys.executable, str(Path(__file__).resolve()), "--child", page, "--runs", str(runs)],
+                             cwd=tmp, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--budget-ms", type=float, default=1500, help="max cold first run of the student page")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--json", type=Path, default=None)
+    ap.add_argument("--child", choices=PAGES, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(_child(args.child, args.runs)))
+        return 0
+
+    results = [measure(page, args.runs) for page in PAGES]
+    failures = []
+    for r in results:
+        print(f"{r['page']:8} cold {r['cold_ms']:8.1f} ms   warm {r['warm_ms']:7.1f} ms   "
+              f"loaded: {', '.join(r['loaded']) or '-'}")
+        failures += [f"{r['page']}: {e}" for e in r["errors"]]
+    student = results[0]
+    if student["cold_ms"] > args.budget_ms:
+        failures.append(f"student cold start {student['cold_ms']:.0f} ms > budget {args.budget_ms:.0f} ms")
+    bad = [m for m in student["loaded"] if m in STUDENT_FORBIDDEN]
+    if bad:
+        failures.append(f"student page imported {', '.join(bad)}")
+    if args.json:
+        args.json.write_text(json.dumps({"results": results, "failures": failures}, indent=1), encoding="utf-8")
+    for f in failures:
+        print(f"FAIL {f}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
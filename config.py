@@ -0,0 +1,87 @@
+# config.py
+# -*- coding: utf-8 -*-
+"""Shared paths, column definitions and master settings (no Streamlit imports)."""
+import os
+import tomllib
+from pathlib import Path
+
+# =========================
+# נתיבים
+# =========================
+DATA_DIR   = Path("data")
+BACKUP_DIR = DATA_DIR / "backups"
+EXPORT_DIR = DATA_DIR / "exports"
+
+CSV_FILE      = DATA_DIR / "שאלון_שיבוץ.csv"
+CSV_LOG_FILE  = DATA_DIR / "שאלון_שיבוץ_log.csv"
+DB_FILE       = DATA_DIR / "שאלון_שיבוץ.sqlite3"
+WRITE_LOCK_FILE = DATA_DIR / ".write.lock"
+OUTBOX_FILE   = DATA_DIR / "sheets_outbox.sqlite3"
+SHEETS_LOCK_FILE = DATA_DIR / ".sheets.lock"
+STATS_FILE    = DATA_DIR / "stats.json"
+SNAPSHOT_DIR  = DATA_DIR / "master_parquet"
+# קובץ הסודות של האפליקציה — גם התהליכים שרצים מחוץ ל־ Streamlit קוראים ממנו
+SECRETS_FILE  = Path(os.environ.get("SECRETS_FILE", ".streamlit/secrets.toml"))
+LOG_DIR       = DATA_DIR / "log"           # יומן במקטעים מתחלפים + אינדקס
+LOG_SEGMENT_BYTES = 8 * 1024 * 1024
+
+# =========================
+# עמודות קבועות
+# =========================
+SITES = [
+    "כפר הילדים חורפיש",
+    "אנוש כרמיאל",
+    "הפוך על הפוך צפת",
+    "שירות מבחן לנוער עכו",
+    "כלא חרמון",
+    "בית חולים זיו",
+    "שירותי רווחה קריית שמונה",
+    "מרכז יום לגיל השלישי",
+    "מועדונית נוער בצפת",
+    "מרפאת בריאות הנפש צפת",
+]
+RANK_COUNT = 3
+
+# אפשרויות קבועות בטופס (משמשות גם לטיפוסים הקטגוריאליים ב־ schema.py)
+GENDERS = ["זכר", "נקבה"]
+SOCIAL_AFFILIATIONS = ["יהודי/ה", "מוסלמי/ת", "נוצרי/ה", "דרוזי/ת"]
+MOTHER_TONGUES = ["עברית", "ערבית", "רוסית"]
+STUDY_YEARS = [
+    "תואר ראשון - שנה א", "תואר ראשון - שנה ב", "תואר ראשון - שנה ג'",
+    "תואר שני - שנה א'", "תואר שני - שנה ב",
+]
+TRACKS = ["תואר ראשון – תוכנית רגילה", "תואר ראשון – הסבה", "תואר שני"]
+PREV_TRAINING = ["כן", "לא", "אחר..."]
+DOMAINS = ["רווחה", "מוגבלות", "זקנה", "ילדים ונוער", "בריאות הנפש",
+           "שיקום", "משפחה", "נשים", "בריאות", "קהילה"]
+LIKERT = ["בכלל לא מסכים/ה", "1", "2", "3", "4", "מסכים/ה מאוד"]   # סדר = קוד אורדינלי 0..5
+
+COLUMNS_ORDER = [
+    "תאריך שליחה", "שם פרטי", "שם משפחה", "תעודת זהות", "מין", "שיוך חברתי",
+    "שפת אם", "שפות נוספות", "טלפון", "כתובת", "אימייל",
+    "שנת לימודים", "מסלול לימודים",
+    "הכשרה קודמת", "הכשרה קודמת מקום ותחום",
+    "הכשרה קודמת מדריך ומיקום", "הכשרה קודמת בן זוג",
+    "תחומים מועדפים", "תחום מוביל", "בקשה מיוחדת",
+    "ממוצע", "התאמות", "התאמות פרטים",
+    "מוטיבציה 1", "מוטיבציה 2", "מוטיבציה 3",
+] + [f"מקום הכשרה {i}" for i in range(1, RANK_COUNT+1)] + [f"דירוג_{s}" for s in SITES] + [
+    "אישור הגעה להכשרה"
+]
+
+# מדיניות כפילויות לפי תעודת זהות: keep_latest / keep_first / keep_all
+DEDUPE_POLICY = "keep_latest"
+
+
+def load_secrets(path: Path = SECRETS_FILE) -> dict:
+    """The app's secrets file as a dict (empty if there is none)."""
+    path = Path(path)
+    return tomllib.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+
+def master_settings(secrets: dict | None = None) -> dict:
+    """Settings every process that writes the master must share (the app, the ingestion service,
+    reconcile.py): DEDUPE_POLICY and the [backups] retention, from the secrets file."""
+    secrets = load_secrets() if secrets is None else secrets
+    return {"DEDUPE_POLICY": secrets.get("DEDUPE_POLICY", DEDUPE_POLICY),
+            "backups": dict(secrets.get("backups", {}))}
@@ -0,0 +1,254 @@
+# exports.py
+# -*- coding: utf-8 -*-
+"""Exports: constant-memory Excel, gzip CSV, Parquet and per-site workbooks, with an on-disk cache.
+
+The streaming formats are generators of bytes (iter_csv_gz, iter_parquet,
+iter_site_workbooks): each chunk of rows is encoded and handed on before the
+next one is read, so a download or a cached file is written without the whole
+artifact in memory. FORMATS maps a download name to (mime type, generator).
+"""
+import hashlib
+import os
+import re
+import threading
+import zipfile
+import zlib
+from io import BytesIO
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from config import RANK_COUNT, SITES
+
+WIDTH_MIN, WIDTH_MAX, WIDTH_PAD = 12, 60, 4
+WIDTH_SAMPLE = 2000
+CHUNK_ROWS = 5000
+PARQUET_ROW_GROUP = 50_000
+RANK_PLACE_COLS = [f"מקום הכשרה {i}" for i in range(1, RANK_COUNT + 1)]
+SITE_RANK_COL = "דירוג לאתר"
+
+
+def column_widths(df: pd.DataFrame, sample: int = WIDTH_SAMPLE) -> list[int]:
+    """Column widths from the header and a sample of rows (head, tail and a random spread).
+
+    Categorical columns are measured exactly, from the categories in use.
+    """
+    full = df
+    if len(df) > sample:
+        third = sample // 3
+        idx = pd.Index(range(third)).append(pd.Index(range(len(df) - third, len(df))))
+        rest = pd.Series(range(third, len(df) - third)).sample(sample - 2 * third, random_state=0)
+        df = df.iloc[idx.append(pd.Index(rest))]
+    widths = []
+    for col in df.columns:
+        longest = len(str(col))
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            # קטגוריות: מספיק למדוד את הקטגוריות שבשימוש
+            codes = full[col].cat.codes.to_numpy()
+            used = s.cat.categories[np.bincount(codes[codes >= 0], minlength=len(s.cat.categories)) > 0]
+            if len(used):
+                longest = max(longest, int(pd.Series(used).astype(str).str.len().max()))
+        elif not df.empty:
+            lens = s.dropna().astype(str).str.len()
+            if not lens.empty:
+                longest = max(longest, int(lens.max()))
+        widths.append(min(WIDTH_MAX, max(WIDTH_MIN, longest + WIDTH_PAD)))
+    return widths
+
+
+def write_excel(df: pd.DataFrame, target, sheet: str = "Sheet1") -> None:
+    """Write `df` row by row with XlsxWriter's constant_memory mode (target: path or binary file)."""
+    write_excel_book({sheet: df}, target)
+
+
+def write_excel_book(sheets: dict[str, pd.DataFrame], target) -> None:
+    """Several DataFrames, one worksheet each, in constant_memory mode."""
+    wb = xlsxwriter.Workbook(target, {"constant_memory": True, "nan_inf_to_errors": True,
+                                      "strings_to_numbers": False, "strings_to_formulas": False})
+    bold = wb.add_format({"bold": True})
+    for sheet, df in sheets.items():
+        ws = wb.add_worksheet(sheet)
+        for i, width in enumerate(column_widths(df)):
+            ws.set_column(i, i, width)
+        ws.write_row(0, 0, [str(c) for c in df.columns], bold)
+        r = 1
+        for start in range(0, len(df), CHUNK_ROWS):
+            chunk = df.iloc[start:start + CHUNK_ROWS]
+            # NaN/NA -> תא ריק
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            for values in chunk.itertuples(index=False, name=None):
+                ws.write_row(r, 0, values)
+                r += 1
+    wb.close()
+
+
+def df_to_excel_bytes(df: pd.DataFrame, sheet: str = "Sheet1") -> bytes:
+    bio = BytesIO()
+    write_excel(df, bio, sheet)
+    return bio.getvalue()
+
+
+class ExportCache:
+    """Generated files kept on disk, keyed by name and a fingerprint of the source data.
+
+    A repeated download of unchanged data is served from the cached file; older
+    versions of the same export are removed when a new one is built.
+    """
+
+    def __init__(self, directory: Path):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._mutex = threading.Lock()
+
+    @staticmethod
+    def fingerprint(*paths: Path) -> str:
+        h = hashlib.sha1()
+        for p in paths:
+            p = Path(p)
+            st = p.stat() if p.exists() else None
+            h.update(f"{p}|{st.st_size if st else -1}|{st.st_mtime_ns if st else -1};".encode())
+        return h.hexdigest()[:16]
+
+    def get(self, name: str, suffix: str, key: str, build) -> Path:
+        """Path of the cached export, calling `build(path)` to create it on a miss."""
+        path = self.dir / f"{name}.{key}{suffix}"
+        with self._mutex:
+            if not path.exists():
+                tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+                build(tmp)
+                tmp.replace(path)
+                for old in self.dir.glob(f"{name}.*{suffix}"):
+                    if old != path:
+                        old.unlink(missing_ok=True)
+        return path
+
+
+# =========================
+# ייצוא זורם
+# =========================
+class _Sink:
+    """Write-only file object that keeps what was written until `take()`."""
+    closed = False
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self._pos = 0
+
+    def write(self, b) -> int:
+        self._parts.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+def iter_csv_gz(df: pd.DataFrame, chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """`df` as gzip-compressed UTF-8 CSV (with BOM, like the other CSV files), CHUNK_ROWS at a time."""
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)      # wbits 31 — מעטפת gzip
+    yield z.compress("\ufeff".encode("utf-8"))
+    for start in range(0, max(len(df), 1), chunk_rows):
+        out = z.compress(df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0).encode("utf-8"))
+        if out:
+            yield out
+    yield z.flush()
+
+
+def iter_parquet(df: pd.DataFrame, row_group: int = PARQUET_ROW_GROUP) -> Iterator[bytes]:
+    """`df` as Parquet, one row group per `row_group` rows (categoricals stay dictionary-encoded)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema, compression="zstd" if pa.Codec.is_available("zstd") else "snappy") as w:
+        for start in range(0, len(df), row_group):
+            w.write_table(pa.Table.from_pandas(df.iloc[start:start + row_group], schema=schema, preserve_index=False))
+            yield sink.take()
+    yield sink.take()
+
+
+def site_groups(df: pd.DataFrame, sites: list[str] = SITES) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """For every site: (row positions of the students who ranked it, the rank they gave it).
+
+    One pass over the rank columns (מקום הכשרה i and דירוג_{site}) builds all
+    (site, row, rank) pairs; a single sort groups them by site, then by rank and
+    row. A row that names the same site twice keeps its best rank.
+    """
+    index = pd.Index(sites)
+    parts = []                                     # (site code, row, rank)
+    for r, col in enumerate(RANK_PLACE_COLS, start=1):
+        if col in df:
+            c = index.get_indexer(df[col].astype(object))
+            hit = np.flatnonzero(c >= 0)
+            parts.append((c[hit], hit, np.full(len(hit), r, dtype=float)))
+    for i, site in enumerate(sites):
+        col = f"דירוג_{site}"
+        if col in df:
+            rk = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+            hit = np.flatnonzero(~np.isnan(rk))
+            parts.append((np.full(len(hit), i), hit, rk[hit]))
+    if not parts:
+        return {s: (np.empty(0, dtype=np.intp), np.empty(0)) for s in sites}
+    code, pos, rank = (np.concatenate(a) for a in zip(*parts))
+    # אתר + שורה פעם אחת, עם הדירוג הטוב ביותר
+    order = np.lexsort((rank, pos, code))
+    code, pos, rank = code[order], pos[order], rank[order]
+    first = np.ones(len(code), dtype=bool)
+    first[1:] = (code[1:] != code[:-1]) | (pos[1:] != pos[:-1])
+    code, pos, rank = code[first], pos[first], rank[first]
+    order = np.lexsort((pos, rank, code))
+    code, pos, rank = code[order], pos[order], rank[order]
+    bounds = np.searchsorted(code, np.arange(len(sites) + 1))
+    return {s: (pos[bounds[i]:bounds[i + 1]], rank[bounds[i]:bounds[i + 1]]) for i, s in enumerate(sites)}
+
+
+def _safe_name(site: str, limit: int) -> str:
+    return re.sub(r'[\\/:*?"<>|\[\]]', "_", site).strip()[:limit]
+
+
+def iter_site_workbooks(df: pd.DataFrame, sites: list[str] = SITES) -> Iterator[bytes]:
+    """A zip with one workbook per site, listing its applicants by the rank they gave it.
+
+    Only one site's workbook is in memory at a time; each is compressed into
+    the zip and handed on before the next is written.
+    """
+    groups = site_groups(df, sites)
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i, site in enumerate(sites, start=1):
+            rows, ranks = groups[site]
+            part = df.iloc[rows]
+            part.insert(0, SITE_RANK_COL, ranks.astype(int))
+            bio = BytesIO()
+            write_excel(part, bio, _safe_name(site, 31))
+            zf.writestr(f"{i:02d}_{_safe_name(site, 80)}.xlsx", bio.getvalue())
+            del bio, part
+            yield sink.take()
+    yield sink.take()
+
+
+FORMATS = {
+    "csv.gz": ("application/gzip", iter_csv_gz),
+    "parquet": ("application/vnd.apache.parquet", iter_parquet),
+    "sites.zip": ("application/zip", iter_site_workbooks),
+}
+
+
+def write_chunks(chunks: Iterable[bytes], target: Path) -> None:
+    """Write a byte stream to `target` chunk by chunk."""
+    with open(target, "wb") as f:
+        for b in chunks:
+            f.write(b)
@@ -0,0 +1,239 @@
+# ingest_api.py
+# -*- coding: utf-8 -*-
+"""Bulk ingestion service: CSV / JSON Lines uploads of rows in COLUMNS_ORDER shape.
+
+Rows are read from the request stream in batches of BATCH_ROWS, checked with
+the form's validation schema, and every batch of valid rows is committed in
+one transaction through the same pipeline as the wizard (master, backups,
+log, running stats, Sheets outbox). The response streams one JSON line per
+row ({"row", "id", "status", "errors"}) and a final {"summary": ...} line. If
+the upload stops early (a broken file, a failed commit), the batches before
+the failing row stay committed and the summary line also has "error".
+
+Usage:
+    INGEST_TOKEN=... flask --app ingest_api run --port 8502
+    curl -H "Authorization: Bearer $INGEST_TOKEN" -H "Content-Type: text/csv" \\
+         --data-binary @students.csv http://localhost:8502/ingest
+
+GET /export/master.<fmt> streams the master (fmt: csv.gz, parquet or sites.zip —
+one workbook per site) chunk by chunk from the Parquet snapshot; it needs the
+same token as /ingest.
+
+GET /metrics serves the process's timing histograms and counters in the
+Prometheus text format (see metrics.py).
+
+DEDUPE_POLICY and the backup retention come from the app's secrets file
+(SECRETS_FILE, default .streamlit/secrets.toml), so both processes write the
+master the same way. If that file has the Google credentials, the service
+runs its own Sheets sync worker (processes take turns via SHEETS_LOCK_FILE);
+otherwise ingested rows wait in the outbox until the app's worker sends them.
+Other settings come from the environment (or a .env file): INGEST_TOKEN,
+INGEST_BATCH_ROWS, METRICS_ENABLED, SECRETS_FILE.
+"""
+import csv
+import hmac
+import io
+import itertools
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+from dotenv import load_dotenv
+from flask import Flask, Response, abort, jsonify, request, stream_with_context
+
+from config import (
+    COLUMNS_ORDER, DATA_DIR, OUTBOX_FILE, SHEETS_LOCK_FILE, WRITE_LOCK_FILE, load_secrets, master_settings,
+)
+from exports import FORMATS
+from pipeline import (
+    commit_local_batch, complete_row, content_token, open_backup_manager, open_master_store, open_snapshot,
+    open_stats_file, open_submission_log,
+)
+from sheets_sync import SheetsConnection, SheetsOutbox, SheetStyler, SheetsSyncWorker, migrate_header
+from metrics import CONTENT_TYPE, REGISTRY, span
+from validation import SCHEMA, validate_frame
+from writer import FileLock
+
+load_dotenv()
+
+ID_COL = "תעודת זהות"
+# עמודות שכללי הטופס בודקים — חייבות להופיע בכותרת קובץ CSV (דירוג_* ותאריך מחושבים)
+REQUIRED_HEADER = [c for c in COLUMNS_ORDER if any(c in rule.fields for rule in SCHEMA)]
+
+app = Flask(__name__)
+
+_components: dict = {}
+_components_mutex = threading.Lock()
+
+
+def components() -> dict:
+    """Settings, store, backups, log, stats, snapshot, outbox and Sheets worker, opened once per process."""
+    with _components_mutex:
+        if not _components:
+            DATA_DIR.mkdir(parents=True, exist_ok=True)
+            secrets = load_secrets()
+            settings = master_settings(secrets)
+            store = open_master_store()
+            outbox = SheetsOutbox(OUTBOX_FILE, COLUMNS_ORDER)
+            _components.update(
+                policy=settings["DEDUPE_POLICY"], store=store, backups=open_backup_manager(store, settings["backups"]),
+                stats=open_stats_file(store), snapshot=open_snapshot(store), log=open_submission_log(),
+                outbox=outbox, sheets_worker=_sheets_worker(outbox, secrets),
+            )
+        return _components
+
+
+def _sheets_worker(outbox: SheetsOutbox, secrets: dict) -> SheetsSyncWorker | None:
+    """A Sheets sync worker like the app's, if the secrets file has the Google credentials."""
+    if "gcp_service_account" not in secrets or "sheets" not in secrets:
+        return None
+    from reconcile import open_worksheet
+
+    styler = SheetStyler(COLUMNS_ORDER, ID_COL)
+
+    def ensure_header(ws) -> None:
+        if migrate_header(ws, COLUMNS_ORDER):
+            styler.invalidate(ws)
+            styler.apply(ws)
+    return SheetsSyncWorker(outbox, SheetsConnection(lambda: open_worksheet(secrets), ensure_header),
+                            SHEETS_LOCK_FILE, styler=styler)
+
+
+def _authorized() -> bool:
+    token = os.environ.get("INGEST_TOKEN", "")
+    given = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    return bool(token) and hmac.compare_digest(token, given)
+
+
+# =========================
+# פענוח זורם
+# =========================
+def _text_stream():
+    return io.TextIOWrapper(request.stream, encoding="utf-8-sig", newline="")
+
+
+def _csv_rows():
+    reader = csv.DictReader(_text_stream())
+    header = [str(c).strip() for c in (reader.fieldnames or [])]
+    reader.fieldnames = header
+    return header, reader
+
+
+def _jsonl_rows():
+    """Dicts; a line that is not a JSON object yields its error message instead (rejected row)."""
+    for line in _text_stream():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield f"invalid JSON: {e}"
+            continue
+        yield row if isinstance(row, dict) else "each line must be a JSON object"
+
+
+def _batches(rows, size: int):
+    it = iter(rows)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+
+# =========================
+# נקודות קצה
+# =========================
+@app.get("/health")
+def health():
+    c = components()
+    return jsonify(rows=c["store"].count(), sheets=c["outbox"].status())
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(REGISTRY.prometheus(), content_type=CONTENT_TYPE)
+
+
+@app.get("/export/master.<path:fmt>")
+def export(fmt: str):
+    if not _authorized():
+        abort(401)
+    if fmt not in FORMATS:
+        abort(404)
+    mime, chunks = FORMATS[fmt]
+    df = components()["snapshot"].read()
+    return Response(chunks(df), mimetype=mime,
+                    headers={"Content-Disposition": f"attachment; filename=master.{fmt}"})
+
+
+@app.post("/ingest")
+def ingest():
+    if not _authorized():
+        abort(401)
+    batch_rows = int(os.environ.get("INGEST_BATCH_ROWS", 1000))
+    kind = request.mimetype
+    if kind in ("text/csv", "application/csv"):
+        header, rows = _csv_rows()
+        missing = [c for c in REQUIRED_HEADER if c not in header]
+        if missing:
+            return jsonify(error="missing columns", columns=missing), 400
+    elif kind in ("application/x-ndjson", "application/jsonl", "application/json-lines"):
+        rows = _jsonl_rows()
+    else:
+        return jsonify(error=f"unsupported content type: {kind}"), 415
+    c = components()
+    policy = c["policy"]
+    # אסימון לפי תוכן — העלאה חוזרת של אותו קובץ אינה יוצרת שורות נוספות
+    namespace = request.headers.get("Idempotency-Key", "ingest:")
+
+    @stream_with_context
+    def run():
+        counts = {"rows": 0, "rejected": 0}
+        started = time.perf_counter()
+        n, error = 0, None
+        try:
+            for chunk in _batches(rows, batch_rows):
+                prepared = [complete_row(r) if isinstance(r, dict) else {} for r in chunk]
+                with span("ingest", phase="validate"):
+                    report = validate_frame(pd.DataFrame(prepared, columns=COLUMNS_ORDER))
+                errors = report.groupby("שורה")["שגיאה"].agg(list).to_dict() if not report.empty else {}
+                errors.update({i: [r] for i, r in enumerate(chunk) if isinstance(r, str)})
+                ok = [i for i in range(len(prepared)) if i not in errors]
+                items = [(prepared[i], content_token(prepared[i], namespace)) for i in ok]
+                results = {}
+                if items:
+                    with span("ingest", phase="commit"), FileLock(WRITE_LOCK_FILE):
+                        committed = commit_local_batch(items, c["store"], c["backups"], c["outbox"],
+                                                       c["stats"], c["log"], policy, c["snapshot"])
+                    results = dict(zip(ok, committed))
+                    if c["sheets_worker"] is not None:
+                        c["sheets_worker"].notify()
+                lines = []
+                for i, row in enumerate(prepared):
+                    out = {"row": n + i + 1, "id": row.get(ID_COL)}
+                    if i in errors:
+                        out.update(status="rejected", errors=errors[i])
+                        counts["rejected"] += 1
+                    else:
+                        out["status"] = results[i].status
+                        counts[results[i].status] = counts.get(results[i].status, 0) + 1
+                    lines.append(json.dumps(out, ensure_ascii=False, default=str))
+                n += len(prepared)
+                counts["rows"] = n
+                yield "\n".join(lines) + "\n"
+        except Exception as e:
+            # קובץ פגום, כשל בבדיקה או בשמירה, נעילה שלא התפנתה — האצוות שקדמו לשורה זו כבר נשמרו,
+            # והשורה המסכמת מסמנת שהייבוא לא הושלם
+            app.logger.exception("ingest stopped at row %d", n + 1)
+            error = f"{type(e).__name__}: {e}"
+            yield json.dumps({"row": n + 1, "status": "error", "errors": [error]}, ensure_ascii=False) + "\n"
+        counts["seconds"] = round(time.perf_counter() - started, 3)
+        summary = {"summary": counts, **({"error": error} if error else {})}
+        yield json.dumps(summary, ensure_ascii=False) + "\n"
+
+    return Response(run(), mimetype="application/x-ndjson")
+
+
+if __name__ == "__main__":
+    app.run(port=int(os.environ.get("INGEST_PORT", 8502)))
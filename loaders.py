@@ -0,0 +1,163 @@
+# loaders.py
+# -*- coding: utf-8 -*-
+"""CSV loading: encoding fallbacks, one-pass sniffing and an mtime-keyed cache with tail reads."""
+import codecs
+import contextlib
+import csv
+import gzip
+import threading
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+
+import pandas as pd
+
+from schema import concat_typed, to_typed
+
+SNIFF_BYTES = 64 * 1024
+
+
+def _clean_columns(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = [str(c).replace("\ufeff", "").strip() for c in df.columns]
+    return df
+
+
+def load_csv_safely(path: Path, **read_kw) -> pd.DataFrame:
+    if not path.exists():
+        return pd.DataFrame()
+    attempts = [
+        dict(encoding="utf-8-sig"),
+        dict(encoding="utf-8"),
+        dict(encoding="utf-8-sig", engine="python", on_bad_lines="skip"),
+        dict(encoding="utf-8", engine="python", on_bad_lines="skip"),
+        dict(encoding="latin-1", engine="python", on_bad_lines="skip"),
+    ]
+    for kw in attempts:
+        try:
+            df = pd.read_csv(path, **kw, **read_kw)
+            return _clean_columns(df)
+        except Exception:
+            continue
+    return pd.DataFrame()
+
+
+@dataclass(frozen=True)
+class CsvDialect:
+    encoding: str
+    sep: str
+
+
+def sniff_csv(head: bytes) -> CsvDialect:
+    """Pick encoding and delimiter from the first bytes of the file (no full parse)."""
+    if head.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    else:
+        try:
+            # final=False — תו רב-בתי שנחתך בסוף הדגימה אינו שגיאה
+            codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = "latin-1"
+    text = head.decode(encoding, errors="ignore")
+    try:
+        sep = csv.Sniffer().sniff(text.split("\n", 1)[0], delimiters=",;\t|").delimiter
+    except csv.Error:
+        sep = ","
+    return CsvDialect(encoding, sep)
+
+
+def _read_bytes(path: Path) -> bytes:
+    data = path.read_bytes()
+    return gzip.decompress(data) if path.suffix == ".gz" else data
+
+
+@dataclass
+class _Entry:
+    size: int
+    mtime_ns: int
+    offset: int            # סוף הרשומה השלמה האחרונה שנקראה
+    dialect: CsvDialect
+    columns: list
+    df: pd.DataFrame
+
+
+class CachedCsvLoader:
+    """Parsed DataFrames cached by (path, size, mtime).
+
+    For append-only files only the bytes added since the previous load are
+    parsed and concatenated; *.gz files are decompressed first. With `typed=True` the frame is converted with
+    schema.to_typed (the tail only, for append-only files). The returned
+    DataFrame is shared between callers and must not be modified in place.
+    """
+
+    def __init__(self):
+        self._cache: dict[tuple[Path, bool], _Entry] = {}
+        self._mutex = threading.Lock()
+
+    def clear(self) -> None:
+        with self._mutex:
+            self._cache.clear()
+
+    def load(self, path: Path, append_only: bool = False, lock=None, typed: bool = False) -> pd.DataFrame:
+        """Load `path`; `lock` (a context manager) is held while the file's bytes are read."""
+        path = Path(path)
+        key = (path, typed)
+        with self._mutex:
+            with (lock or contextlib.nullcontext()):
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    self._cache.pop(key, None)
+                    return pd.DataFrame()
+                entry = self._cache.get(key)
+                if entry and entry.size == st.st_size and entry.mtime_ns == st.st_mtime_ns:
+                    return entry.df
+                if entry and append_only and st.st_size > entry.size:
+                    with open(path, "rb") as f:
+                        f.seek(entry.offset)
+                        tail = f.read()
+                else:
+                    tail = None
+                    data = _read_bytes(path)
+
+            if tail is not None:
+                # רק רשומות שלמות; שארית שנכתבת כרגע תיקרא בפעם הבאה
+                cut = tail.rfind(b"\n") + 1
+                new = self._parse(tail[:cut], entry.dialect, entry.columns) if cut else None
+                if new is not None:
+                    if typed and len(new):
+                        df = concat_typed(entry.df, to_typed(new))
+                    else:
+                        df = pd.concat([entry.df, new], ignore_index=True) if len(new) else entry.df
+                    entry.size, entry.mtime_ns = st.st_size, st.st_mtime_ns
+                    entry.offset += cut
+                    entry.df = df
+                    return df
+                data = _read_bytes(path)
+
+            dialect = sniff_csv(data[:SNIFF_BYTES])
+            cut = data.rfind(b"\n") + 1 if append_only else len(data)
+            df = self._parse(data[:cut], dialect, None)
+            if df is None:
+                df = load_csv_safely(path)
+            if typed:
+                df = to_typed(df)
+            self._cache[key] = _Entry(st.st_size, st.st_mtime_ns, cut, dialect, list(df.columns), df)
+            return df
+
+    @staticmethod
+    def _parse(data: bytes, dialect: CsvDialect, columns: list | None) -> pd.DataFrame | None:
+        if columns is not None:
+            kw = dict(header=None, names=columns, encoding=dialect.encoding.replace("-sig", ""))
+        else:
+            kw = dict(encoding=dialect.encoding)
+        try:
+            df = pd.read_csv(BytesIO(data), sep=dialect.sep, **kw)
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame(columns=columns) if columns is not None else pd.DataFrame()
+        except Exception:
+            try:
+                df = pd.read_csv(BytesIO(data), sep=dialect.sep, engine="python", on_bad_lines="skip", **kw)
+            except Exception:
+                return None
+        return _clean_columns(df)
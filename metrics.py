@@ -0,0 +1,207 @@
+# metrics.py
+# -*- coding: utf-8 -*-
+"""In-process timing histograms and counters, exported in the Prometheus text format.
+
+    with span("commit_stage", stage="log"):
+        ...
+    count("wizard_reruns", step="2", scope="step")
+
+Histograms use fixed buckets (seconds), so observing is a bisect and two
+additions under a lock. With METRICS_ENABLED=0 `span` returns one shared
+no-op context manager and `count` returns at once. Standard library only —
+the student page imports it.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "students"
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+_NOOP = nullcontext()
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count", "max")
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)     # האחרון: מעל הדלי העליון (+Inf)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Estimate from the buckets (linear inside the bucket, like histogram_quantile), capped at the max seen."""
+        if not self.count:
+            return float("nan")
+        rank, seen = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = self.buckets[i - 1] if i else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return min(lo + (hi - lo) * (rank - seen) / c, self.max)
+            seen += c
+        return self.max
+
+
+class _Span:
+    __slots__ = ("registry", "key", "t0")
+
+    def __init__(self, registry: "Registry", key: tuple):
+        self.registry, self.key = registry, key
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        self.registry._observe(self.key, time.perf_counter() - self.t0)
+        if exc_type is not None:
+            self.registry._inc((self.key[0] + "_errors", self.key[1]), 1)
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: tuple, extra: tuple = ()) -> str:
+    items = [f'{k}="{_escape(v)}"' for k, v in (*pairs, *extra)]
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+class Registry:
+    def __init__(self, enabled: bool = True, buckets: tuple = BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._hist: dict[tuple, Histogram] = {}
+        self._counters: dict[tuple, float] = {}
+        self._mutex = threading.Lock()
+
+    # =========================
+    # רישום
+    # =========================
+    def span(self, name: str, **labels):
+        """Context manager that observes its duration in the `name` histogram."""
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, _key(name, labels))
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        if self.enabled:
+            self._observe(_key(name, labels), seconds)
+
+    def count(self, name: str, by: float = 1, **labels) -> None:
+        if self.enabled:
+            self._inc(_key(name, labels), by)
+
+    def _observe(self, key: tuple, seconds: float) -> None:
+        with self._mutex:
+            h = self._hist.get(key)
+            if h is None:
+                h = self._hist[key] = Histogram(self.buckets)
+            h.observe(seconds)
+
+    def _inc(self, key: tuple, by: float) -> None:
+        with self._mutex:
+            self._counters[key] = self._counters.get(key, 0) + by
+
+    def reset(self) -> None:
+        with self._mutex:
+            self._hist.clear()
+            self._counters.clear()
+
+    # =========================
+    # קריאה
+    # =========================
+    def summary(self) -> list[dict]:
+        """One row per histogram series: count, mean and estimated p50/p95/p99 in milliseconds."""
+        with self._mutex:
+            items = sorted(self._hist.items())
+            rows = []
+            for (name, labels), h in items:
+                rows.append({"name": name, "labels": ", ".join(f"{k}={v}" for k, v in labels), "count": h.count,
+                             "mean_ms": 1e3 * h.sum / h.count if h.count else 0.0,
+                             **{f"p{int(q * 100)}_ms": 1e3 * h.quantile(q) for q in (0.5, 0.95, 0.99)}})
+        return rows
+
+    def counters(self) -> list[dict]:
+        with self._mutex:
+            return [{"name": name, "labels": ", ".join(f"{k}={v}" for k, v in labels), "value": v}
+                    for (name, labels), v in sorted(self._counters.items())]
+
+    def prometheus(self) -> str:
+        """All series in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._mutex:
+            hist = sorted(self._hist.items())
+            counters = sorted(self._counters.items())
+        typed = set()
+        for (name, labels), h in hist:
+            metric = f"{PREFIX}_{name}_seconds"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for le, c in zip([*map(repr, h.buckets), "+Inf"], h.counts):
+                cumulative += c
+                lines.append(f"{metric}_bucket{_labels(labels, (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(labels)} {h.sum!r}")
+            lines.append(f"{metric}_count{_labels(labels)} {h.count}")
+        for (name, labels), v in counters:
+            metric = f"{PREFIX}_{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_labels(labels)} {v:g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry(enabled=os.environ.get("METRICS_ENABLED", "1").strip().lower() not in ("0", "false", "no"))
+span = REGISTRY.span
+observe = REGISTRY.observe
+count = REGISTRY.count
+
+
+# =========================
+# נקודת קצה מקומית
+# =========================
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def serve(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """Serve GET /metrics from a daemon thread; raises OSError if the port is taken."""
+    handler = type("MetricsHandler", (_Handler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,208 @@
+# pipeline.py
+# -*- coding: utf-8 -*-
+"""Local commit path shared by the Streamlit app and the ingestion API (no Streamlit imports).
+
+A batch goes to the SQLite master (one transaction), the backup deltas, the
+segmented submission log, the running statistics, the Parquet snapshot and
+the Sheets outbox. The caller holds WRITE_LOCK_FILE. The steps after the
+master are recorded with the row and retried until they succeed (run_pending).
+"""
+import hashlib
+import json
+from datetime import datetime
+
+import pytz
+
+from config import (
+    BACKUP_DIR, COLUMNS_ORDER, CSV_FILE, DB_FILE, DEDUPE_POLICY, RANK_COUNT, SITES,
+    SNAPSHOT_DIR, STATS_FILE, WRITE_LOCK_FILE,
+)
+from storage import CommitResult, MasterStore
+from backups import BackupManager, RetentionPolicy
+from writer import FileLock
+from metrics import count, span
+from loaders import load_csv_safely
+from sheets_sync import SheetsOutbox
+from snapshot import ParquetSnapshot
+from submission_log import SegmentedLog, open_log
+from stats import RunningStats, StatsFile
+
+TZ = pytz.timezone("Asia/Jerusalem")
+DATE_FMT = "%d/%m/%Y %H:%M:%S"
+# שלבי ההמשך של שורה שנשמרה במאסטר (מסכת ביטים ב־ PendingWork.steps)
+BACKUP, LOG, STATS, OUTBOX, PARQUET = 1, 2, 4, 8, 16
+
+
+# =========================
+# פתיחת הרכיבים (פעם אחת לתהליך)
+# =========================
+def open_master_store() -> MasterStore:
+    """SQLite master store, importing the legacy CSV if the table is still empty."""
+    store = MasterStore(DB_FILE, COLUMNS_ORDER)
+    with FileLock(WRITE_LOCK_FILE):
+        if store.is_empty() and CSV_FILE.exists():
+            # כטקסט — אחרת ת"ז וטלפון נקראים כמספרים ומאבדים את האפסים המובילים
+            store.import_dataframe(load_csv_safely(CSV_FILE, dtype=str, keep_default_na=False))
+    return store
+
+
+def open_backup_manager(store: MasterStore, retention: dict | None = None) -> BackupManager:
+    """Backup manager with the given retention settings; takes a first snapshot if there is none."""
+    mgr = BackupManager(BACKUP_DIR, COLUMNS_ORDER, RetentionPolicy.from_mapping(retention or {}))
+    with FileLock(WRITE_LOCK_FILE):
+        mgr.refresh()
+        if not mgr.snapshots():
+            seq = store.last_seq()
+            mgr.snapshot(store.to_dataframe(upto=seq), seq)
+    return mgr
+
+
+def open_stats_file(store: MasterStore) -> StatsFile:
+    """Running aggregates; built once from the master if the file does not exist yet."""
+    sf = StatsFile(STATS_FILE)
+    with FileLock(WRITE_LOCK_FILE):
+        if not sf.exists():
+            sf.replace(RunningStats.from_frame(store.to_dataframe()))
+    return sf
+
+
+def open_submission_log() -> SegmentedLog:
+    """Segmented append-only log; copies in the single-file log of earlier versions on first use."""
+    with FileLock(WRITE_LOCK_FILE):
+        return open_log()
+
+
+def open_snapshot(store: MasterStore) -> ParquetSnapshot:
+    """Typed Parquet snapshot of the master, brought up to date with the store.
+
+    A failed refresh does not stop the caller (the snapshot is a read copy);
+    the next commit's PARQUET step retries it.
+    """
+    snap = ParquetSnapshot(SNAPSHOT_DIR)
+    with FileLock(WRITE_LOCK_FILE):
+        try:
+            snap.refresh(store)
+        except Exception:
+            count("pending_failures", stage="parquet")
+    return snap
+
+
+# =========================
+# שמירה
+# =========================
+def commit_local_batch(items: list[tuple[dict, str | None]], store: MasterStore, backups: BackupManager,
+                       outbox: SheetsOutbox | None, stats: StatsFile, log: SegmentedLog,
+                       policy: str = DEDUPE_POLICY, snapshot: ParquetSnapshot | None = None) -> list[CommitResult]:
+    """Commit a batch to the master, the backups, the segmented log, the running stats, the Parquet snapshot
+    and the Sheets outbox (caller holds the write lock). Rows that came from the sheet are committed
+    with outbox=None, so they are not appended to it again.
+
+    Only the master transaction can fail the batch. It also records the follow-up
+    steps of every row (PendingWork); a step that fails stays pending and is
+    retried with the next batch, even one that only has duplicates.
+    """
+    changed = BACKUP | LOG | STATS | (OUTBOX if outbox is not None else 0) | (PARQUET if snapshot is not None else 0)
+    with span("commit_stage", stage="master"):
+        results = store.commit(items, policy, {"inserted": changed, "replaced": changed, "kept_first": LOG})
+    for r in results:
+        count("commits", status=r.status)
+    run_pending(store, backups, outbox, stats, log, snapshot)
+    return results
+
+
+def run_pending(store: MasterStore, backups: BackupManager, outbox: SheetsOutbox | None, stats: StatsFile,
+                log: SegmentedLog, snapshot: ParquetSnapshot | None = None) -> list[str]:
+    """Run the follow-up steps still pending for committed rows (caller holds the write lock).
+
+    Each step runs for all its rows at once and is marked done only if it
+    succeeded; returns the errors of the steps that failed.
+    """
+    work = store.pending_work()
+    errors = []
+
+    def step(bit: int, stage: str, run) -> None:
+        todo = [w for w in work if w.steps & bit]
+        if not todo:
+            return
+        try:
+            run(todo)
+        except Exception as e:
+            count("pending_failures", stage=stage)
+            errors.append(f"{stage}: {e}")
+            store.work_failed([w.id for w in todo], errors[-1])
+        else:
+            store.work_done([w.id for w in todo], bit)
+
+    # --- גיבוי: רשומות דלתא דחוסות, וסנאפשוט מלא רק לפי מדיניות ---
+    def backup(todo):
+        backups.refresh()
+        if backups.snapshot_due():
+            with span("commit_stage", stage="backup_snapshot"):
+                last = store.last_seq()
+                backups.snapshot(store.to_dataframe(upto=last), last)
+        else:
+            with span("commit_stage", stage="backup_delta"):
+                backups.record_many([w.seq for w in todo], [w.row for w in todo], [w.replaced_id for w in todo])
+
+    # --- יומן Append-Only: כל ההגשות, כולל גרסאות קודמות של אותה ת"ז ---
+    def append_log(todo):
+        with span("commit_stage", stage="log"):
+            log.append([w.row for w in todo])
+
+    # --- סטטיסטיקות מצטברות: הוספת השורה החדשה והפחתת הגרסה שהוחלפה ---
+    def apply_stats(todo):
+        with span("commit_stage", stage="stats"):
+            stats.apply([w.row for w in todo], [w.previous for w in todo if w.previous])
+
+    # --- תור יוצא ל־ Google Sheets (נשלח ברקע) ---
+    def enqueue(todo):
+        with span("commit_stage", stage="outbox"):
+            outbox.put_many([w.row for w in todo])
+
+    # --- סנאפשוט Parquet: מתעדכן מהמאסטר עצמו (כל השורות שאחרי הרענון הקודם) ---
+    def refresh_snapshot(todo):
+        with span("commit_stage", stage="parquet"):
+            snapshot.refresh(store)
+
+    step(BACKUP, "backup", backup)
+    step(LOG, "log", append_log)
+    step(STATS, "stats", apply_stats)
+    if outbox is not None:
+        step(OUTBOX, "outbox", enqueue)
+    if snapshot is not None:
+        step(PARQUET, "parquet", refresh_snapshot)
+    return errors
+
+
+# =========================
+# שורות ממקור חיצוני
+# =========================
+def complete_row(row: dict) -> dict:
+    """Bring an uploaded row to the shape the form produces: only COLUMNS_ORDER keys,
+    a submission time, a numeric grade and the site -> rank columns derived from the ranks."""
+    out = {c: row.get(c) for c in COLUMNS_ORDER}
+    for c, v in out.items():
+        if isinstance(v, str):
+            out[c] = v.strip()
+    if not out.get("תאריך שליחה"):
+        out["תאריך שליחה"] = datetime.now(TZ).strftime(DATE_FMT)
+    try:
+        out["ממוצע"] = float(out["ממוצע"])
+    except (TypeError, ValueError):
+        pass
+    site_to_rank = {s: None for s in SITES}
+    for i in range(1, RANK_COUNT + 1):
+        site = out.get(f"מקום הכשרה {i}")
+        if site in site_to_rank:
+            site_to_rank[site] = i
+    for s in SITES:
+        out[f"דירוג_{s}"] = site_to_rank[s]
+    return out
+
+
+def content_token(row: dict, namespace: str) -> str:
+    """Idempotency token from the row content (without the submission time)."""
+    content = {k: v for k, v in row.items() if k != "תאריך שליחה"}
+    return hashlib.sha256(
+        (namespace + json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)).encode()
+    ).hexdigest()
@@ -0,0 +1,239 @@
+# placement.py
+# -*- coding: utf-8 -*-
+"""Student-to-site placement: student-proposing deferred acceptance over a NumPy rank matrix.
+
+Constraints taken from the form:
+  * sites with "רווחה" in their name only accept third-year students ("שנה ג'"),
+  * "רגישות למרחב רפואי" in התאמות excludes hospital sites,
+  * former training partners ("הכשרה קודמת בן זוג") are not placed at the same site.
+"""
+import heapq
+import math
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from config import RANK_COUNT, SITES
+from schema import as_text, ordinal
+from storage import normalize_id
+
+ID_COL = "תעודת זהות"
+YEAR_COL = "שנת לימודים"
+ADJ_COL = "התאמות"
+PARTNER_COL = "הכשרה קודמת בן זוג"
+GRADE_COL = "ממוצע"
+RANK_COLS = [f"מקום הכשרה {i}" for i in range(1, RANK_COUNT + 1)]
+
+WELFARE_YEAR_MARK = "שנה ג'"
+MEDICAL_SENSITIVITY_MARK = "רגישות למרחב רפואי"
+HOSPITAL_MARK = "בית חולים"
+OUTSIDE_RANK = RANK_COUNT + 1   # שובץ למוסד שלא דורג
+
+MOTIVATION_COLS = ["מוטיבציה 1", "מוטיבציה 2", "מוטיבציה 3"]
+POLICIES = ("grade", "motivation", "lottery")
+# העמודות שהשיבוץ קורא — לקריאה חלקית מהסנאפשוט העמודתי
+COLUMNS = [ID_COL, "שם פרטי", "שם משפחה", YEAR_COL, ADJ_COL, PARTNER_COL, GRADE_COL, *RANK_COLS, *MOTIVATION_COLS]
+
+
+@dataclass
+class PlacementResult:
+    assignments: pd.DataFrame            # שורה לכל סטודנט/ית
+    summary: pd.DataFrame                # שורה לכל מוסד
+    unassigned: int = 0
+    rank_counts: dict = field(default_factory=dict)
+
+
+def _norm_name(v) -> str:
+    return re.sub(r"\s+", " ", str(v or "")).strip()
+
+
+def prepare(df: pd.DataFrame) -> pd.DataFrame:
+    """Latest submission per ID, in a stable order."""
+    df = df.copy()
+    df["_id"] = df[ID_COL].map(normalize_id)
+    df = df[df["_id"] != ""].drop_duplicates("_id", keep="last").reset_index(drop=True)
+    return df
+
+
+def rank_matrix(df: pd.DataFrame, sites: list[str] = SITES) -> np.ndarray:
+    """(students x sites) matrix of the chosen rank 1..RANK_COUNT; 0 where the site was not ranked."""
+    site_pos = {s: j for j, s in enumerate(sites)}
+    R = np.zeros((len(df), len(sites)), dtype=np.int8)
+    for r, col in enumerate(RANK_COLS, start=1):
+        if col not in df:
+            continue
+        j = as_text(df[col]).map(site_pos)
+        ok = j.notna().to_numpy()
+        R[np.flatnonzero(ok), j[ok].astype(int).to_numpy()] = r
+    return R
+
+
+def eligibility(df: pd.DataFrame, sites: list[str] = SITES) -> np.ndarray:
+    """(students x sites) boolean mask of allowed placements."""
+    E = np.ones((len(df), len(sites)), dtype=bool)
+    year = as_text(df[YEAR_COL]) if YEAR_COL in df else pd.Series("", index=df.index)
+    adj = as_text(df[ADJ_COL]) if ADJ_COL in df else pd.Series("", index=df.index)
+    not_third = ~year.str.contains(WELFARE_YEAR_MARK, regex=False).to_numpy()
+    sensitive = adj.str.contains(MEDICAL_SENSITIVITY_MARK, regex=False).to_numpy()
+    for j, s in enumerate(sites):
+        if "רווחה" in s:
+            E[not_third, j] = False
+        if HOSPITAL_MARK in s:
+            E[sensitive, j] = False
+    return E
+
+
+def partner_pairs(df: pd.DataFrame) -> dict[int, set[int]]:
+    """Former training partners, matched by full name (either order), as a symmetric adjacency map."""
+    if PARTNER_COL not in df:
+        return {}
+    first = df["שם פרטי"].map(_norm_name)
+    last = df["שם משפחה"].map(_norm_name)
+    by_name: dict[str, list[int]] = {}
+    for i, (f, l) in enumerate(zip(first, last)):
+        for key in (f"{f} {l}", f"{l} {f}"):
+            by_name.setdefault(key, []).append(i)
+    pairs: dict[int, set[int]] = {}
+    for i, p in enumerate(df[PARTNER_COL].map(_norm_name)):
+        for k in by_name.get(p, []) if p else []:
+            if k != i:
+                pairs.setdefault(i, set()).add(k)
+                pairs.setdefault(k, set()).add(i)
+    return pairs
+
+
+def grades(df: pd.DataFrame) -> np.ndarray:
+    return pd.to_numeric(df.get(GRADE_COL), errors="coerce").fillna(0).to_numpy(dtype=float)
+
+
+def motivation_scores(df: pd.DataFrame) -> np.ndarray:
+    """Sum of the three likert answers as ordinal codes 0..5."""
+    total = np.zeros(len(df))
+    for col in MOTIVATION_COLS:
+        if col in df:
+            total += ordinal(df[col]).fillna(0).to_numpy(dtype=float)
+    return total
+
+
+def priority_from(policy: str, grade: np.ndarray, motivation: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Site-side priority (higher is better). Ties are always broken by the lottery."""
+    lottery = rng.random(len(grade))
+    if policy == "lottery":
+        return lottery
+    if policy == "grade":
+        return grade + lottery * 1e-3        # ממוצעים מוזנים בדיוק של 0.1
+    if policy == "motivation":
+        return motivation + lottery * 1e-3   # ציון מוטיבציה שלם 0..15
+    raise ValueError(f"unknown tie-breaking policy: {policy}")
+
+
+def priority_scores(df: pd.DataFrame, policy: str = "grade", seed: int | None = 0) -> np.ndarray:
+    return priority_from(policy, grades(df), motivation_scores(df), np.random.default_rng(seed))
+
+
+def default_capacities(n_students: int, sites: list[str] = SITES, slack: float = 1.1) -> dict[str, int]:
+    """Even split of the students across the sites, with some slack for the constraints."""
+    return {s: math.ceil(slack * n_students / len(sites)) for s in sites}
+
+
+def deferred_acceptance(R: np.ndarray, E: np.ndarray, capacity: np.ndarray, priority: np.ndarray,
+                        partners: dict[int, set[int]] | None = None,
+                        fill_unranked: bool = True) -> np.ndarray:
+    """Student-proposing deferred acceptance; returns the site index per student (-1 = unassigned).
+
+    Students propose to their eligible ranked sites in order, then (if
+    `fill_unranked`) to the remaining eligible sites, least demanded first.
+    A site holds its best `capacity` proposals by priority and never holds two
+    former partners at once.
+    """
+    n, m = R.shape
+    partners = partners or {}
+    demand = (R > 0).sum(axis=0)
+    big = RANK_COUNT + 1
+    # סדר העדפות: דירוג 1..3, ואחריו מוסדות שלא דורגו לפי ביקוש עולה
+    key = np.where(R > 0, R, big).astype(np.int64) * (m + 1) + np.argsort(np.argsort(demand, kind="stable"))[None, :]
+    key = np.where(E, key, np.iinfo(np.int64).max)
+    if not fill_unranked:
+        key = np.where(R > 0, key, np.iinfo(np.int64).max)
+    prefs = np.argsort(key, axis=1, kind="stable")
+    n_prefs = (key != np.iinfo(np.int64).max).sum(axis=1)
+
+    nxt = np.zeros(n, dtype=np.int64)
+    held: list[list[tuple[float, int]]] = [[] for _ in range(m)]   # min-heap לפי עדיפות
+    held_set: list[set[int]] = [set() for _ in range(m)]
+    assigned = np.full(n, -1, dtype=np.int64)
+    free = list(range(n))
+    while free:
+        s = free.pop()
+        if nxt[s] >= n_prefs[s]:
+            continue
+        j = int(prefs[s, nxt[s]])
+        nxt[s] += 1
+        if capacity[j] <= 0:
+            free.append(s)
+            continue
+        rejected = []
+        clash = partners.get(s, set()) & held_set[j]
+        if clash:
+            # כל בני הזוג לשעבר שכבר במוסד: אם אחד מהם עדיף — s נדחה, אחרת כולם מפנים את מקומם
+            if any(priority[t] >= priority[s] for t in clash):
+                free.append(s)
+                continue
+            held[j] = [(p, x) for p, x in held[j] if x not in clash]
+            heapq.heapify(held[j])
+            held_set[j] -= clash
+            for t in sorted(clash):
+                assigned[t] = -1
+                rejected.append(t)
+        heapq.heappush(held[j], (priority[s], s))
+        held_set[j].add(s)
+        assigned[s] = j
+        if len(held[j]) > capacity[j]:
+            _, t = heapq.heappop(held[j])
+            held_set[j].discard(t)
+            assigned[t] = -1
+            rejected.append(t)
+        free.extend(rejected)
+    return assigned
+
+
+def run_placement(df_master: pd.DataFrame, capacities: dict[str, int] | None = None,
+                  policy: str = "grade", seed: int | None = 0, sites: list[str] = SITES) -> PlacementResult:
+    df = prepare(df_master)
+    caps = capacities or default_capacities(len(df), sites)
+    R = rank_matrix(df, sites)
+    E = eligibility(df, sites)
+    capacity = np.array([int(caps.get(s, 0)) for s in sites])
+    assigned = deferred_acceptance(R, E, capacity, priority_scores(df, policy, seed), partner_pairs(df))
+    return build_result(df, R, assigned, capacity, sites)
+
+
+def build_result(df: pd.DataFrame, R: np.ndarray, assigned: np.ndarray, capacity: np.ndarray,
+                 sites: list[str] = SITES) -> PlacementResult:
+    ok = assigned >= 0
+    achieved = np.full(len(df), np.nan)
+    achieved[ok] = R[np.flatnonzero(ok), assigned[ok]]
+    achieved[ok & (achieved == 0)] = OUTSIDE_RANK
+    site_names = np.array(sites, dtype=object)
+    assignments = pd.DataFrame({
+        "תעודת זהות": df[ID_COL].to_numpy(),
+        "שם פרטי": df.get("שם פרטי"),
+        "שם משפחה": df.get("שם משפחה"),
+        "שנת לימודים": df.get(YEAR_COL),
+        **{c: df.get(c) for c in RANK_COLS},
+        "מוסד משובץ": np.where(ok, site_names[np.clip(assigned, 0, None)], None),
+        "דירוג שהושג": pd.array(achieved, dtype="Int8"),
+    })
+    counts = np.bincount(assigned[ok], minlength=len(sites))
+    summary = pd.DataFrame({
+        "מוסד": sites,
+        "קיבולת": capacity,
+        "שובצו": counts,
+        "דירגו ראשון": (R == 1).sum(axis=0),
+        **{f"שובצו בדירוג {r}": np.bincount(assigned[ok & (achieved == r)], minlength=len(sites))
+           for r in range(1, RANK_COUNT + 1)},
+    })
+    rank_counts = {int(r): int((achieved == r).sum()) for r in range(1, OUTSIDE_RANK + 1)}
+    return PlacementResult(assignments, summary, int((~ok).sum()), rank_counts)
@@ -0,0 +1,233 @@
+# reconcile.py
+# -*- coding: utf-8 -*-
+"""Reconciliation between the local master and the Google Sheet, in both directions.
+
+The sheet is read with one get_all_values call (unformatted, dates as serial
+numbers). Every row on both sides is keyed by a 64-bit hash of
+ID + submission time, and the key sets are compared with one np.isin each way:
+    push   master rows missing from the sheet (and not waiting in the outbox),
+           appended in batches of BATCH_ROWS
+    pull   sheet rows whose ID is not in the master at all (e.g. after the
+           local disk was lost); reported, and committed to the master with --pull
+Rows the sheet has for an ID the master also has (earlier versions of a
+replaced submission) are left alone.
+
+The submission time is appended as text (sheets_sync.TEXT_COLUMNS), so it reads
+back the same in any spreadsheet locale. Older rows, which the sheet turned
+into dates, match in either day/month order. The background worker passes
+max_push=AUTO_PUSH_LIMIT and refuses to append more rows than that at once.
+
+The sheet lock is held for the whole run, so the sync worker does not append
+meanwhile; the write lock only while the master and the outbox are read.
+
+Usage:
+    python reconcile.py [--dry-run] [--pull] [--secrets .streamlit/secrets.toml]
+"""
+import argparse
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import COLUMNS_ORDER, DEDUPE_POLICY, SECRETS_FILE, SHEETS_LOCK_FILE, WRITE_LOCK_FILE, load_secrets
+from pipeline import DATE_FMT, commit_local_batch
+from schema import as_text
+from sheets_sync import SheetsOutbox, SheetStyler, last_row_of, sheet_values, user_entered
+from storage import CommitResult, MasterStore
+from writer import FileLock
+
+ID_COL = "תעודת זהות"
+DATE_COL = "תאריך שליחה"
+BATCH_ROWS = 500
+AUTO_PUSH_LIMIT = 500            # ההשוואה האוטומטית לא מוסיפה יותר שורות מזה בבת אחת
+SERIAL_EPOCH = "1899-12-30"      # יום 0 של המספרים הסידוריים של Google Sheets
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+
+
+@dataclass
+class Reconciliation:
+    sheet_rows: int
+    local_rows: int
+    pending: int                 # שורות שממתינות בתור ולכן אינן נשלחות שוב
+    missing: int                 # שורות מהקובץ הראשי שחסרות בגיליון
+    pushed: int
+    sheet_only: pd.DataFrame     # שורות בגיליון שהת"ז שלהן אינה בקובץ הראשי
+    seconds: float
+
+
+# =========================
+# מפתחות
+# =========================
+def sheet_frame(values: list[list], columns: list[str] = COLUMNS_ORDER) -> pd.DataFrame:
+    """The sheet's rows (first row = header) as a DataFrame in `columns` order; blank rows dropped."""
+    if not values:
+        return pd.DataFrame(columns=columns)
+    header, rows = values[0], values[1:]
+    width = max(len(header), *(len(r) for r in rows)) if rows else len(header)
+    grid = np.full((len(rows), width), "", dtype=object)
+    for i, r in enumerate(rows):
+        grid[i, :len(r)] = r
+    pos = {}
+    for i, h in enumerate(header):
+        pos.setdefault(h, i)
+    empty = np.full(len(rows), "", dtype=object)
+    df = pd.DataFrame({c: grid[:, pos[c]] if c in pos else empty for c in columns})
+    blank = (grid == "").all(axis=1) if width else np.ones(len(rows), dtype=bool)
+    return df[~blank].reset_index(drop=True)
+
+
+def _ids(s: pd.Series) -> pd.Series:
+    text = as_text(s)
+    # ת"ז שהגיליון המיר למספר — השלמת האפסים המובילים (כמו storage.normalize_id)
+    return text.where(~text.str.fullmatch(r"\d+"), text.str.zfill(9))
+
+
+def _instants(s: pd.Series, swap: bool = False) -> tuple[pd.Series, pd.Series]:
+    """(submission times parsed from DATE_FMT text or from serial numbers, the values as text).
+
+    With `swap`, day and month of the serial numbers are exchanged — the sheet
+    may have read the text month-first, depending on its locale.
+    """
+    text = as_text(s)
+    parsed = pd.to_datetime(text, format=DATE_FMT, errors="coerce")
+    serial = pd.to_numeric(s.where(s != ""), errors="coerce")
+    if serial.notna().any():
+        when = pd.to_datetime(serial, unit="D", origin=SERIAL_EPOCH).dt.round("s")
+        if swap:
+            when = pd.to_datetime(pd.DataFrame({
+                "year": when.dt.year, "month": when.dt.day, "day": when.dt.month,
+                "hour": when.dt.hour, "minute": when.dt.minute, "second": when.dt.second}), errors="coerce")
+        parsed = parsed.fillna(when)
+    return parsed, text
+
+
+def _times(s: pd.Series) -> pd.Series:
+    """Submission times as DATE_FMT text (values that are not a time are kept as they are)."""
+    parsed, text = _instants(s)
+    return parsed.dt.strftime(DATE_FMT).where(parsed.notna(), text)
+
+
+def row_keys(df: pd.DataFrame, swap: bool = False) -> np.ndarray:
+    """uint64 hash of ID + submission time for every row (see _instants for `swap`)."""
+    if df.empty:
+        return np.empty(0, dtype=np.uint64)
+    parsed, text = _instants(df[DATE_COL], swap)
+    # הזמן כמספר שניות; ערך שאינו זמן — לפי הגיבוב של הטקסט שלו
+    when = np.where(parsed.notna(), parsed.to_numpy(dtype="datetime64[s]").astype("int64"),
+                    pd.util.hash_array(text.to_numpy(dtype=object)).view("int64"))
+    keys = pd.DataFrame({"id": _ids(df[ID_COL]).to_numpy(dtype=object), "when": when})
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def diff(local: pd.DataFrame, sheet: pd.DataFrame, pending: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """(master rows to append to the sheet, sheet rows whose ID is not in the master)."""
+    have = np.concatenate([row_keys(sheet), row_keys(sheet, swap=True), row_keys(pending)])
+    missing = local[~np.isin(row_keys(local), have)] if not local.empty else local
+    if sheet.empty:
+        return missing, sheet
+    local_ids = pd.util.hash_array(_ids(local[ID_COL]).to_numpy(dtype=object)) if not local.empty else []
+    sheet_only = sheet[~np.isin(pd.util.hash_array(_ids(sheet[ID_COL]).to_numpy(dtype=object)), local_ids)]
+    return missing, sheet_only
+
+
+# =========================
+# הרצה
+# =========================
+def reconcile(ws, store: MasterStore, outbox: SheetsOutbox, columns: list[str] = COLUMNS_ORDER,
+              batch_rows: int = BATCH_ROWS, dry_run: bool = False,
+              styler: SheetStyler | None = None, max_push: int | None = None) -> Reconciliation:
+    """Append the master rows the sheet is missing; report the rows only the sheet has.
+
+    Raises RuntimeError instead of appending when more than `max_push` rows are missing.
+    """
+    started = time.perf_counter()
+    with FileLock(SHEETS_LOCK_FILE):
+        values = ws.get_all_values(value_render_option="UNFORMATTED_VALUE",
+                                   date_time_render_option="SERIAL_NUMBER")
+        sheet = sheet_frame(values, columns)
+        # המאסטר והתור נקראים יחד — שורה שנשמרה כבר נמצאת גם בתור
+        with FileLock(WRITE_LOCK_FILE):
+            local = store.to_dataframe(columns=["seq", ID_COL, DATE_COL])
+            pending = pd.DataFrame(outbox.rows(), columns=columns)
+        missing, sheet_only = diff(local, sheet, pending)
+        if not missing.empty:
+            # כל העמודות נקראות רק כשחסרות שורות; שורה שהוחלפה בינתיים כבר לא תימצא — גרסתה החדשה בתור
+            full = store.rows_since(0)
+            missing = full[full["seq"].isin(missing["seq"])].drop(columns="seq")
+        if not dry_run and max_push is not None and len(missing) > max_push:
+            raise RuntimeError(f"{len(missing)} rows missing from the sheet (more than {max_push}); "
+                               f"not appended automatically — run reconcile.py --dry-run to check")
+        pushed, res = 0, None
+        if not dry_run and not missing.empty:
+            rows = missing.astype(object).where(missing.notna(), None).to_dict("records")
+            for i in range(0, len(rows), batch_rows):
+                chunk = [user_entered(sheet_values(r, columns), columns) for r in rows[i:i + batch_rows]]
+                res = ws.append_rows(chunk, value_input_option="USER_ENTERED")
+                pushed += len(chunk)
+        if styler is not None and last_row_of(res):
+            styler.apply(ws, last_row_of(res))
+    return Reconciliation(len(sheet), len(local), len(pending), len(missing), pushed,
+                          sheet_only.reset_index(drop=True), time.perf_counter() - started)
+
+
+def pull(sheet_only: pd.DataFrame, store: MasterStore, backups, stats, log, snapshot=None,
+         policy: str = DEDUPE_POLICY) -> list[CommitResult]:
+    """Commit rows that only the sheet has to the master (not to the outbox — they are in the sheet)."""
+    if sheet_only.empty:
+        return []
+    rows = pd.DataFrame({c: as_text(sheet_only[c]) for c in sheet_only.columns})
+    rows[ID_COL] = _ids(sheet_only[ID_COL])
+    rows[DATE_COL] = _times(sheet_only[DATE_COL])
+    items = [(row, None) for row in rows.to_dict("records")]
+    with FileLock(WRITE_LOCK_FILE):
+        return commit_local_batch(items, store, backups, None, stats, log, policy, snapshot)
+
+
+def open_worksheet(secrets: dict):
+    """The form's worksheet, from the app's secrets (gcp_service_account + sheets.spreadsheet_id)."""
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    creds = Credentials.from_service_account_info(secrets["gcp_service_account"], scopes=SCOPES)
+    return gspread.authorize(creds).open_by_key(secrets["sheets"]["spreadsheet_id"]).sheet1
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--secrets", type=Path, default=SECRETS_FILE)
+    ap.add_argument("--dry-run", action="store_true", help="only report, do not append")
+    ap.add_argument("--pull", action="store_true", help="commit the rows only the sheet has to the master")
+    ap.add_argument("--sheet-only-out", type=Path, default=None, help="CSV of the rows only the sheet has")
+    args = ap.parse_args(argv)
+
+    from config import OUTBOX_FILE, master_settings
+    from pipeline import open_backup_manager, open_master_store, open_snapshot, open_stats_file, open_submission_log
+    from sheets_sync import migrate_header
+
+    secrets = load_secrets(args.secrets)
+    ws = open_worksheet(secrets)
+    store = open_master_store()
+    if not args.dry_run:
+        with FileLock(SHEETS_LOCK_FILE):
+            if migrate_header(ws, COLUMNS_ORDER):
+                print("header migrated")
+    rec = reconcile(ws, store, SheetsOutbox(OUTBOX_FILE, COLUMNS_ORDER), dry_run=args.dry_run)
+    print(f"sheet {rec.sheet_rows} rows, master {rec.local_rows}, pending {rec.pending}; "
+          f"{rec.missing} missing from the sheet, {rec.pushed} appended, "
+          f"{len(rec.sheet_only)} only in the sheet ({rec.seconds:.1f}s)")
+    if args.sheet_only_out and not rec.sheet_only.empty:
+        rec.sheet_only.to_csv(args.sheet_only_out, index=False, encoding="utf-8-sig")
+    if args.pull and not args.dry_run and not rec.sheet_only.empty:
+        settings = master_settings(secrets)
+        results = pull(rec.sheet_only, store, open_backup_manager(store, settings["backups"]),
+                       open_stats_file(store), open_submission_log(), open_snapshot(store),
+                       settings["DEDUPE_POLICY"])
+        print(f"pulled {sum(r.changed_master for r in results)} rows into the master")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
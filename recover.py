@@ -0,0 +1,212 @@
+# recover.py
+# -*- coding: utf-8 -*-
+"""Rebuild the master from every backup in BACKUP_DIR (CSV copies, full snapshots
+and the delta records written after each snapshot) and the segmented append-only log.
+
+Files are parsed in a process pool (CSVs through load_csv_safely, as text so
+IDs and phone numbers keep their leading zeros; deltas line by line) and checkpointed in a work
+directory together with a manifest, so an interrupted run resumes where it
+stopped and files that did not change are not parsed again. The checkpoints
+are then merged in file-time order, deduplicated by ID + submission time,
+and the dedupe policy picks the row per ID for the master.
+
+Usage:
+    python recover.py --out data/recovered_master.csv [--history data/recovered_history.csv]
+    python recover.py --out ... --workers 8 --restart      (ignore earlier checkpoints)
+
+To install the result, stop the app, move the SQLite master aside and copy
+the output to CSV_FILE: an empty store imports it on the next start.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import BACKUP_DIR, COLUMNS_ORDER, CSV_LOG_FILE, DATA_DIR, DEDUPE_POLICY, LOG_DIR
+from loaders import load_csv_safely
+from storage import KEEP_ALL, KEEP_LATEST, normalize_id
+
+ID_COL = "תעודת זהות"
+DATE_COL = "תאריך שליחה"
+DATE_FMT = "%d/%m/%Y %H:%M:%S"
+WORK_DIR = DATA_DIR / "recovery"
+PATTERNS = ("*.csv", "snapshot_*.csv.gz", "delta_*.jsonl.gz")
+LOG_PATTERNS = ("[0-9]*_*.csv", "[0-9]*_*.csv.gz")
+
+
+def source_files(backup_dir: Path = BACKUP_DIR, log_file: Path = CSV_LOG_FILE,
+                 log_dir: Path = LOG_DIR) -> list[Path]:
+    """Backup CSVs (oldest first, by mtime), then the log, which holds the newest versions:
+    the single-file log of earlier versions and the log segments in segment order."""
+    files = {p for pattern in PATTERNS for p in Path(backup_dir).glob(pattern)}
+    out = sorted(files, key=lambda p: (p.stat().st_mtime_ns, p.name))
+    if Path(log_file).exists():
+        out.append(Path(log_file))
+    # לפי שם הקובץ (מספר המקטע) ולא לפי האינדקס — השחזור לא תלוי בשלמותו
+    out += sorted({p for pattern in LOG_PATTERNS for p in Path(log_dir).glob(pattern)})
+    return out
+
+
+def _key(df: pd.DataFrame) -> pd.Series:
+    return df[ID_COL].map(normalize_id) + "|" + df[DATE_COL].str.strip()
+
+
+def _text(v) -> str:
+    if v is None or (isinstance(v, float) and v != v):
+        return ""
+    return str(v)
+
+
+def read_delta(path: Path) -> pd.DataFrame:
+    """Rows of a backup delta file (backups.BackupManager.record_many) as text; stops at a torn last line."""
+    rows = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                rows.append({c: _text(v) for c, v in json.loads(line)["row"].items()})
+        except (json.JSONDecodeError, EOFError, KeyError):
+            pass   # רשומה אחרונה שנקטעה באמצע כתיבה
+    return pd.DataFrame(rows, columns=COLUMNS_ORDER)
+
+
+def parse_file(path: Path, checkpoint: Path) -> int:
+    """Worker: parse one file as text, drop duplicate keys within it, write a checkpoint; returns rows kept."""
+    if path.name.endswith(".jsonl.gz"):
+        df = read_delta(path)
+    else:
+        df = load_csv_safely(path, dtype=str, keep_default_na=False)
+    df = df.reindex(columns=COLUMNS_ORDER).fillna("")
+    df = df[(df[ID_COL].str.strip() != "") | (df[DATE_COL].str.strip() != "")]
+    df = df.assign(_key=_key(df)).drop_duplicates("_key", keep="last")
+    tmp = checkpoint.with_suffix(".tmp")
+    df.to_pickle(tmp)
+    tmp.replace(checkpoint)
+    return len(df)
+
+
+class Manifest:
+    """Processed files (path -> size, mtime, checkpoint, rows), persisted as JSON in the work dir."""
+
+    def __init__(self, work_dir: Path, restart: bool = False):
+        self.work_dir = Path(work_dir)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.work_dir / "manifest.json"
+        self.entries: dict[str, dict] = {}
+        if self.path.exists() and not restart:
+            self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+        self._saved = time.monotonic()
+
+    @staticmethod
+    def _stat(path: Path) -> dict:
+        st = path.stat()
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def checkpoint_for(self, path: Path) -> Path:
+        return self.work_dir / (hashlib.sha1(str(path.resolve()).encode()).hexdigest() + ".pkl")
+
+    def done(self, path: Path) -> bool:
+        e = self.entries.get(str(path))
+        return bool(e) and {k: e[k] for k in ("size", "mtime_ns")} == self._stat(path) \
+            and Path(e["checkpoint"]).exists()
+
+    def add(self, path: Path, rows: int) -> None:
+        self.entries[str(path)] = {**self._stat(path), "checkpoint": str(self.checkpoint_for(path)), "rows": rows}
+        if time.monotonic() - self._saved > 2:
+            self.save()
+
+    def save(self) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.entries, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.path)
+        self._saved = time.monotonic()
+
+
+def parse_all(files: list[Path], manifest: Manifest, workers: int | None = None,
+              progress=print) -> None:
+    todo = [p for p in files if not manifest.done(p)]
+    progress(f"{len(files)} files, {len(files) - len(todo)} already parsed, {len(todo)} to parse")
+    if not todo:
+        return
+    started = time.perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(parse_file, p, manifest.checkpoint_for(p)): p for p in todo}
+        try:
+            for k, fut in enumerate(as_completed(futures), start=1):
+                path = futures[fut]
+                manifest.add(path, fut.result())
+                elapsed = time.perf_counter() - started
+                eta = elapsed / k * (len(todo) - k)
+                progress(f"[{k}/{len(todo)}] {path.name}: {manifest.entries[str(path)]['rows']} rows "
+                         f"({elapsed:.0f}s, ~{eta:.0f}s left)")
+        finally:
+            manifest.save()
+
+
+def merge(files: list[Path], manifest: Manifest, policy: str = DEDUPE_POLICY) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """(history of unique ID + time versions, master under the dedupe policy).
+
+    Checkpoints are read in file order and only keys not seen before are kept,
+    so memory follows the number of unique versions, not the number of files.
+    """
+    seen: set[str] = set()
+    parts = []
+    for path in files:
+        df = pd.read_pickle(manifest.entries[str(path)]["checkpoint"])
+        keys = df["_key"].tolist()
+        fresh = np.fromiter((k not in seen for k in keys), dtype=bool, count=len(keys))
+        if fresh.any():
+            new = df[fresh]
+            seen.update(new["_key"])
+            parts.append(new)
+    if not parts:
+        empty = pd.DataFrame(columns=COLUMNS_ORDER)
+        return empty, empty
+    history = pd.concat(parts, ignore_index=True)
+    ts = pd.to_datetime(history[DATE_COL], format=DATE_FMT, errors="coerce")
+    ts = ts.fillna(pd.to_datetime(history[DATE_COL], dayfirst=True, errors="coerce", format="mixed"))
+    history = (history.assign(_ts=ts, _order=range(len(history)))
+               .sort_values(["_ts", "_order"], kind="stable", na_position="first"))
+    master = history
+    if policy != KEEP_ALL:
+        ids = master[ID_COL].map(normalize_id)
+        dup = ids.duplicated(keep="last" if policy == KEEP_LATEST else "first") & (ids != "")
+        master = master[~dup]
+    drop = ["_key", "_ts", "_order"]
+    return (history.drop(columns=drop).reset_index(drop=True),
+            master.drop(columns=drop).reset_index(drop=True))
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--backups", type=Path, default=BACKUP_DIR)
+    ap.add_argument("--log", type=Path, default=CSV_LOG_FILE)
+    ap.add_argument("--log-dir", type=Path, default=LOG_DIR)
+    ap.add_argument("--out", type=Path, required=True)
+    ap.add_argument("--history", type=Path, default=None)
+    ap.add_argument("--policy", default=DEDUPE_POLICY)
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--work-dir", type=Path, default=WORK_DIR)
+    ap.add_argument("--restart", action="store_true", help="ignore checkpoints of an earlier run")
+    args = ap.parse_args(argv)
+
+    files = source_files(args.backups, args.log, args.log_dir)
+    manifest = Manifest(args.work_dir, restart=args.restart)
+    parse_all(files, manifest, args.workers)
+    history, master = merge(files, manifest, args.policy)
+    master.to_csv(args.out, index=False, encoding="utf-8-sig")
+    print(f"{len(history)} unique submissions, {len(master)} rows in the master -> {args.out}")
+    if args.history:
+        history.to_csv(args.history, index=False, encoding="utf-8-sig")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
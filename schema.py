@@ -0,0 +1,121 @@
+# schema.py
+# -*- coding: utf-8 -*-
+"""Typed in-memory representation of submissions.
+
+Fixed-choice columns become categoricals (the form's options first, any other
+value seen in the data appended), the likert answers an ordered categorical
+whose codes are the ordinal scores 0..5, the site -> rank columns nullable
+Int8 and the grade a float. Free-text columns become plain strings ("" for
+missing), so a column never mixes numbers and text (Parquet needs one type
+per column); numeric columns such as the store's seq are left as they are.
+"""
+import pandas as pd
+
+from config import (
+    DOMAINS, GENDERS, LIKERT, MOTHER_TONGUES, PREV_TRAINING, RANK_COUNT, SITES, SOCIAL_AFFILIATIONS,
+    STUDY_YEARS, TRACKS,
+)
+from storage import normalize_id
+
+ID_COL = "תעודת זהות"
+GRADE_COL = "ממוצע"
+LIKERT_COLS = ("מוטיבציה 1", "מוטיבציה 2", "מוטיבציה 3")
+RANK_COLS = tuple(f"מקום הכשרה {i}" for i in range(1, RANK_COUNT + 1))
+SITE_RANK_COLS = tuple(f"דירוג_{s}" for s in SITES)
+SMALL_FRAME = 256
+
+CATEGORIES: dict[str, list[str]] = {
+    "מין": GENDERS,
+    "שיוך חברתי": SOCIAL_AFFILIATIONS,
+    "שפת אם": MOTHER_TONGUES,
+    "שנת לימודים": STUDY_YEARS,
+    "מסלול לימודים": TRACKS,
+    "הכשרה קודמת": PREV_TRAINING,
+    "תחום מוביל": DOMAINS,
+    "אישור הגעה להכשרה": ["כן", "לא"],
+    **{c: SITES for c in RANK_COLS},
+    **{c: LIKERT for c in LIKERT_COLS},
+}
+
+
+def as_text(s: pd.Series) -> pd.Series:
+    """Plain string values ("" for missing) of a raw or typed column; whole numbers without ".0"."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype(object)
+    if pd.api.types.is_string_dtype(s.dtype) and not pd.api.types.is_object_dtype(s.dtype):
+        return s.fillna("").str.strip()
+    s = s.where(s.notna(), "").astype(str).str.strip()
+    return s.str.replace(r"^(\d+)\.0$", r"\1", regex=True)
+
+
+def _text_value(v) -> str:
+    if v is None or (isinstance(v, float) and v != v):
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v).strip()
+
+
+def _categorical(s: pd.Series, base: list[str], ordered: bool = False) -> pd.Series:
+    if len(s) <= SMALL_FRAME:
+        # מעט שורות (אצוות שמירה) — לולאה פשוטה זולה מתקורת פעולות pandas
+        values = [_text_value(v) for v in s.astype(object)]
+        extra = sorted(set(values).difference(base, ("",)))
+    else:
+        text = as_text(s)
+        extra = sorted(set(text.unique()).difference(base, ("",)))
+    if ordered and extra:
+        # ערך לא מוכר בשאלת ליקרט — נשאר בטקסט ולא מקבל קוד אורדינלי
+        ordered = False
+    dtype = pd.CategoricalDtype(list(base) + extra, ordered=ordered)
+    if len(s) <= SMALL_FRAME:
+        return pd.Series(pd.Categorical([v or None for v in values], dtype=dtype), index=s.index, name=s.name)
+    return text.where(text != "").astype(dtype)
+
+
+def to_typed(df: pd.DataFrame) -> pd.DataFrame:
+    """Typed copy of a submissions DataFrame (raw CSV/SQLite values in, compact dtypes out)."""
+    if df.empty:
+        return df
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if col in CATEGORIES:
+            out[col] = _categorical(s, CATEGORIES[col], ordered=col in LIKERT_COLS)
+        elif col in SITE_RANK_COLS:
+            out[col] = pd.to_numeric(s, errors="coerce").round().astype("Int8")
+        elif col == GRADE_COL:
+            out[col] = pd.to_numeric(s, errors="coerce")
+        elif col == ID_COL and not pd.api.types.is_string_dtype(s):
+            # ת"ז שנקראה כמספר — החזרת אפסים מובילים
+            out[col] = s.map(normalize_id)
+        elif not pd.api.types.is_numeric_dtype(s):
+            # טלפון שנשמר פעם כמספר ופעם כטקסט — עמודה אחת מסוג אחד
+            out[col] = as_text(s)
+        else:
+            out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+
+def concat_typed(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    """Append typed frames, widening categories instead of falling back to object."""
+    if a.empty or b.empty:
+        return b if a.empty else a
+    a, b = a.copy(deep=False), b.copy(deep=False)
+    for col in a.columns.intersection(b.columns):
+        ca, cb = a[col].dtype, b[col].dtype
+        if isinstance(ca, pd.CategoricalDtype) and isinstance(cb, pd.CategoricalDtype) and not ca.categories.equals(cb.categories):
+            known = set(ca.categories)
+            cats = list(ca.categories) + [c for c in cb.categories if c not in known]
+            ordered = ca.ordered and cb.ordered and len(cats) == len(known)
+            a[col] = a[col].cat.set_categories(cats, ordered=ordered)
+            b[col] = b[col].cat.set_categories(cats, ordered=ordered)
+    return pd.concat([a, b], ignore_index=True)
+
+
+def ordinal(s: pd.Series) -> pd.Series:
+    """Likert answers as ordinal codes 0..5 (float, NaN where missing or unknown)."""
+    if isinstance(s.dtype, pd.CategoricalDtype) and s.cat.ordered:
+        codes = s.cat.codes.astype(float)
+        return codes.where(codes >= 0)
+    return as_text(s).map({v: i for i, v in enumerate(LIKERT)}).astype(float)
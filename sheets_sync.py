@@ -0,0 +1,413 @@
+# sheets_sync.py
+# -*- coding: utf-8 -*-
+"""Durable outbox for Google Sheets rows, a background worker that flushes it in batches,
+and the non-destructive header migration of the sheet."""
+import json
+import math
+import random
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Callable
+
+from metrics import count, span
+from writer import FileLock
+
+
+def _clean(v):
+    # NaN אינו JSON תקין — נשלח כתא ריק
+    if isinstance(v, float) and math.isnan(v):
+        return None
+    return v
+
+
+def sheet_values(row: dict, columns: list[str]) -> list:
+    """A row as the cell values appended to the sheet, in `columns` order."""
+    return json.loads(json.dumps([_clean(row.get(c, "")) for c in columns], ensure_ascii=False, default=str))
+
+
+# עמודות שנשלחות כטקסט: USER_ENTERED היה מפרש את התאריך לפי האזור של הגיליון (יום/חודש או חודש/יום)
+TEXT_COLUMNS = ("תאריך שליחה",)
+
+
+def user_entered(values: list, columns: list[str], text_columns: tuple = TEXT_COLUMNS) -> list:
+    """Cell values for a USER_ENTERED append, with the text columns marked as text (leading apostrophe)."""
+    text = {i for i, c in enumerate(columns) if c in text_columns}
+    return [f"'{v}" if i in text and isinstance(v, str) and v else v for i, v in enumerate(values)]
+
+
+class SheetsOutbox:
+    """Rows waiting to be appended to the sheet, persisted in a small SQLite file."""
+
+    def __init__(self, path: Path, columns: list[str]):
+        self.path = Path(path)
+        self.columns = list(columns)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS outbox "
+                         "(id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, payload TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def put_many(self, rows: list[dict]) -> None:
+        now = time.time()
+        payloads = [(now, json.dumps([_clean(r.get(c, "")) for c in self.columns],
+                                     ensure_ascii=False, default=str)) for r in rows]
+        with closing(self._connect()) as conn:
+            conn.executemany("INSERT INTO outbox (created, payload) VALUES (?, ?)", payloads)
+            conn.commit()
+
+    def peek(self, limit: int) -> list[tuple[int, list]]:
+        with closing(self._connect()) as conn:
+            cur = conn.execute("SELECT id, payload FROM outbox ORDER BY id LIMIT ?", (limit,))
+            return [(i, json.loads(p)) for i, p in cur.fetchall()]
+
+    def rows(self) -> list[list]:
+        """Cell values of every pending row (oldest first)."""
+        with closing(self._connect()) as conn:
+            return [json.loads(p) for (p,) in conn.execute("SELECT payload FROM outbox ORDER BY id")]
+
+    def ack(self, upto_id: int) -> None:
+        """Remove every row up to and including `upto_id` and record the sync time."""
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM outbox WHERE id <= ?", (upto_id,))
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('last_sync', ?)", (str(time.time()),))
+            conn.execute("DELETE FROM meta WHERE key = 'last_error'")
+            conn.commit()
+
+    def set_error(self, message: str | None, key: str = "last_error") -> None:
+        """Record (or with None clear) the last error of the sync or, with key="reconcile_error", of reconcile."""
+        with closing(self._connect()) as conn:
+            if message is None:
+                conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+            else:
+                conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, message))
+            conn.commit()
+
+    def status(self) -> dict:
+        """Queue depth, age of the oldest pending row, last successful sync, last error and last reconcile error."""
+        with closing(self._connect()) as conn:
+            depth, oldest = conn.execute("SELECT COUNT(*), MIN(created) FROM outbox").fetchone()
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        now = time.time()
+        last_sync = float(meta["last_sync"]) if "last_sync" in meta else None
+        return {
+            "depth": depth,
+            "lag_seconds": (now - oldest) if oldest else 0.0,
+            "last_sync": last_sync,
+            "last_error": meta.get("last_error"),
+            "reconcile_error": meta.get("reconcile_error"),
+        }
+
+
+def migrate_header(ws, columns: list[str]) -> bool:
+    """Make the first row start with `columns` without losing data; returns False if it already did.
+
+    Columns that only moved are rewritten under their header in one bulk read
+    and one bulk write; columns the sheet has and `columns` does not are kept
+    after them. Never clears the sheet.
+    """
+    columns = list(columns)
+    header = ws.row_values(1)
+    if header[:len(columns)] == columns:
+        return False
+    if header == columns[:len(header)]:
+        # כותרות חדשות בסוף (או גיליון ריק) — רק השורה הראשונה משתנה
+        _fit_columns(ws, len(columns))
+        ws.update([columns], "A1", value_input_option="USER_ENTERED")
+        return True
+    values = ws.get_all_values()
+    width = max(len(r) for r in values)
+    pos: dict[str, int] = {}
+    for i, h in enumerate(header):
+        pos.setdefault(h, i)
+    moved = {pos[c] for c in columns if c in pos}
+    extra = [i for i in range(width) if i not in moved]
+    source = [pos.get(c) for c in columns] + extra
+    names = columns + [header[i] if i < len(header) else "" for i in extra]
+    grid = [names] + [[r[i] if i is not None and i < len(r) else "" for i in source] for r in values[1:]]
+    _fit_columns(ws, len(names))
+    ws.update(grid, "A1", value_input_option="USER_ENTERED")
+    return True
+
+
+def _fit_columns(ws, width: int) -> None:
+    if width > ws.col_count:
+        ws.add_cols(width - ws.col_count)
+
+
+def is_retryable(exc: Exception) -> bool:
+    """429 (quota) and 5xx from the Sheets API, or a network failure."""
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code == 429 or code >= 500
+    return isinstance(exc, (ConnectionError, TimeoutError, OSError)) or \
+        type(exc).__module__.startswith(("requests", "urllib3"))
+
+
+_UPDATED_RANGE_RE = re.compile(r"![A-Z]+\d+(?::[A-Z]+(\d+))?$")
+
+
+def last_row_of(append_response) -> int | None:
+    """Last written row number from a values_append response ('Sheet1!A1001:AN1200' -> 1200)."""
+    try:
+        rng = append_response["updates"]["updatedRange"]
+    except (KeyError, TypeError):
+        return None
+    m = _UPDATED_RANGE_RE.search(rng)
+    if not m:
+        return None
+    return int(m.group(1) or re.search(r"(\d+)$", rng).group(1))
+
+
+def _rgb(r: float, g: float, b: float) -> dict:
+    return {"red": r, "green": g, "blue": b}
+
+
+class SheetStyler:
+    """Header, zebra and ID-column styling sent as a single batch_update.
+
+    Ranges are sized from the number of columns and from the last data row,
+    rounded up to `row_step`, and are only extended when the data outgrows
+    them, so calling `apply` after every append is normally free.
+    """
+
+    def __init__(self, columns: list[str], id_column: str, row_step: int = 1000):
+        self.ncols = len(columns)
+        self.id_col = columns.index(id_column)
+        self.row_step = row_step
+        self._styled: dict[int, int] = {}   # sheetId -> מספר השורות שעוצבו
+
+    def _grid(self, sheet_id: int, start_row: int, end_row: int,
+              start_col: int = 0, end_col: int | None = None) -> dict:
+        return {"sheetId": sheet_id, "startRowIndex": start_row, "endRowIndex": end_row,
+                "startColumnIndex": start_col, "endColumnIndex": self.ncols if end_col is None else end_col}
+
+    def _zebra_rule(self, sheet_id: int, rows: int) -> dict:
+        return {
+            "ranges": [self._grid(sheet_id, 1, rows)],
+            "booleanRule": {
+                "condition": {"type": "CUSTOM_FORMULA", "values": [{"userEnteredValue": "=ISEVEN(ROW())"}]},
+                "format": {"backgroundColor": _rgb(0.95, 0.95, 0.95)},   # אפור בהיר
+            },
+        }
+
+    def _id_column(self, sheet_id: int, start_row: int, rows: int) -> dict:
+        return {"repeatCell": {
+            "range": self._grid(sheet_id, start_row, rows, self.id_col, self.id_col + 1),
+            "cell": {"userEnteredFormat": {"horizontalAlignment": "CENTER",
+                                           "backgroundColor": _rgb(0.9, 0.9, 0.9)}},   # אפור עדין
+            "fields": "userEnteredFormat(horizontalAlignment,backgroundColor)",
+        }}
+
+    def invalidate(self, ws) -> None:
+        self._styled.pop(ws.id, None)
+
+    def apply(self, ws, last_row: int = 1, force: bool = False) -> bool:
+        """Style the sheet up to `last_row`; returns False when nothing had to be sent."""
+        sid = ws.id
+        done = None if force else self._styled.get(sid)
+        if done is not None and last_row <= done:
+            return False
+        rows = -(-(last_row + 1) // self.row_step) * self.row_step
+        # הגדלת הרשת בבקשה עצמה כדי שהטווחים יהיו חוקיים
+        requests = [{"updateSheetProperties": {
+            "properties": {"sheetId": sid, "gridProperties": {
+                "rowCount": max(ws.row_count, rows), "columnCount": max(ws.col_count, self.ncols)}},
+            "fields": "gridProperties(rowCount,columnCount)",
+        }}]
+        if done is None:
+            # פעם ראשונה בתהליך: מחליפים את כל כללי העיצוב המותנה בכלל הזברה
+            meta = ws.spreadsheet.fetch_sheet_metadata(
+                {"fields": "sheets(properties(sheetId),conditionalFormats)"})
+            existing = next((len(sh.get("conditionalFormats", [])) for sh in meta.get("sheets", [])
+                             if sh["properties"]["sheetId"] == sid), 0)
+            requests += [{"deleteConditionalFormatRule": {"sheetId": sid, "index": i}}
+                         for i in reversed(range(existing))]
+            requests += [
+                {"repeatCell": {
+                    "range": self._grid(sid, 0, 1),
+                    "cell": {"userEnteredFormat": {
+                        "backgroundColor": _rgb(0.6, 0.4, 0.8),   # סגול בהיר
+                        "textFormat": {"bold": True, "foregroundColor": _rgb(1, 1, 1)},   # טקסט לבן מודגש
+                        "horizontalAlignment": "CENTER",
+                    }},
+                    "fields": "userEnteredFormat(backgroundColor,textFormat,horizontalAlignment)",
+                }},
+                {"addConditionalFormatRule": {"rule": self._zebra_rule(sid, rows), "index": 0}},
+                self._id_column(sid, 1, rows),
+            ]
+        else:
+            requests += [
+                {"updateConditionalFormatRule": {"sheetId": sid, "index": 0,
+                                                 "rule": self._zebra_rule(sid, rows)}},
+                self._id_column(sid, done, rows),
+            ]
+        ws.spreadsheet.batch_update({"requests": requests})
+        self._styled[sid] = rows
+        return True
+
+
+class SheetsConnection:
+    """Process-wide worksheet handle: connects lazily, reconnects after a failure
+    and remembers that the header row was verified, so reruns and submits do not
+    repeat the authorisation or the `row_values(1)` round-trip.
+    """
+
+    def __init__(self, connect: Callable[[], object], ensure_header: Callable[[object], None],
+                 retry_after: float = 30.0):
+        self._connect = connect
+        self._ensure_header = ensure_header
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._ws = None
+        self._header_ok = False
+        self._failed_at = 0.0
+        self.last_error: str | None = None
+
+    def worksheet(self):
+        """The cached worksheet, or None if connecting failed (retried after `retry_after` seconds)."""
+        with self._lock:
+            if self._ws is None and time.time() - self._failed_at >= self.retry_after:
+                try:
+                    self._ws = self._connect()
+                    self.last_error = None
+                except Exception as e:
+                    self._failed_at = time.time()
+                    self.last_error = f"{type(e).__name__}: {e}"
+            return self._ws
+
+    def ensure_header(self, ws) -> None:
+        with self._lock:
+            if self._header_ok:
+                return
+            self._ensure_header(ws)
+            self._header_ok = True
+
+    def invalidate(self) -> None:
+        """Drop the handle after an API failure; the next call reconnects and re-checks the header."""
+        with self._lock:
+            self._ws = None
+            self._header_ok = False
+            self._failed_at = 0.0
+
+
+class SheetsSyncWorker:
+    """Background thread that appends outbox rows to the worksheet, one API call per batch.
+
+    The header is verified once per connection, before the first batch.
+    Failed batches stay in the outbox and are retried with exponential backoff.
+    When the outbox is empty, `reconcile(ws)` (if given) runs once after start
+    and then every `reconcile_every` seconds; it takes the lock itself. A failed
+    reconciliation is recorded as the outbox's reconcile_error and waits for the
+    next interval, without backing off the flushing.
+    """
+
+    def __init__(self, outbox: SheetsOutbox, connection: SheetsConnection, lock_path: Path,
+                 batch_size: int = 200, idle_seconds: float = 2.0,
+                 base_backoff: float = 1.0, max_backoff: float = 120.0,
+                 styler: SheetStyler | None = None,
+                 reconcile: Callable[[object], object] | None = None, reconcile_every: float = 3600.0):
+        self.outbox = outbox
+        self.connection = connection
+        self.styler = styler
+        self.reconcile = reconcile
+        self.reconcile_every = reconcile_every
+        self._reconciled_at: float | None = None
+        self.last_style_error: str | None = None
+        self._lock = FileLock(lock_path)
+        self.batch_size = batch_size
+        self.idle_seconds = idle_seconds
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sheets-sync", daemon=True)
+        self._thread.start()
+
+    def notify(self) -> None:
+        """Wake the worker right away (called after new rows were queued)."""
+        self._wake.set()
+
+    def flush_once(self) -> int:
+        """Send one batch; returns the number of rows appended."""
+        with span("sheets", call="connect"):
+            ws = self.connection.worksheet()
+        if ws is None:
+            return 0
+        with self._lock:
+            batch = self.outbox.peek(self.batch_size)
+            if not batch:
+                return 0
+            with span("sheets", call="header"):
+                self.connection.ensure_header(ws)
+            with span("sheets", call="append_rows"):
+                res = ws.append_rows([user_entered(values, self.outbox.columns) for _, values in batch],
+                                     value_input_option="USER_ENTERED")
+            self.outbox.ack(batch[-1][0])
+            count("sheets_rows", by=len(batch))
+        if self.styler is not None:
+            last_row = last_row_of(res)
+            if last_row:
+                # העיצוב קוסמטי — כשל בו לא נחשב כשל סנכרון (השורות כבר נשלחו), ינוסה שוב בפעם הבאה
+                try:
+                    with span("sheets", call="style"):
+                        self.styler.apply(ws, last_row)
+                except Exception as e:
+                    self.styler.invalidate(ws)
+                    self.last_style_error = f"{type(e).__name__}: {e}"
+                    count("sheets_failures", error=type(e).__name__, call="style")
+        return len(batch)
+
+    def reconcile_due(self) -> bool:
+        """Run the reconciliation if it is due and nothing is waiting; returns True if it ran."""
+        if self.reconcile is None or (self._reconciled_at is not None and
+                                      time.time() - self._reconciled_at < self.reconcile_every):
+            return False
+        ws = self.connection.worksheet()
+        if ws is None or self.outbox.status()["depth"]:
+            return False
+        # כשל בהשוואה נרשם בנפרד ואינו מעכב את שליחת התור; הניסיון הבא — אחרי המרווח הרגיל
+        self._reconciled_at = time.time()
+        try:
+            with self._lock:
+                self.connection.ensure_header(ws)
+            with span("sheets", call="reconcile"):
+                self.reconcile(ws)
+        except Exception as e:
+            count("sheets_failures", error=type(e).__name__, call="reconcile")
+            self.outbox.set_error(f"{type(e).__name__}: {e}", key="reconcile_error")
+            return False
+        self.outbox.set_error(None, key="reconcile_error")
+        return True
+
+    def _run(self) -> None:
+        failures = 0
+        while True:
+            try:
+                sent = self.flush_once()
+                if sent < self.batch_size:
+                    self.reconcile_due()
+            except Exception as e:
+                # התחברות מחדש ובדיקת כותרות בניסיון הבא
+                self.connection.invalidate()
+                self.outbox.set_error(f"{type(e).__name__}: {e}")
+                count("sheets_failures", error=type(e).__name__)
+                failures += 1
+                # שגיאות שאינן זמניות (למשל הרשאות) — ממתינים את הזמן המקסימלי
+                delay = self.max_backoff if not is_retryable(e) else \
+                    min(self.max_backoff, self.base_backoff * 2 ** (failures - 1))
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                continue
+            failures = 0
+            if sent < self.batch_size:
+                self._wake.wait(self.idle_seconds)
+                self._wake.clear()
@@ -0,0 +1,168 @@
+# simulation.py
+# -*- coding: utf-8 -*-
+"""What-if placement scenarios: many seeded replications over a process pool.
+
+The input arrays (rank matrix, eligibility, grades, motivation, partner graph)
+are placed once in shared memory; workers attach to them in the pool
+initializer, so a task only carries its capacities, policy and seeds.
+"""
+import itertools
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from config import RANK_COUNT, SITES
+from placement import (
+    OUTSIDE_RANK, deferred_acceptance, eligibility, grades, motivation_scores,
+    partner_pairs, prepare, priority_from, rank_matrix,
+)
+
+# עמודות התפלגות: דירוג 1..3, מחוץ לדירוג, לא שובץ
+N_OUTCOMES = OUTSIDE_RANK + 1
+NO_FIRST_CHOICE = "ללא בחירה ראשונה"
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    capacities: tuple[int, ...]       # לפי סדר SITES
+    policy: str = "grade"
+
+
+# =========================
+# זיכרון משותף
+# =========================
+def _share(arrays: dict[str, np.ndarray]) -> tuple[list, dict]:
+    blocks, specs = [], {}
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+        np.ndarray(arr.shape, arr.dtype, buffer=shm.buf)[...] = arr
+        blocks.append(shm)
+        specs[name] = (shm.name, arr.shape, arr.dtype.str)
+    return blocks, specs
+
+
+_W: dict = {}   # מצב העובד: מערכים משותפים + גרף בני זוג
+
+
+def _attach(specs: dict) -> None:
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _W["_shm_" + name] = shm   # שמירת הפניה כדי שהזיכרון לא ישוחרר
+        _W[name] = np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+    indptr, indices = _W["p_indptr"], _W["p_indices"]
+    _W["partners"] = {i: set(indices[indptr[i]:indptr[i + 1]].tolist())
+                      for i in range(len(indptr) - 1) if indptr[i + 1] > indptr[i]}
+
+
+def _replicate(capacities: tuple[int, ...], policy: str, seeds: list[int]) -> tuple[np.ndarray, np.ndarray]:
+    """Run the given seeds; returns per-site outcome counts and per-replication first-choice shares."""
+    R, E = _W["R"], _W["E"]
+    capacity = np.asarray(capacities)
+    # שורה נוספת בסוף: לא שובצו ואין להם מוסד בדירוג 1
+    counts = np.zeros((R.shape[1] + 1, N_OUTCOMES), dtype=np.int64)
+    has_first = (R == 1).any(axis=1)
+    first_pick = np.where(has_first, np.argmax(R == 1, axis=1), R.shape[1])
+    first_share = np.empty(len(seeds))
+    for k, seed in enumerate(seeds):
+        prio = priority_from(policy, _W["grade"], _W["motivation"], np.random.default_rng(seed))
+        assigned = deferred_acceptance(R, E, capacity, prio, _W["partners"])
+        ok = assigned >= 0
+        achieved = np.zeros(len(assigned), dtype=np.int64)
+        achieved[ok] = R[np.flatnonzero(ok), assigned[ok]]
+        achieved[ok & (achieved == 0)] = OUTSIDE_RANK
+        # לא שובצו — נספרים לפי מוסד הדירוג הראשון שלהם (או בשורת "ללא בחירה ראשונה")
+        site = np.where(ok, assigned, first_pick)
+        outcome = np.where(ok, achieved - 1, N_OUTCOMES - 1)
+        np.add.at(counts, (site, outcome), 1)
+        first_share[k] = (achieved == 1).mean() if len(achieved) else 0.0
+    return counts, first_share
+
+
+def _partner_csr(partners: dict[int, set[int]], n: int) -> tuple[np.ndarray, np.ndarray]:
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    for i, ks in partners.items():
+        indptr[i + 1] = len(ks)
+    indptr = np.cumsum(indptr)
+    indices = np.empty(indptr[-1], dtype=np.int64)
+    for i, ks in partners.items():
+        indices[indptr[i]:indptr[i + 1]] = sorted(ks)
+    return indptr, indices
+
+
+# =========================
+# הרצה
+# =========================
+def run_scenarios(df_master: pd.DataFrame, scenarios: list[Scenario], replications: int = 200,
+                  processes: int | None = None, base_seed: int = 0,
+                  sites: list[str] = SITES) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Run every scenario `replications` times with seeds base_seed..base_seed+replications-1.
+
+    Returns (overview per scenario, per-site distribution of achieved ranks).
+    Deterministic for a given base_seed, whatever the number of processes.
+    """
+    df = prepare(df_master)
+    R = rank_matrix(df, sites)
+    indptr, indices = _partner_csr(partner_pairs(df), len(df))
+    blocks, specs = _share({
+        "R": R, "E": eligibility(df, sites), "grade": grades(df),
+        "motivation": motivation_scores(df), "p_indptr": indptr, "p_indices": indices,
+    })
+    processes = processes or os.cpu_count() or 1
+    seeds = list(range(base_seed, base_seed + replications))
+    chunk = max(1, -(-replications // (processes * 2)))
+    chunks = [seeds[i:i + chunk] for i in range(0, len(seeds), chunk)]
+    try:
+        with ProcessPoolExecutor(processes, mp_context=mp.get_context("spawn"),
+                                 initializer=_attach, initargs=(specs,)) as pool:
+            futures = {(sc, i): pool.submit(_replicate, sc.capacities, sc.policy, ch)
+                       for sc in scenarios for i, ch in enumerate(chunks)}
+            overview, per_site = [], []
+            for sc in scenarios:
+                parts = [futures[(sc, i)].result() for i in range(len(chunks))]
+                counts = sum(p[0] for p in parts)
+                shares = np.concatenate([p[1] for p in parts])
+                per_site.append(_site_table(sc, counts, replications, sites))
+                total = counts.sum(axis=0) / max(1, replications)
+                overview.append({
+                    "תרחיש": sc.name, "מדיניות": sc.policy, "קיבולת כוללת": int(sum(sc.capacities)),
+                    **{f"ממוצע בדירוג {r}": total[r - 1] for r in range(1, RANK_COUNT + 1)},
+                    "ממוצע מחוץ לדירוג": total[OUTSIDE_RANK - 1],
+                    "ממוצע לא שובצו": total[-1],
+                    "% דירוג 1 (p5)": 100 * np.percentile(shares, 5),
+                    "% דירוג 1 (חציון)": 100 * np.percentile(shares, 50),
+                    "% דירוג 1 (p95)": 100 * np.percentile(shares, 95),
+                })
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    return pd.DataFrame(overview), pd.concat(per_site, ignore_index=True)
+
+
+def _site_table(sc: Scenario, counts: np.ndarray, replications: int, sites: list[str]) -> pd.DataFrame:
+    """Mean outcome counts per site; students left unplaced without a first choice get their own
+    row (no capacity), only when there are any."""
+    mean = counts / max(1, replications)
+    labels = [f"דירוג {r}" for r in range(1, RANK_COUNT + 1)] + ["מחוץ לדירוג", "לא שובצו"]
+    out = pd.DataFrame(mean, columns=labels)
+    out.insert(0, "מוסד", [*sites, NO_FIRST_CHOICE])
+    out.insert(0, "תרחיש", sc.name)
+    out.insert(2, "קיבולת", pd.array([*sc.capacities, None], dtype="Int64"))
+    return out if counts[-1].any() else out.iloc[:-1]
+
+
+def scenario_grid(base_capacities: dict[str, int], scales: list[float], policies: list[str],
+                  sites: list[str] = SITES) -> list[Scenario]:
+    """Every combination of a capacity scale and a tie-breaking policy."""
+    out = []
+    for scale, policy in itertools.product(scales, policies):
+        caps = tuple(int(round(base_capacities.get(s, 0) * scale)) for s in sites)
+        out.append(Scenario(f"{policy} ×{scale:g}", caps, policy))
+    return out
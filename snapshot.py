@@ -0,0 +1,132 @@
+# snapshot.py
+# -*- coding: utf-8 -*-
+"""Columnar Parquet snapshot of the master, in the typed schema, kept up to date incrementally.
+
+Layout of the snapshot directory:
+    part_<from>_<to>.parquet   rows with seq in [from, to], typed (schema.to_typed), with a "seq" column
+    state.json                 last exported seq, the part files and the seqs replaced since
+
+`refresh` (caller holds the write lock) writes only the rows committed since
+the previous refresh as a new part and records replaced rows as tombstones;
+when there are many parts or tombstones the parts are compacted into one.
+`read` memory-maps the parts and reads only the requested columns.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from schema import concat_typed, to_typed
+from storage import MasterStore
+
+MAX_PARTS = 16
+MAX_DELETED_SHARE = 0.2
+
+
+class ParquetSnapshot:
+    def __init__(self, directory: Path):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.state_path = self.dir / "state.json"
+        self._mutex = threading.Lock()
+        self._cache: dict[tuple, pd.DataFrame] = {}   # (columns, mtime של state) -> frame
+
+    # =========================
+    # מצב
+    # =========================
+    def _state(self) -> dict:
+        if self.state_path.exists():
+            return json.loads(self.state_path.read_text(encoding="utf-8"))
+        return {"seq": 0, "rows": 0, "parts": [], "deleted": []}
+
+    def _save_state(self, state: dict) -> None:
+        tmp = self.state_path.with_name(f"state.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(state), encoding="utf-8")
+        tmp.replace(self.state_path)
+
+    def seq(self) -> int:
+        return self._state()["seq"]
+
+    # =========================
+    # כתיבה
+    # =========================
+    def _write_part(self, df: pd.DataFrame) -> str:
+        name = f"part_{int(df['seq'].iloc[0]):08d}_{int(df['seq'].iloc[-1]):08d}.parquet"
+        tmp = self.dir / (name + ".tmp")
+        table = pa.Table.from_pandas(to_typed(df), preserve_index=False)
+        pq.write_table(table, tmp, compression="zstd" if pa.Codec.is_available("zstd") else "snappy")
+        tmp.replace(self.dir / name)
+        return name
+
+    def refresh(self, store: MasterStore) -> bool:
+        """Append the rows committed since the last refresh (caller holds the write lock)."""
+        state = self._state()
+        new = store.rows_since(state["seq"])
+        deleted = store.deleted_since(state["seq"])
+        if new.empty and not deleted:
+            return False
+        if not new.empty:
+            state["parts"].append(self._write_part(new))
+            state["seq"] = int(new["seq"].iloc[-1])
+            state["rows"] += len(new)
+        state["deleted"] = sorted(set(state["deleted"]) | set(deleted))
+        if len(state["parts"]) > MAX_PARTS or len(state["deleted"]) > MAX_DELETED_SHARE * max(1, state["rows"]):
+            state = self._compact(state)
+        self._save_state(state)
+        return True
+
+    def _compact(self, state: dict) -> dict:
+        df = self._read_parts(state, None)
+        old = state["parts"]
+        parts = [self._write_part(df)] if not df.empty else []
+        for name in old:
+            if name not in parts:
+                (self.dir / name).unlink(missing_ok=True)
+        return {"seq": state["seq"], "rows": len(df), "parts": parts, "deleted": []}
+
+    def rebuild(self, store: MasterStore) -> None:
+        """Drop the parts and export the whole master again (caller holds the write lock)."""
+        state = self._state()
+        for name in state["parts"]:
+            (self.dir / name).unlink(missing_ok=True)
+        self._save_state({"seq": 0, "rows": 0, "parts": [], "deleted": []})
+        self.refresh(store)
+
+    # =========================
+    # קריאה
+    # =========================
+    def _read_parts(self, state: dict, columns: list[str] | None) -> pd.DataFrame:
+        cols = None if columns is None else ["seq", *[c for c in columns if c != "seq"]]
+        df = pd.DataFrame()
+        for name in state["parts"]:
+            part = pq.read_table(self.dir / name, columns=cols, memory_map=True).to_pandas()
+            df = concat_typed(df, part)
+        if df.empty:
+            return df
+        if state["deleted"]:
+            df = df[~df["seq"].isin(state["deleted"])]
+        return df.reset_index(drop=True)
+
+    def read(self, columns: list[str] | None = None) -> pd.DataFrame:
+        """Typed master (only `columns` if given), shared between callers — do not modify in place."""
+        try:
+            mtime = self.state_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return pd.DataFrame(columns=columns) if columns else pd.DataFrame()
+        key = (tuple(columns) if columns else None, mtime)
+        with self._mutex:
+            df = self._cache.get(key)
+            if df is None:
+                try:
+                    df = self._read_parts(self._state(), columns)
+                except FileNotFoundError:
+                    # דחיסה בתהליך אחר החליפה את הקבצים בזמן הקריאה — קריאה חוזרת לפי המצב החדש
+                    df = self._read_parts(self._state(), columns)
+                df = df.drop(columns="seq", errors="ignore")
+                self._cache = {k: v for k, v in self._cache.items() if k[1] == mtime}
+                self._cache[key] = df
+            return df
@@ -0,0 +1,238 @@
+# stats.py
+# -*- coding: utf-8 -*-
+"""Running aggregates over the master (counters and sums), updated per submission and persisted as JSON.
+
+Usage:
+    python stats.py show                 print the persisted aggregates
+    python stats.py verify               recompute from the log and report differences
+    python stats.py rebuild              recompute from the log and overwrite the file
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+import pandas as pd
+
+from config import COLUMNS_ORDER, DEDUPE_POLICY, LOG_DIR, RANK_COUNT, STATS_FILE, WRITE_LOCK_FILE
+from schema import as_text
+from storage import KEEP_ALL, KEEP_LATEST, normalize_id
+
+LIST_SEP = "; "
+TRACK_COL = "מסלול לימודים"
+GRADE_COL = "ממוצע"
+
+# שם מונה -> עמודה; עמודות רשימה ("; ") נספרות לפי פריט
+COUNTED = {
+    **{f"rank_{i}": f"מקום הכשרה {i}" for i in range(1, RANK_COUNT + 1)},
+    "top_domain": "תחום מוביל",
+    "study_year": "שנת לימודים",
+    "track": TRACK_COL,
+}
+LISTED = {
+    "domains": "תחומים מועדפים",
+    "adjustments": "התאמות",
+}
+
+
+def _is_blank(v) -> bool:
+    return v is None or (isinstance(v, float) and v != v) or str(v).strip() == ""
+
+
+def _to_float(v) -> float | None:
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if f != f else f
+
+
+class RunningStats:
+    """Counters keyed by name -> category -> value.
+
+    `add(row, +1)` / `add(row, -1)` cost O(number of fields), independent of
+    the number of submissions; `from_frame` recomputes the same counters in a
+    single vectorised pass for verification.
+    """
+
+    def __init__(self, counters: dict | None = None):
+        self.counters: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for name, values in (counters or {}).items():
+            self.counters[name].update(values)
+
+    # =========================
+    # עדכון הדרגתי
+    # =========================
+    def add(self, row: dict, sign: int = 1) -> None:
+        c = self.counters
+        c["total"][""] += sign
+        for name, col in COUNTED.items():
+            v = row.get(col)
+            if not _is_blank(v):
+                c[name][str(v)] += sign
+        for name, col in LISTED.items():
+            v = row.get(col)
+            if not _is_blank(v):
+                for item in str(v).split(LIST_SEP):
+                    if item.strip():
+                        c[name][item.strip()] += sign
+        grade = _to_float(row.get(GRADE_COL))
+        if grade is not None:
+            track = "" if _is_blank(row.get(TRACK_COL)) else str(row.get(TRACK_COL))
+            c["grade_sum"][track] += sign * grade
+            c["grade_n"][track] += sign
+
+    # =========================
+    # בנייה מחדש (וקטורית)
+    # =========================
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "RunningStats":
+        out = cls()
+        c = out.counters
+        c["total"][""] = float(len(df))
+        for name, col in COUNTED.items():
+            if col in df:
+                s = as_text(df[col])
+                s = s[s != ""]
+                c[name].update(s.value_counts().astype(float).to_dict())
+        for name, col in LISTED.items():
+            if col in df:
+                items = as_text(df[col]).str.split(LIST_SEP).explode().str.strip()
+                items = items[items != ""]
+                c[name].update(items.value_counts().astype(float).to_dict())
+        if GRADE_COL in df:
+            grade = pd.to_numeric(df[GRADE_COL], errors="coerce")
+            track = as_text(df[TRACK_COL]) if TRACK_COL in df else pd.Series("", index=df.index)
+            g = pd.DataFrame({"track": track, "grade": grade}).dropna(subset=["grade"])
+            agg = g.groupby("track")["grade"].agg(["sum", "count"])
+            c["grade_sum"].update(agg["sum"].astype(float).to_dict())
+            c["grade_n"].update(agg["count"].astype(float).to_dict())
+        return out
+
+    @classmethod
+    def from_log(cls, df_log: pd.DataFrame, policy: str = KEEP_LATEST,
+                 id_column: str = "תעודת זהות") -> "RunningStats":
+        """Recompute the master aggregates from the append-only log under the given dedupe policy."""
+        if policy != KEEP_ALL and id_column in df_log and not df_log.empty:
+            ids = df_log[id_column].map(normalize_id)
+            keep = "last" if policy == KEEP_LATEST else "first"
+            dup = ids.duplicated(keep=keep) & (ids != "")
+            df_log = df_log[~dup]
+        return cls.from_frame(df_log)
+
+    # =========================
+    # השוואה / תצוגה
+    # =========================
+    def diff(self, other: "RunningStats", tol: float = 1e-6) -> list[tuple[str, str, float, float]]:
+        """(counter, key, self, other) for every value that differs."""
+        out = []
+        for name in sorted(set(self.counters) | set(other.counters)):
+            a, b = self.counters.get(name, {}), other.counters.get(name, {})
+            for key in sorted(set(a) | set(b)):
+                x, y = a.get(key, 0.0), b.get(key, 0.0)
+                if abs(x - y) > tol:
+                    out.append((name, key, x, y))
+        return out
+
+    def table(self, name: str, label: str) -> pd.DataFrame:
+        values = {k: v for k, v in self.counters.get(name, {}).items() if v}
+        return (pd.DataFrame({label: list(values), "מספר": [int(round(v)) for v in values.values()]})
+                .sort_values("מספר", ascending=False, ignore_index=True))
+
+    def grade_by_track(self) -> pd.DataFrame:
+        s, n = self.counters.get("grade_sum", {}), self.counters.get("grade_n", {})
+        rows = [{"מסלול": k or "—", "ממוצע": s.get(k, 0.0) / v, "מספר": int(round(v))} for k, v in n.items() if v]
+        return pd.DataFrame(rows, columns=["מסלול", "ממוצע", "מספר"])
+
+    @property
+    def total(self) -> int:
+        return int(round(self.counters.get("total", {}).get("", 0)))
+
+    def to_json(self) -> dict:
+        return {name: {k: v for k, v in values.items() if v} for name, values in self.counters.items()}
+
+
+class StatsFile:
+    """RunningStats persisted next to the data; reloaded when another process changed the file."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._mtime_ns = None
+        self._mutex = threading.Lock()
+        self.stats = RunningStats()
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def load(self) -> RunningStats:
+        with self._mutex:
+            self._reload_if_changed()
+            return self.stats
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime_ns:
+            self.stats = RunningStats(json.loads(self.path.read_text(encoding="utf-8")))
+            self._mtime_ns = mtime
+
+    def apply(self, added: list[dict], removed: list[dict]) -> None:
+        """Update the counters with added/removed rows and persist (caller holds the write lock)."""
+        with self._mutex:
+            self._reload_if_changed()
+            for row in removed:
+                self.stats.add(row, -1)
+            for row in added:
+                self.stats.add(row, +1)
+            self._save()
+
+    def replace(self, stats: RunningStats) -> None:
+        with self._mutex:
+            self.stats = stats
+            self._save()
+
+    def _save(self) -> None:
+        tmp = self.path.with_name(self.path.name + f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self.stats.to_json(), ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.path)
+        self._mtime_ns = self.path.stat().st_mtime_ns
+
+
+def main(argv: list[str] | None = None) -> int:
+    from submission_log import SegmentedLog
+    from writer import FileLock
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--file", type=Path, default=STATS_FILE)
+    ap.add_argument("--log-dir", type=Path, default=LOG_DIR)
+    ap.add_argument("--policy", default=DEDUPE_POLICY)
+    ap.add_argument("cmd", choices=["show", "verify", "rebuild"])
+    args = ap.parse_args(argv)
+
+    sf = StatsFile(args.file)
+    if args.cmd == "show":
+        print(json.dumps(sf.load().to_json(), ensure_ascii=False, indent=1))
+        return 0
+    log = SegmentedLog(args.log_dir, COLUMNS_ORDER)
+    if args.cmd == "rebuild":
+        # קריאה והחלפה באותה נעילה — שמירה שנוספת בינתיים לא תאבד מהמונים
+        with FileLock(WRITE_LOCK_FILE):
+            rebuilt = RunningStats.from_log(log.read_all(), args.policy)
+            sf.replace(rebuilt)
+        print(f"rebuilt from {args.log_dir}: {rebuilt.total} rows")
+        return 0
+    rebuilt = RunningStats.from_log(log.read_all(), args.policy)
+    diff = sf.load().diff(rebuilt)
+    for name, key, x, y in diff:
+        print(f"{name:12} {key!r:40} stored={x:g} log={y:g}")
+    print("ok" if not diff else f"{len(diff)} differences")
+    return 1 if diff else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
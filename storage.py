@@ -0,0 +1,279 @@
+# storage.py
+# -*- coding: utf-8 -*-
+"""Embedded SQLite store for the master table (WAL mode, append-only inserts)."""
+import json
+import sqlite3
+import threading
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+
+# מדיניות כפילויות לפי תעודת זהות
+KEEP_LATEST = "keep_latest"   # הגשה חדשה מחליפה את הקודמת
+KEEP_FIRST  = "keep_first"    # נשמרת ההגשה הראשונה בלבד
+KEEP_ALL    = "keep_all"      # כל הגרסאות נשמרות במאסטר
+DEDUPE_POLICIES = (KEEP_LATEST, KEEP_FIRST, KEEP_ALL)
+
+
+def _q(name: str) -> str:
+    """Quote an identifier for SQLite (Hebrew column names, spaces, quotes)."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def normalize_id(v) -> str:
+    # ת"ז נקראת לעתים כמספר (אפסים מובילים נעלמים) — משווים אחרי ניקוי והשלמה ל-9 ספרות
+    if v is None or (isinstance(v, float) and v != v):
+        return ""
+    s = str(v).strip()
+    if s.endswith(".0"):
+        s = s[:-2]
+    return s.zfill(9) if s.isdigit() else s
+
+
+@dataclass(frozen=True)
+class CommitResult:
+    status: str                  # "inserted" / "replaced" / "kept_first" / "duplicate"
+    seq: int | None = None
+    replaced_id: str | None = None
+    previous: dict | None = field(default=None, compare=False, repr=False)   # השורה שהוחלפה
+
+    @property
+    def changed_master(self) -> bool:
+        return self.status in ("inserted", "replaced")
+
+
+@dataclass(frozen=True)
+class PendingWork:
+    """Follow-up steps (bit mask) a committed row still needs after the master transaction."""
+    id: int
+    status: str
+    seq: int | None
+    replaced_id: str | None
+    row: dict
+    previous: dict | None
+    steps: int
+
+
+class MasterStore:
+    """Master submissions table backed by SQLite.
+
+    Every submission is a single INSERT, so the cost of a submit does not grow
+    with the number of rows. The master DataFrame and the CSV file are derived
+    on demand from the table.
+    """
+
+    TABLE = "submissions"
+
+    def __init__(self, path: Path, columns: list[str], id_column: str = "תעודת זהות"):
+        self.path = Path(path)
+        self.columns = list(columns)
+        self.id_column = id_column
+        # אינדקס ת"ז -> seq אחרון, מתעדכן בהדרגה מהשורות שנוספו (גם ע"י תהליכים אחרים)
+        self._id_index: dict[str, int] = {}
+        self._seen_seq = 0
+        self._index_mutex = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # עמודות ללא טיפוס — SQLite שומר את הערך כפי שהוא (מספר/טקסט/NULL)
+            cols_sql = ", ".join(_q(c) for c in self.columns)
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} "
+                f"(seq INTEGER PRIMARY KEY AUTOINCREMENT, {cols_sql})"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS tokens (token TEXT PRIMARY KEY, seq INTEGER)")
+            # שורות שהוחלפו (seq שנמחק -> seq של השורה שהחליפה), לעדכון הדרגתי של עותקים נגזרים
+            conn.execute("CREATE TABLE IF NOT EXISTS deleted (seq INTEGER PRIMARY KEY, by_seq INTEGER)")
+            # שלבי המשך (גיבוי, יומן, סטטיסטיקות, תור) שעוד לא הסתיימו — נרשמים באותה טרנזקציה של השורה
+            conn.execute("CREATE TABLE IF NOT EXISTS pending (id INTEGER PRIMARY KEY AUTOINCREMENT, status TEXT, "
+                         "seq INTEGER, replaced_id TEXT, row TEXT, previous TEXT, steps INTEGER, error TEXT)")
+            # הוספת עמודות חדשות אם COLUMNS_ORDER התרחב
+            existing = {r[1] for r in conn.execute(f"PRAGMA table_info({self.TABLE})")}
+            for c in self.columns:
+                if c not in existing:
+                    conn.execute(f"ALTER TABLE {self.TABLE} ADD COLUMN {_q(c)}")
+            conn.commit()
+        self._cols_sql = ", ".join(_q(c) for c in self.columns)
+        self._insert_sql = (
+            f"INSERT INTO {self.TABLE} ({self._cols_sql}) "
+            f"VALUES ({', '.join('?' for _ in self.columns)})"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _values(self, row: dict) -> tuple:
+        return tuple(row.get(c) for c in self.columns)
+
+    # =========================
+    # כתיבה
+    # =========================
+    def append(self, row: dict) -> int:
+        """Insert one submission and return its sequence number."""
+        with closing(self._connect()) as conn:
+            cur = conn.execute(self._insert_sql, self._values(row))
+            conn.commit()
+            return cur.lastrowid
+
+    def append_many(self, rows: list[dict]) -> list[int]:
+        """Insert several submissions in a single transaction and return their sequence numbers."""
+        if not rows:
+            return []
+        with closing(self._connect()) as conn:
+            seqs = [conn.execute(self._insert_sql, self._values(r)).lastrowid for r in rows]
+            conn.commit()
+        return seqs
+
+    def _catch_up(self, conn: sqlite3.Connection) -> None:
+        cur = conn.execute(
+            f"SELECT seq, {_q(self.id_column)} FROM {self.TABLE} WHERE seq > ? ORDER BY seq",
+            (self._seen_seq,))
+        for seq, nat_id in cur:
+            key = normalize_id(nat_id)
+            if key:
+                self._id_index[key] = seq
+            self._seen_seq = seq
+
+    def commit(self, items: list[tuple[dict, str | None]], policy: str = KEEP_LATEST,
+               steps: dict[str, int] | None = None) -> list[CommitResult]:
+        """Insert submissions in one transaction, honouring idempotency tokens and the ID policy.
+
+        A token that was already committed makes the item a no-op. Under
+        keep_latest an existing row with the same ID is replaced (deleted and
+        re-inserted at the end); under keep_first the new row is not stored.
+        `steps` maps a result status to the follow-up steps the row needs; they
+        are recorded in the same transaction (see pending_work). Call while
+        holding the write lock.
+        """
+        if policy not in DEDUPE_POLICIES:
+            raise ValueError(f"unknown dedupe policy: {policy}")
+        results = []
+        with self._index_mutex, closing(self._connect()) as conn:
+            try:
+                self._catch_up(conn)
+                for row, token in items:
+                    if token and conn.execute("SELECT 1 FROM tokens WHERE token = ?", (token,)).fetchone():
+                        results.append(CommitResult("duplicate"))
+                        continue
+                    key = normalize_id(row.get(self.id_column))
+                    old = self._id_index.get(key) if key and policy != KEEP_ALL else None
+                    if old is not None and policy == KEEP_FIRST:
+                        res = CommitResult("kept_first", old)
+                    else:
+                        previous = None
+                        if old is not None:
+                            prev = conn.execute(f"SELECT {self._cols_sql} FROM {self.TABLE} WHERE seq = ?",
+                                                (old,)).fetchone()
+                            previous = dict(zip(self.columns, prev)) if prev else None
+                            conn.execute(f"DELETE FROM {self.TABLE} WHERE seq = ?", (old,))
+                        seq = conn.execute(self._insert_sql, self._values(row)).lastrowid
+                        if old is not None:
+                            conn.execute("INSERT OR REPLACE INTO deleted VALUES (?, ?)", (old, seq))
+                        if key:
+                            self._id_index[key] = seq
+                        self._seen_seq = seq
+                        res = CommitResult("replaced", seq, key, previous) if old is not None else CommitResult("inserted", seq)
+                    if token:
+                        conn.execute("INSERT INTO tokens VALUES (?, ?)", (token, res.seq))
+                    mask = (steps or {}).get(res.status, 0)
+                    if mask:
+                        conn.execute("INSERT INTO pending (status, seq, replaced_id, row, previous, steps) "
+                                     "VALUES (?, ?, ?, ?, ?, ?)",
+                                     (res.status, res.seq, res.replaced_id, json.dumps(row, default=str),
+                                      json.dumps(res.previous, default=str) if res.previous else None, mask))
+                    results.append(res)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                # האינדקס בזיכרון אולי עודכן חלקית — בנייה מחדש בפעם הבאה
+                self._id_index.clear()
+                self._seen_seq = 0
+                raise
+        return results
+
+    def pending_work(self) -> list[PendingWork]:
+        """Committed rows whose follow-up steps have not all finished, oldest first."""
+        with closing(self._connect()) as conn:
+            cur = conn.execute("SELECT id, status, seq, replaced_id, row, previous, steps FROM pending "
+                               "WHERE steps != 0 ORDER BY id")
+            return [PendingWork(i, st, seq, rid, json.loads(row), json.loads(prev) if prev else None, mask)
+                    for i, st, seq, rid, row, prev, mask in cur.fetchall()]
+
+    def work_done(self, ids: list[int], step: int) -> None:
+        """Clear `step` for these pending rows; rows with no steps left are removed."""
+        with closing(self._connect()) as conn:
+            conn.executemany("UPDATE pending SET steps = steps & ~? WHERE id = ?", [(step, i) for i in ids])
+            conn.execute("DELETE FROM pending WHERE steps = 0")
+            conn.commit()
+
+    def work_failed(self, ids: list[int], message: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.executemany("UPDATE pending SET error = ? WHERE id = ?", [(message, i) for i in ids])
+            conn.commit()
+
+    def pending_status(self) -> dict:
+        """Number of committed rows with follow-up steps still pending, and the last error."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT COUNT(*) FROM pending WHERE steps != 0").fetchone()[0]
+            error = conn.execute("SELECT error FROM pending WHERE error IS NOT NULL ORDER BY id DESC LIMIT 1").fetchone()
+        return {"rows": rows, "last_error": error[0] if error else None}
+
+    def import_dataframe(self, df: pd.DataFrame) -> int:
+        """Bulk-load an existing master DataFrame (e.g. the legacy CSV)."""
+        if df.empty:
+            return 0
+        df = df.reindex(columns=self.columns)
+        rows = df.astype(object).where(df.notna(), None).to_dict("records")
+        self.append_many(rows)
+        return len(rows)
+
+    # =========================
+    # קריאה
+    # =========================
+    def count(self) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {self.TABLE}").fetchone()[0]
+
+    def is_empty(self) -> bool:
+        return self.count() == 0
+
+    def last_seq(self) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {self.TABLE}").fetchone()[0]
+
+    def to_dataframe(self, upto: int | None = None, columns: list[str] | None = None) -> pd.DataFrame:
+        """Materialise the master view in COLUMNS_ORDER (optionally only rows with seq <= upto, or only
+        `columns`, which may include "seq")."""
+        cols_sql = ", ".join(_q(c) for c in (columns or self.columns))
+        where, params = ("WHERE seq <= ?", (upto,)) if upto is not None else ("", ())
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                f"SELECT {cols_sql} FROM {self.TABLE} {where} ORDER BY seq", conn, params=params)
+        return df
+
+    def rows_since(self, seq: int) -> pd.DataFrame:
+        """Rows with seq > `seq`, with their seq as the first column."""
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                f"SELECT seq, {self._cols_sql} FROM {self.TABLE} WHERE seq > ? ORDER BY seq", conn, params=(seq,))
+
+    def deleted_since(self, seq: int) -> list[int]:
+        """Seqs of rows removed by replacements committed after `seq`."""
+        with closing(self._connect()) as conn:
+            return [r[0] for r in conn.execute("SELECT seq FROM deleted WHERE by_seq > ?", (seq,))]
+
+    def mtime(self) -> float:
+        """Last modification time of the database (including the WAL file)."""
+        wal = self.path.with_name(self.path.name + "-wal")
+        return max(p.stat().st_mtime for p in (self.path, wal) if p.exists())
+
+    def export_csv(self, path: Path, force: bool = False) -> Path:
+        """Write the master view to a CSV file, only if the store changed since the last export."""
+        path = Path(path)
+        if force or not path.exists() or path.stat().st_mtime < self.mtime():
+            self.to_dataframe().to_csv(path, index=False, encoding="utf-8-sig")
+        return path
@@ -1,110 +1,64 @@
 # streamlit_app.py
 # -*- coding: utf-8 -*-
-import csv
-import re
+from __future__ import annotations
+
+import os
+import uuid
 from io import BytesIO
-from pathlib import Path
 from datetime import datetime
+from typing import TYPE_CHECKING
 import pytz
 import streamlit as st
-import pandas as pd
-
-# --- Google Sheets
-import gspread
-from google.oauth2.service_account import Credentials
-from gspread_formatting import (
-    CellFormat, Color, TextFormat,
-    ConditionalFormatRule, BooleanRule, BooleanCondition,
-    GridRange, format_cell_range, get_conditional_format_rules
+
+from config import (
+    DATA_DIR, BACKUP_DIR, CSV_FILE, WRITE_LOCK_FILE,
+    OUTBOX_FILE, SHEETS_LOCK_FILE, EXPORT_DIR,
+    SITES, RANK_COUNT, COLUMNS_ORDER, master_settings,
+    GENDERS, SOCIAL_AFFILIATIONS, MOTHER_TONGUES, STUDY_YEARS, TRACKS, PREV_TRAINING, DOMAINS, LIKERT,
 )
+from theme import APP_HEAD
+from metrics import REGISTRY, count, span
+from writer import FileLock, SubmissionWriter
+from sheets_sync import SheetsConnection, SheetsOutbox, SheetStyler, SheetsSyncWorker, migrate_header
+
+# pandas, Parquet, Google Sheets ו־XlsxWriter נטענים בעצלות — שלבי הטופס 1–5 אינם צריכים אותם;
+# הם נטענים בשליחה (submit_form / get_submission_writer) או במצב מנהל
+if TYPE_CHECKING:
+    from storage import CommitResult, MasterStore
+    from backups import BackupManager
+    from stats import StatsFile
+    from snapshot import ParquetSnapshot
+    from submission_log import SegmentedLog
+    from validation import Issue
+
 # =========================
 # הגדרות כלליות
 # =========================
 st.set_page_config(page_title="שאלון לסטודנטים – תשפ״ו", layout="centered")
-st.markdown("""
-<style>
-:root{
-  --ink:#0f172a; 
-  --muted:#475569; 
-  --ring:rgba(99,102,241,.25); 
-  --card:rgba(255,255,255,.85);
-}
-html, body, [class*="css"] { font-family: system-ui, "Segoe UI", Arial; }
-.stApp, .main, [data-testid="stSidebar"]{ direction:rtl; text-align:right; }
-[data-testid="stAppViewContainer"]{
-  background:
-    radial-gradient(1200px 600px at 8% 8%, #e0f7fa 0%, transparent 65%),
-    radial-gradient(1000px 500px at 92% 12%, #ede7f6 0%, transparent 60%),
-    radial-gradient(900px 500px at 20% 90%, #fff3e0 0%, transparent 55%);
-}
-.block-container{ padding-top:1.1rem; }
-[data-testid="stForm"]{
-  background:var(--card);
-  border:1px solid #e2e8f0;
-  border-radius:16px;
-  padding:18px 20px;
-  box-shadow:0 8px 24px rgba(2,6,23,.06);
-}
-[data-testid="stWidgetLabel"] p{ text-align:right; margin-bottom:.25rem; color:var(--muted); }
-[data-testid="stWidgetLabel"] p::after{ content: " :"; }
-input, textarea, select{ direction:rtl; text-align:right; }
-</style>
-""", unsafe_allow_html=True)
-st.markdown("""
-<link rel="preconnect" href="https://fonts.googleapis.com">
-<link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-<link href="https://fonts.googleapis.com/css2?family=Assistant:wght@300;400;600;700&family=Noto+Sans+Hebrew:wght@400;600&display=swap" rel="stylesheet">
-
-<style>
-:root { --app-font: 'Assistant', 'Noto Sans Hebrew', 'Segoe UI', -apple-system, sans-serif; }
-
-/* בסיס האפליקציה */
-html, body, .stApp, [data-testid="stAppViewContainer"], .main {
-  font-family: var(--app-font) !important;
-}
-
-/* ודא שכל הצאצאים יורשים את הפונט */
-.stApp * {
-  font-family: var(--app-font) !important;
-}
-
-/* רכיבי קלט/בחירה של Streamlit */
-div[data-baseweb], /* select/radio/checkbox */
-.stTextInput input,
-.stTextArea textarea,
-.stSelectbox div,
-.stMultiSelect div,
-.stRadio,
-.stCheckbox,
-.stButton > button {
-  font-family: var(--app-font) !important;
-}
-
-/* טבלאות DataFrame/Arrow */
-div[data-testid="stDataFrame"] div {
-  font-family: var(--app-font) !important;
-}
-
-/* כותרות */
-h1, h2, h3, h4, h5, h6 {
-  font-family: var(--app-font) !important;
-}
-</style>
-""", unsafe_allow_html=True)
+st.markdown(APP_HEAD, unsafe_allow_html=True)
 # =========================
 # נתיבים/סודות + התמדה ארוכת טווח
 # =========================
-DATA_DIR   = Path("data")
-BACKUP_DIR = DATA_DIR / "backups"
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+@st.cache_resource
+def prepare_data_dirs() -> None:
+    """Create the data directories once per process."""
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+
+prepare_data_dirs()
 
-CSV_FILE      = DATA_DIR / "שאלון_שיבוץ.csv"
-CSV_LOG_FILE  = DATA_DIR / "שאלון_שיבוץ_log.csv"
 ADMIN_PASSWORD = st.secrets.get("ADMIN_PASSWORD", "rawan_0304")
 
+@st.cache_resource
+def get_master_settings() -> dict:
+    """DEDUPE_POLICY and backup retention, read from the secrets file — the same source as the ingestion service."""
+    return master_settings()
+
+DEDUPE_POLICY = get_master_settings()["DEDUPE_POLICY"]
+
 query_params = st.query_params
 is_admin_mode = query_params.get("admin", ["0"])[0] == "1"
+count("script_runs", page="admin" if is_admin_mode else "student")
 
 # =========================
 # Google Sheets הגדרות
@@ -116,192 +70,453 @@ scope = [
     "https://www.googleapis.com/auth/drive"
 ]
 
-try:
+def connect_worksheet():
+    import gspread
+    from google.oauth2.service_account import Credentials
+
     creds_dict = st.secrets["gcp_service_account"]
     creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
     gclient = gspread.authorize(creds)
-    sheet = gclient.open_by_key(SHEET_ID).sheet1
-except Exception as e:
-    sheet = None
-    st.error(f"⚠ לא ניתן להתחבר ל־Google Sheets: {e}")
+    return gclient.open_by_key(SHEET_ID).sheet1
 
-# =========================
-# עמודות קבועות
-# =========================
-SITES = [
-    "כפר הילדים חורפיש",
-    "אנוש כרמיאל",
-    "הפוך על הפוך צפת",
-    "שירות מבחן לנוער עכו",
-    "כלא חרמון",
-    "בית חולים זיו",
-    "שירותי רווחה קריית שמונה",
-    "מרכז יום לגיל השלישי",
-    "מועדונית נוער בצפת",
-    "מרפאת בריאות הנפש צפת",
-]
-RANK_COUNT = 3
-
-COLUMNS_ORDER = [
-    "תאריך שליחה", "שם פרטי", "שם משפחה", "תעודת זהות", "מין", "שיוך חברתי",
-    "שפת אם", "שפות נוספות", "טלפון", "כתובת", "אימייל",
-    "שנת לימודים", "מסלול לימודים",
-    "הכשרה קודמת", "הכשרה קודמת מקום ותחום",
-    "הכשרה קודמת מדריך ומיקום", "הכשרה קודמת בן זוג",
-    "תחומים מועדפים", "תחום מוביל", "בקשה מיוחדת",
-    "ממוצע", "התאמות", "התאמות פרטים",
-    "מוטיבציה 1", "מוטיבציה 2", "מוטיבציה 3",
-] + [f"מקום הכשרה {i}" for i in range(1, RANK_COUNT+1)] + [f"דירוג_{s}" for s in SITES] + [
-    "אישור הגעה להכשרה"
-]
+@st.cache_resource
+def get_sheets_connection() -> SheetsConnection:
+    """Authorised client + worksheet handle shared by all sessions of this process."""
+    # ensure_sheet_header מוגדרת בהמשך הקובץ — נפתרת בזמן הקריאה
+    return SheetsConnection(connect_worksheet, lambda ws: ensure_sheet_header(ws))
 
 # =========================
 # פונקציה לעיצוב Google Sheets
 # =========================
 
-def style_google_sheet(ws):
-    """Apply styling to the Google Sheet."""
-    
-    # --- עיצוב כותרות (שורה 1) ---
-    header_fmt = CellFormat(
-        backgroundColor=Color(0.6, 0.4, 0.8),   # סגול בהיר
-        textFormat=TextFormat(bold=True, foregroundColor=Color(1, 1, 1)),  # טקסט לבן מודגש
-        horizontalAlignment='CENTER'
-    )
-    format_cell_range(ws, "1:1", header_fmt)
-
-    # --- צבעי רקע מתחלפים (פסי זברה) ---
-    rule = ConditionalFormatRule(
-        ranges=[GridRange.from_a1_range('A2:Z1000', ws)],
-        booleanRule=BooleanRule(
-            condition=BooleanCondition('CUSTOM_FORMULA', ['=ISEVEN(ROW())']),
-            format=CellFormat(backgroundColor=Color(0.95, 0.95, 0.95))  # אפור בהיר
-        )
-    )
-    rules = get_conditional_format_rules(ws)
-    rules.clear()
-    rules.append(rule)
-    rules.save()
-
-    # --- עיצוב עמודת ת"ז (C) ---
-    id_fmt = CellFormat(
-        horizontalAlignment='CENTER',
-        backgroundColor=Color(0.9, 0.9, 0.9)  # אפור עדין
-    )
-    format_cell_range(ws, "C2:C1000", id_fmt)
+@st.cache_resource
+def get_sheet_styler() -> SheetStyler:
+    return SheetStyler(COLUMNS_ORDER, "תעודת זהות")
+
+def style_google_sheet(ws, last_row: int = 1):
+    """Apply styling to the Google Sheet (one batch_update; no-op if already styled up to last_row)."""
+    get_sheet_styler().apply(ws, last_row)
+
 # =========================
 # פונקציה לשמירה (כולל עיצוב)
 # =========================
-def save_master_dataframe(new_row: dict) -> None:
-    # --- שמירה מקומית ---
-    df_master = pd.DataFrame([new_row])
-    if CSV_FILE.exists():
-        df_master = pd.concat([pd.read_csv(CSV_FILE), df_master], ignore_index=True)
-    df_master.to_csv(CSV_FILE, index=False, encoding="utf-8-sig")
-
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_path = BACKUP_DIR / f"שאלון_שיבוץ_{ts}.csv"
-    df_master.to_csv(backup_path, index=False, encoding="utf-8-sig")
-
-    # --- שמירה ל־ Google Sheets ---
-    if sheet:
-        try:
-            headers = sheet.row_values(1)
-            if not headers or headers != COLUMNS_ORDER:
-                sheet.clear()
-                sheet.append_row(COLUMNS_ORDER, value_input_option="USER_ENTERED")
-                style_google_sheet(sheet)   # <<< עיצוב אוטומטי אחרי כותרות
+def save_master_dataframe(new_row: dict, token: str | None = None) -> CommitResult:
+    # --- שמירה מקומית: מאסטר + גיבוי + יומן + תור Sheets דרך כותב יחיד עם נעילה בין-תהליכית ---
+    with span("submit", stage="save"):
+        result = get_submission_writer().submit((new_row, token)).result(timeout=60)
 
-            row_values = [new_row.get(col, "") for col in COLUMNS_ORDER]
-            sheet.append_row(row_values, value_input_option="USER_ENTERED")
+    # --- שמירה ל־ Google Sheets: ברקע, באצוות, עם ניסיונות חוזרים ---
+    # גם כשהמאסטר לא השתנה (keep_first / כפילות) — ייתכן שבתור נשארו שורות קודמות
+    get_sheets_worker().notify()
+    return result
 
-        except Exception as e:
-            st.error(f"❌ לא ניתן לשמור ב־Google Sheets: {e}")
+
+def ensure_sheet_header(ws) -> None:
+    # כותרות שהשתנו: העמודות הקיימות מועברות אל מתחת לכותרת שלהן — הגיליון אינו נמחק
+    if migrate_header(ws, COLUMNS_ORDER):
+        get_sheet_styler().invalidate(ws)
+        style_google_sheet(ws)   # <<< עיצוב אוטומטי אחרי כותרות
 
 
-def append_to_log(row_df: pd.DataFrame) -> None:
-    file_exists = CSV_LOG_FILE.exists()
-    row_df.to_csv(CSV_LOG_FILE, mode="a", header=not file_exists,
-                  index=False, encoding="utf-8-sig",
-                  quoting=csv.QUOTE_MINIMAL, escapechar="\\", lineterminator="\n")
   # =========================
 # פונקציות עזר
 # =========================
-def load_csv_safely(path: Path) -> pd.DataFrame:
-    if not path.exists():
-        return pd.DataFrame()
-    attempts = [
-        dict(encoding="utf-8-sig"),
-        dict(encoding="utf-8"),
-        dict(encoding="utf-8-sig", engine="python", on_bad_lines="skip"),
-        dict(encoding="utf-8", engine="python", on_bad_lines="skip"),
-        dict(encoding="latin-1", engine="python", on_bad_lines="skip"),
-    ]
-    for kw in attempts:
-        try:
-            df = pd.read_csv(path, **kw)
-            df.columns = [c.replace("\ufeff", "").strip() for c in df.columns]
-            return df
-        except Exception:
-            continue
-    return pd.DataFrame()
-
-def df_to_excel_bytes(df: pd.DataFrame, sheet: str = "Sheet1") -> bytes:
-    bio = BytesIO()
-    with pd.ExcelWriter(bio, engine="xlsxwriter") as w:
-        df.to_excel(w, sheet_name=sheet, index=False)
-        ws = w.sheets[sheet]
-        for i, col in enumerate(df.columns):
-            width = 12
-            if not df.empty:
-                width = min(60, max(12, int(df[col].astype(str).map(len).max()) + 4))
-            ws.set_column(i, i, width)
-    bio.seek(0)
-    return bio.read()
-
-def valid_email(v: str) -> bool:  return bool(re.match(r"^[^@]+@[^@]+\.[^@]+$", v.strip()))
-def valid_phone(v: str) -> bool:  return bool(re.match(r"^0\d{1,2}-?\d{6,7}$", v.strip()))
-def valid_id(v: str) -> bool:     return bool(re.match(r"^\d{8,9}$", v.strip()))
-
-def show_errors(errors: list[str]):
+@st.cache_resource
+def get_master_store() -> MasterStore:
+    """Open the SQLite master store once per process, importing the legacy CSV if needed."""
+    from pipeline import open_master_store
+    return open_master_store()
+
+@st.cache_resource
+def get_backup_manager() -> BackupManager:
+    """Backup manager with the retention policy from the secrets file ([backups] section, optional)."""
+    from pipeline import open_backup_manager
+    return open_backup_manager(get_master_store(), get_master_settings()["backups"])
+
+@st.cache_resource
+def get_submission_writer() -> SubmissionWriter:
+    """One writer thread per server process; processes are serialised by WRITE_LOCK_FILE."""
+    from pipeline import commit_local_batch
+    store, backups, outbox, stats = get_master_store(), get_backup_manager(), get_sheets_outbox(), get_stats_file()
+    log, snapshot = get_submission_log(), get_snapshot()
+    return SubmissionWriter(
+        lambda items: commit_local_batch(items, store, backups, outbox, stats, log, DEDUPE_POLICY, snapshot),
+        WRITE_LOCK_FILE)
+
+@st.cache_resource
+def get_stats_file() -> StatsFile:
+    from pipeline import open_stats_file
+    return open_stats_file(get_master_store())
+
+@st.cache_resource
+def get_submission_log() -> SegmentedLog:
+    from pipeline import open_submission_log
+    return open_submission_log()
+
+@st.cache_resource
+def get_snapshot() -> ParquetSnapshot:
+    """Typed Parquet copy of the master for the admin page, refreshed by every commit."""
+    from pipeline import open_snapshot
+    return open_snapshot(get_master_store())
+
+@st.cache_resource
+def get_sheets_outbox() -> SheetsOutbox:
+    return SheetsOutbox(OUTBOX_FILE, COLUMNS_ORDER)
+
+@st.cache_resource
+def get_sheets_worker() -> SheetsSyncWorker:
+    """Background Sheets writer, one per process; processes take turns via SHEETS_LOCK_FILE.
+    Also reconciles the sheet with the master after start and then every SHEETS_RECONCILE_MINUTES."""
+    from reconcile import AUTO_PUSH_LIMIT, reconcile
+    store, outbox, styler = get_master_store(), get_sheets_outbox(), get_sheet_styler()
+    return SheetsSyncWorker(outbox, get_sheets_connection(), SHEETS_LOCK_FILE, styler=styler,
+                            reconcile=lambda ws: reconcile(ws, store, outbox, styler=styler,
+                                                          max_push=AUTO_PUSH_LIMIT),
+                            reconcile_every=60 * float(st.secrets.get("SHEETS_RECONCILE_MINUTES", 60)))
+
+@st.cache_resource
+def get_metrics_server():
+    """Local Prometheus endpoint (GET /metrics) when METRICS_PORT is set in the secrets or the environment."""
+    from metrics import serve
+    port = st.secrets.get("METRICS_PORT", os.environ.get("METRICS_PORT"))
+    if not port or not REGISTRY.enabled:
+        return None
+    try:
+        return serve(int(port))
+    except OSError:
+        # תהליך אחר (או הרצה קודמת) כבר מאזין בפורט
+        return None
+
+get_metrics_server()
+
+@st.cache_resource
+def resume_sheets_sync() -> bool:
+    """Start the Sheets writer when the process starts if the outbox still holds rows from an earlier run
+    (otherwise it starts with the first submit or admin page, keeping gspread off the student page)."""
+    if not get_sheets_outbox().status()["depth"]:
+        return False
+    get_sheets_worker()
+    return True
+
+resume_sheets_sync()
+
+@st.cache_resource
+def get_csv_loader() -> CachedCsvLoader:
+    """Parsed master/log DataFrames shared by all admin sessions, keyed by size + mtime."""
+    return CachedCsvLoader()
+
+@st.cache_resource
+def get_export_cache() -> ExportCache:
+    return ExportCache(EXPORT_DIR)
+
+def excel_download(frame, sources: list, sheet: str, name: str):
+    """Callable for st.download_button: builds the xlsx from `frame()` only on click,
+    reusing it while none of the `sources` files changed."""
+    cache = get_export_cache()
+
+    def build() -> bytes:
+        key = ExportCache.fingerprint(*sources)
+        out = cache.get(name, ".xlsx", key, lambda tmp: write_excel(frame(), tmp, sheet))
+        return out.read_bytes()
+    return build
+
+def stream_download(frame, sources: list, fmt: str, name: str):
+    """Like excel_download, for the streaming formats of exports.FORMATS (written to the cache chunk by chunk).
+
+    The file is built without holding it in memory, but st.download_button needs it whole, so each download
+    reads it into this process. For a master too large for that, use the ingestion API's
+    /export/master.<fmt>, which streams it to the client."""
+    cache = get_export_cache()
+    _, chunks = FORMATS[fmt]
+
+    def build() -> bytes:
+        key = ExportCache.fingerprint(*sources)
+        out = cache.get(name, "." + fmt, key, lambda tmp: write_chunks(chunks(frame()), tmp))
+        return out.read_bytes()
+    return build
+
+@st.cache_resource
+def get_index_cache() -> IndexCache:
+    return IndexCache()
+
+def render_browser(df: pd.DataFrame, name: str) -> None:
+    """Filtered, paginated table: filters run on prebuilt indexes and only the current page is sent."""
+    index = get_index_cache().get(name, df)
+    with st.expander("🔎 סינון", expanded=False):
+        c1, c2 = st.columns(2)
+        nat_id = c1.text_input("תעודת זהות", key=f"{name}_f_id")
+        full_name = c2.text_input("שם", key=f"{name}_f_name")
+        site = c1.selectbox("מקום הכשרה", [""] + index.sites(), key=f"{name}_f_site")
+        year = c2.selectbox("שנת לימודים", [""] + index.years(), key=f"{name}_f_year")
+        dates = st.date_input("טווח תאריכי שליחה", value=(), key=f"{name}_f_dates")
+    date_from = dates[0] if len(dates) > 0 else None
+    date_to = dates[1] if len(dates) > 1 else date_from
+    rows = index.query(nat_id, full_name, site, year, date_from, date_to)
+
+    c1, c2, c3 = st.columns([1, 1, 2])
+    page_size = c1.selectbox("שורות בעמוד", [25, 50, 100, 250], key=f"{name}_page_size")
+    pages = max(1, -(-len(rows) // page_size))
+    page = c2.number_input("עמוד", min_value=1, max_value=pages, value=1, step=1, key=f"{name}_page")
+    c3.caption(f"{len(rows)} שורות מתוך {len(df)} · עמוד {page} מתוך {pages}")
+    st.dataframe(index.page(rows, page, page_size), use_container_width=True)
+
+def render_stats(df_log: pd.DataFrame) -> None:
+    """Demand dashboard from the running aggregates (no scan of the data), plus a full recompute from the log."""
+    stats = get_stats_file().load()
+    c1, c2 = st.columns(2)
+    c1.metric("סטודנטים בקובץ הראשי", stats.total)
+    c2.metric("מוסדות שדורגו ראשון", len([v for v in stats.counters.get("rank_1", {}).values() if v]))
+
+    first = stats.table("rank_1", "מוסד")
+    if not first.empty:
+        st.markdown("**בחירה ראשונה לפי מוסד**")
+        st.bar_chart(first.set_index("מוסד"))
+    c1, c2 = st.columns(2)
+    c1.markdown("**תחומים מועדפים**")
+    c1.dataframe(stats.table("domains", "תחום"), use_container_width=True, hide_index=True)
+    c2.markdown("**תחום מוביל**")
+    c2.dataframe(stats.table("top_domain", "תחום"), use_container_width=True, hide_index=True)
+    c1.markdown("**ממוצע לפי מסלול**")
+    c1.dataframe(stats.grade_by_track().round(2), use_container_width=True, hide_index=True)
+    c2.markdown("**התאמות**")
+    c2.dataframe(stats.table("adjustments", "התאמה"), use_container_width=True, hide_index=True)
+
+    c1, c2 = st.columns(2)
+    if c1.button("🧮 אימות מול היומן", key="stats_verify"):
+        diff = stats.diff(RunningStats.from_log(df_log, DEDUPE_POLICY))
+        if diff:
+            st.warning(f"נמצאו {len(diff)} הפרשים בין המונים לבין היומן.")
+            st.dataframe(pd.DataFrame(diff, columns=["מונה", "ערך", "נשמר", "מהיומן"]),
+                         use_container_width=True, hide_index=True)
+        else:
+            st.success("המונים תואמים לחישוב מחדש מהיומן ✅")
+    if c2.button("♻️ בנייה מחדש מהיומן", key="stats_rebuild"):
+        # היומן נקרא מחדש בתוך הנעילה — שמירות שנוספו מאז הטעינה של העמוד לא יימחקו מהמונים
+        with FileLock(WRITE_LOCK_FILE):
+            fresh = get_submission_log().read_all(get_csv_loader(), typed=True)
+            get_stats_file().replace(RunningStats.from_log(fresh, DEDUPE_POLICY))
+        st.success("המונים חושבו מחדש מהיומן.")
+
+POLICY_LABELS = {"grade": "ממוצע", "motivation": "מוטיבציה", "lottery": "הגרלה"}
+
+def render_placement(df_master: pd.DataFrame) -> None:
+    """Capacities editor, placement run on demand and Excel export of the result."""
+    n_students = len(prepare_placement(df_master))
+    with st.expander("⚙ קיבולות ומדיניות", expanded=False):
+        caps_df = st.data_editor(
+            pd.DataFrame({"מוסד": SITES, "קיבולת": list(default_capacities(n_students).values())}),
+            disabled=["מוסד"], hide_index=True, key="placement_caps")
+        c1, c2 = st.columns(2)
+        policy = c1.radio("שובר שוויון", list(PLACEMENT_POLICIES), horizontal=True, key="placement_policy",
+                          format_func=POLICY_LABELS.get)
+        seed = c2.number_input("זרע הגרלה", min_value=0, value=0, step=1, key="placement_seed")
+    caps = dict(zip(caps_df["מוסד"], caps_df["קיבולת"].fillna(0).astype(int)))
+    if st.button("▶ חשב שיבוץ", key="placement_run"):
+        st.session_state.placement = run_placement(df_master, caps, policy, int(seed))
+
+    with st.expander("🎲 סימולציית תרחישים (מה-אם)", expanded=False):
+        c1, c2, c3 = st.columns(3)
+        sim_policies = c1.multiselect("מדיניות", list(PLACEMENT_POLICIES), default=list(PLACEMENT_POLICIES),
+                                      format_func=POLICY_LABELS.get, key="sim_policies")
+        sim_scales = c2.multiselect("מכפיל קיבולת", [0.8, 0.9, 1.0, 1.1, 1.25, 1.5], default=[1.0],
+                                    key="sim_scales")
+        sim_reps = c3.number_input("מספר הגרלות", min_value=10, max_value=5000, value=200, step=10,
+                                   key="sim_reps")
+        if st.button("▶ הרץ סימולציה", key="sim_run") and sim_policies and sim_scales:
+            with st.spinner("מריץ תרחישים..."):
+                st.session_state.simulation = run_scenarios(
+                    df_master, scenario_grid(caps, sim_scales, sim_policies), int(sim_reps),
+                    base_seed=int(seed))
+        sim = st.session_state.get("simulation")
+        if sim is not None:
+            overview, per_site = sim
+            st.dataframe(overview.round(2), use_container_width=True, hide_index=True)
+            pick = st.selectbox("פירוט לפי מוסד לתרחיש", overview["תרחיש"].tolist(), key="sim_pick")
+            st.dataframe(per_site[per_site["תרחיש"] == pick].drop(columns="תרחיש").round(2),
+                         use_container_width=True, hide_index=True)
+
+    res = st.session_state.get("placement")
+    if res is None:
+        return
+    cols = st.columns(RANK_COUNT + 2)
+    for r in range(1, RANK_COUNT + 1):
+        cols[r - 1].metric(f"שובצו בדירוג {r}", res.rank_counts.get(r, 0))
+    cols[RANK_COUNT].metric("מחוץ לדירוג", res.rank_counts.get(RANK_COUNT + 1, 0))
+    cols[RANK_COUNT + 1].metric("לא שובצו", res.unassigned)
+    st.dataframe(res.summary, use_container_width=True, hide_index=True)
+
+    def build() -> bytes:
+        bio = BytesIO()
+        write_excel_book({"Placement": res.assignments, "Summary": res.summary}, bio)
+        return bio.getvalue()
+    st.download_button(
+        "⬇ הורד Excel – שיבוץ",
+        data=build,
+        file_name="שיבוץ_סטודנטים.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
+def render_reconcile() -> None:
+    """Compare the master with the sheet now: append what the sheet is missing, offer to import what only it has."""
+    if st.button("🔁 השוואת הקובץ הראשי מול הגיליון", key="reconcile_sheet"):
+        ws = get_sheets_connection().worksheet()
+        if ws is None:
+            st.error("אין חיבור ל־Google Sheets.")
+        else:
+            # העברת הכותרות כותבת מ־A1 — באותה נעילה של תהליך הסנכרון, כדי שהוספת שורות לא תשתלב באמצע
+            with FileLock(SHEETS_LOCK_FILE):
+                get_sheets_connection().ensure_header(ws)
+            st.session_state["reconcile"] = reconcile(ws, get_master_store(), get_sheets_outbox(),
+                                                      styler=get_sheet_styler())
+    rec = st.session_state.get("reconcile")
+    if rec is None:
+        return
+    st.caption(f"בגיליון {rec.sheet_rows} שורות, בקובץ הראשי {rec.local_rows}, בתור {rec.pending}; "
+               f"נוספו לגיליון {rec.pushed} שורות חסרות ({rec.seconds:.1f} שניות).")
+    if not rec.sheet_only.empty:
+        st.warning(f"{len(rec.sheet_only)} שורות קיימות רק בגיליון (תעודת זהות שאינה בקובץ הראשי).")
+        st.dataframe(rec.sheet_only, use_container_width=True, hide_index=True)
+        if st.button("⬅ ייבוא השורות לקובץ הראשי", key="reconcile_pull"):
+            results = pull(rec.sheet_only, get_master_store(), get_backup_manager(), get_stats_file(),
+                           get_submission_log(), get_snapshot(), DEDUPE_POLICY)
+            del st.session_state["reconcile"]
+            st.success(f"{sum(r.changed_master for r in results)} שורות יובאו לקובץ הראשי.")
+
+def render_metrics() -> None:
+    """Timing histograms and counters of this process (the same series as GET /metrics)."""
+    if not REGISTRY.enabled:
+        st.info("המדדים כבויים (METRICS_ENABLED=0).")
+        return
+    server = get_metrics_server()
+    if server is not None:
+        host, port = server.server_address[:2]
+        st.caption(f"נקודת קצה Prometheus: http://{host}:{port}/metrics")
+    timings = pd.DataFrame(REGISTRY.summary())
+    if timings.empty:
+        st.info("אין עדיין מדידות בתהליך זה.")
+    else:
+        st.dataframe(timings.round(2), use_container_width=True, hide_index=True)
+    counters = pd.DataFrame(REGISTRY.counters())
+    if not counters.empty:
+        st.dataframe(counters, use_container_width=True, hide_index=True)
+    if st.button("איפוס מדדים", key="metrics_reset"):
+        REGISTRY.reset()
+        st.rerun()
+
+def show_errors(errors: list[Issue]):
     if not errors: return
     st.markdown("### :red[נמצאו שגיאות:]")
     for e in errors:
-        st.markdown(f"- :red[{e}]")
+        st.markdown(f"- :red[{e}] ({e.field})")
 
   # =========================
 # מצב מנהל
 # =========================
 if is_admin_mode:
+    # מחסנית הניתוח והייצוא — רק במצב מנהל (הפונקציות שלמעלה משתמשות בשמות אלו)
+    import pandas as pd
+    from loaders import CachedCsvLoader
+    from exports import FORMATS, ExportCache, write_chunks, write_excel, write_excel_book
+    from placement import (
+        COLUMNS as PLACEMENT_COLUMNS, POLICIES as PLACEMENT_POLICIES, default_capacities,
+        prepare as prepare_placement, run_placement,
+    )
+    from simulation import run_scenarios, scenario_grid
+    from admin_browser import IndexCache
+    from stats import RunningStats
+    from validation import validate_frame
+    from reconcile import pull, reconcile
+
     st.title("🔑 גישת מנהל – צפייה והורדות (מאסטר + יומן)")
     pwd = st.text_input("סיסמת מנהל", type="password", key="admin_pwd_input")
     if pwd == ADMIN_PASSWORD:
         st.success("התחברת בהצלחה ✅")
 
-        df_master = load_csv_safely(CSV_FILE)
-        df_log    = load_csv_safely(CSV_LOG_FILE)
+        # המאסטר מהסנאפשוט העמודתי (ה־CSV נשאר עותק קריא לבני אדם), היומן מהמטמון — רק השורות שנוספו
+        loader, snapshot = get_csv_loader(), get_snapshot()
+        get_master_store().export_csv(CSV_FILE)
+        df_master = snapshot.read()
+        log = get_submission_log()
+        df_log = log.read_all(loader, FileLock(WRITE_LOCK_FILE), typed=True)
+
+        st.subheader("🔄 סנכרון Google Sheets")
+        if get_sheets_connection().worksheet() is None:
+            st.error(f"⚠ לא ניתן להתחבר ל־Google Sheets: {get_sheets_connection().last_error}")
+        get_sheets_worker()
+        sync = get_sheets_outbox().status()
+        c1, c2, c3 = st.columns(3)
+        c1.metric("שורות ממתינות", sync["depth"])
+        c2.metric("עיכוב (שניות)", f"{sync['lag_seconds']:.0f}")
+        c3.metric("סנכרון אחרון",
+                  datetime.fromtimestamp(sync["last_sync"], pytz.timezone("Asia/Jerusalem")).strftime("%H:%M:%S")
+                  if sync["last_sync"] else "—")
+        if sync["last_error"]:
+            st.warning(f"שגיאת סנכרון אחרונה: {sync['last_error']}")
+        if sync["reconcile_error"]:
+            st.warning(f"שגיאה בהשוואה האוטומטית מול הגיליון: {sync['reconcile_error']}")
+        pending = get_master_store().pending_status()
+        if pending["rows"]:
+            st.warning(f"{pending['rows']} הגשות שמורות במאסטר ממתינות לגיבוי/יומן/סטטיסטיקות/תור "
+                       f"(ינוסו שוב בשמירה הבאה): {pending['last_error']}")
+        render_reconcile()
+
+        st.subheader("📊 ביקוש וסטטיסטיקות")
+        render_stats(df_log)
+
+        st.subheader("⏱ מדדי ביצועים")
+        render_metrics()
 
         st.subheader("📦 קובץ ראשי (מאסטר)")
         if not df_master.empty:
-            st.dataframe(df_master, use_container_width=True)
+            render_browser(df_master, "master")
             st.download_button(
                 "⬇ הורד Excel – קובץ ראשי",
-                data=df_to_excel_bytes(df_master, sheet="Master"),
+                data=excel_download(snapshot.read, [snapshot.state_path], "Master", "master"),
                 file_name="שאלון_שיבוץ_master.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
+            # CSV דחוס, Parquet וחוברת לכל אתר (zip) — נבנים רק בלחיצה ונשמרים במטמון
+            for col, (fmt, label, file_name) in zip(st.columns(3), [
+                ("csv.gz", "⬇ CSV דחוס (gzip)", "שאלון_שיבוץ_master.csv.gz"),
+                ("parquet", "⬇ Parquet", "שאלון_שיבוץ_master.parquet"),
+                ("sites.zip", "⬇ קובץ לכל אתר (zip)", "שאלון_שיבוץ_לפי_אתר.zip"),
+            ]):
+                col.download_button(label, data=stream_download(snapshot.read, [snapshot.state_path], fmt, "master"),
+                                    file_name=file_name, mime=FORMATS[fmt][0], key=f"export_{fmt}")
+            if st.button("🩺 בדיקת תקינות לכל הקובץ הראשי", key="validate_master"):
+                report = validate_frame(df_master)
+                if report.empty:
+                    st.success("כל השורות בקובץ הראשי עומדות בכללי הטופס ✅")
+                else:
+                    st.warning(f"{report['שורה'].nunique()} שורות עם {len(report)} שגיאות.")
+                    st.dataframe(report, use_container_width=True, hide_index=True)
         else:
             st.info("אין עדיין נתונים בקובץ הראשי.")
 
+        st.subheader("🧭 שיבוץ סטודנטים למוסדות")
+        if not df_master.empty:
+            render_placement(snapshot.read(PLACEMENT_COLUMNS))
+        else:
+            st.info("אין עדיין נתונים לשיבוץ.")
+
         st.subheader("🧾 קובץ יומן (Append-Only)")
         if not df_log.empty:
-            st.dataframe(df_log, use_container_width=True)
+            render_browser(df_log, "log")
             st.download_button(
                 "⬇ הורד Excel – קובץ יומן",
-                data=df_to_excel_bytes(df_log, sheet="Log"),
+                data=excel_download(lambda: log.read_all(loader, FileLock(WRITE_LOCK_FILE), typed=True),
+                                    log.files(), "Log", "log"),
                 file_name="שאלון_שיבוץ_log.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
+            # קריאה ישירה לפי האינדקס — רק השורות של הת"ז, בלי לסרוק את היומן
+            lookup = st.text_input("🔎 היסטוריית הגשות לפי תעודת זהות", key="log_history_id")
+            if lookup.strip():
+                hist = log.history(lookup)
+                if hist.empty:
+                    st.info("לא נמצאו הגשות לתעודת זהות זו.")
+                else:
+                    st.dataframe(hist, use_container_width=True, hide_index=True)
         else:
             st.info("אין עדיין נתונים ביומן.")
 
@@ -313,6 +528,8 @@ if is_admin_mode:
 # =========================
 # טופס — מנוע שלבים עם כפתורים (במקום tabs)
 # =========================
+# כל שלב הוא fragment: לחיצה בתוך שלב מריצה מחדש רק את השלב (ובחירת הדירוג — רק את בוחר הדירוג),
+# וניווט מריץ מחדש רק את האשף — ה־CSS, החיבורים והגדרות העמוד אינם נשלחים/מחושבים שוב
 st.title("📋 שאלון שיבוץ סטודנטים – שנת הכשרה תשפ״ו")
 st.caption("מלאו/מלאי את כל הסעיפים. השדות המסומנים ב-* הינם חובה.")
 
@@ -324,15 +541,39 @@ STEPS = [
     "סעיף 5: מוטיבציה",
     "סעיף 6: סיכום ושליחה"
 ]
+ACK_LABELS = [
+    "אני מצהיר/ה כי מילאתי פרטים אישיים באופן מדויק. *",
+    "אני מצהיר/ה כי העדפתי הוזנו במלואן. *",
+    "אני מצהיר/ה כי הממוצע שהזנתי נכון. *",
+    "אני מצהיר/ה כי מסרתי מידע מדויק על התאמות. *",
+    "אני מצהיר/ה כי עניתי בכנות על שאלות המוטיבציה. *",
+]
+NO_CHOICE = "— בחר/י —"
+# מפתחות הווידג'טים של השלבים (ללא ההצהרות ובוחר הדירוג, שנשמרים במפתחות משלהם)
+ANSWER_KEYS = (
+    "first_name", "last_name", "nat_id", "gender", "social_affil", "mother_tongue", "other_mt",
+    "extra_langs", "extra_langs_other", "phone", "address", "email", "study_year", "study_year_other", "track",
+    "prev_training", "prev_place", "prev_mentor", "prev_partner", "chosen_domains", "domains_other",
+    "top_domain", "special_request", "avg_grade", "adjustments", "adjustments_other", "adjustments_details",
+    "m1", "m2", "m3", "arrival_confirm", "confirm",
+)
 
 if "step" not in st.session_state:
     st.session_state.step = 0
+if "form_session" not in st.session_state:
+    st.session_state.form_session = uuid.uuid4().hex   # בסיס לאסימון אידמפוטנטיות של השליחה
 if "acks" not in st.session_state:
     st.session_state.acks = {i: False for i in range(len(STEPS)-1)}  # הצהרה בין הסעיפים 0..4
 
 def goto(i: int):
     st.session_state.step = int(i)
 
+def keep_answers():
+    """Re-assign the answers so Streamlit keeps them while their step's widgets are not rendered."""
+    for key in ANSWER_KEYS:
+        if key in st.session_state:
+            st.session_state[key] = st.session_state[key]
+
 def nav_bar():
     st.markdown("#### ניווט מהיר")
     cols = st.columns(len(STEPS))
@@ -359,22 +600,18 @@ def prev_next():
             disabled = not st.session_state.acks.get(st.session_state.step, True) if st.session_state.step <= 4 else False
             st.button("הבא ➡", on_click=goto, args=(st.session_state.step + 1,), disabled=disabled, use_container_width=True)
 
-# בר עליון לניווט מהיר
-nav_bar()
-
-step = st.session_state.step
-st.subheader(STEPS[step])
-
 # ===== שלב 1: פרטים אישיים =====
-if step == 0:
+@st.fragment
+def step_personal():
+    count("wizard_reruns", scope="step", step=st.session_state.step)
     st.text_input("שם פרטי *", key="first_name")
     st.text_input("שם משפחה *", key="last_name")
     st.text_input("מספר תעודת זהות *", key="nat_id")
 
-    st.radio("מין *", ["זכר","נקבה"], horizontal=True, key="gender")
-    st.selectbox("שיוך חברתי *", ["יהודי/ה","מוסלמי/ת","נוצרי/ה","דרוזי/ת"], key="social_affil")
+    st.radio("מין *", GENDERS, horizontal=True, key="gender")
+    st.selectbox("שיוך חברתי *", SOCIAL_AFFILIATIONS, key="social_affil")
 
-    st.selectbox("שפת אם *", ["עברית","ערבית","רוסית","אחר..."], key="mother_tongue")
+    st.selectbox("שפת אם *", MOTHER_TONGUES + ["אחר..."], key="mother_tongue")
     if st.session_state.get("mother_tongue") == "אחר...":
         st.text_input("ציין/ני שפת אם אחרת *", key="other_mt")
 
@@ -390,68 +627,33 @@ if step == 0:
     st.text_input("כתובת מלאה (כולל יישוב) *", key="address")
     st.text_input("כתובת דוא״ל *", key="email")
 
-    st.selectbox("שנת הלימודים *", [
-        "תואר ראשון - שנה א", "תואר ראשון - שנה ב", "תואר ראשון - שנה ג'",
-        "תואר שני - שנה א'", "תואר שני - שנה ב", "אחר"
-    ], key="study_year")
+    st.selectbox("שנת הלימודים *", STUDY_YEARS + ["אחר"], key="study_year")
     if st.session_state.get("study_year") == "אחר":
         st.text_input("פרט/י שנת לימודים *", key="study_year_other")
 
-    st.selectbox("מסלול הלימודים / תואר *", [
-        "תואר ראשון – תוכנית רגילה",
-        "תואר ראשון – הסבה",
-        "תואר שני"
-    ], key="track")
-
-    st.markdown("---")
-    st.session_state.acks[0] = st.checkbox("אני מצהיר/ה כי מילאתי פרטים אישיים באופן מדויק. *", key="ack_0", value=st.session_state.acks.get(0, False))
-    prev_next()
+    st.selectbox("מסלול הלימודים / תואר *", TRACKS, key="track")
 
 # ===== שלב 2: העדפת שיבוץ =====
-if step == 1:
-    st.selectbox("האם עברת הכשרה מעשית בשנה קודמת? *", ["כן","לא","אחר..."], key="prev_training")
-    if st.session_state.get("prev_training") in ["כן","אחר..."]:
-        st.text_input("אם כן, נא ציין שם מקום ותחום ההתמחות *", key="prev_place")
-        st.text_input("שם המדריך והמיקום הגיאוגרפי של ההכשרה *", key="prev_mentor")
-        st.text_input("מי היה/תה בן/בת הזוג להתמחות בשנה הקודמת? *", key="prev_partner")
-
-    all_domains = ["רווחה","מוגבלות","זקנה","ילדים ונוער","בריאות הנפש",
-                   "שיקום","משפחה","נשים","בריאות","קהילה","אחר..."]
-    st.multiselect("בחרו עד 3 תחומים *", all_domains, max_selections=3,
-                   placeholder="בחר/י עד שלושה תחומים", key="chosen_domains")
-
-    if "אחר..." in (st.session_state.get("chosen_domains") or []):
-        st.text_input("פרט/י תחום אחר *", key="domains_other")
-
-    st.selectbox(
-        "מה התחום הכי מועדף עליך, מבין שלושתם? *",
-        ["— בחר/י —"] + (st.session_state.get("chosen_domains") or []) if st.session_state.get("chosen_domains") else ["— בחר/י —"],
-        key="top_domain"
-    )
-
-    # ניסוח דירוג — מודגש ובולט
-    st.markdown(
-        "<div style='font-weight:700; font-size:1rem; color:#0f172a;'>הדירוג אינו מחייב את מורי השיטות.</div>",
-        unsafe_allow_html=True
-    )
-    st.markdown("**בחר/י מוסד לכל מקום הכשרה (1 = הכי רוצים, 3 = הכי פחות). הבחירה כובלת קדימה — מוסדות שנבחרו ייעלמו מהבחירות הבאות.**")
-
+def options_for_rank(rank_i: int) -> list:
+    current = st.session_state.get(f"rank_{rank_i}", NO_CHOICE)
+    chosen_before = {st.session_state.get(f"rank_{j}") for j in range(1, rank_i)}
+    base = [NO_CHOICE] + [s for s in SITES if (s not in chosen_before or s == current)]
+    return base
+
+@st.fragment
+def rank_picker():
+    """Cascading site selectboxes; a choice reruns only this fragment."""
+    count("wizard_reruns", scope="rank_picker", step=st.session_state.step)
     # אתחול מצב הבחירות
     for i in range(1, RANK_COUNT + 1):
-        st.session_state.setdefault(f"rank_{i}", "— בחר/י —")
-        st.session_state.setdefault(f"rank_{i}_select", "— בחר/י —")
-
-    def options_for_rank(rank_i: int) -> list:
-        current = st.session_state.get(f"rank_{rank_i}", "— בחר/י —")
-        chosen_before = {st.session_state.get(f"rank_{j}") for j in range(1, rank_i)}
-        base = ["— בחר/י —"] + [s for s in SITES if (s not in chosen_before or s == current)]
-        return base
+        st.session_state.setdefault(f"rank_{i}", NO_CHOICE)
+        st.session_state.setdefault(f"rank_{i}_select", NO_CHOICE)
 
     cols = st.columns(2)
     for i in range(1, RANK_COUNT + 1):
         with cols[(i - 1) % 2]:
             opts = options_for_rank(i)
-            current = st.session_state.get(f"rank_{i}", "— בחר/י —")
+            current = st.session_state.get(f"rank_{i}", NO_CHOICE)
             sel = st.selectbox(
                 f"מקום הכשרה {i} (בחר/י מוסד) *",
                 options=opts,
@@ -464,29 +666,56 @@ if step == 1:
     # הסרת כפילויות בזמן אמת
     used = set()
     for i in range(1, RANK_COUNT + 1):
-        sel = st.session_state.get(f"rank_{i}", "— בחר/י —")
-        if sel != "— בחר/י —":
+        sel = st.session_state.get(f"rank_{i}", NO_CHOICE)
+        if sel != NO_CHOICE:
             if sel in used:
-                st.session_state[f"rank_{i}"] = "— בחר/י —"
-                st.session_state[f"rank_{i}_select"] = "— בחר/י —"
+                st.session_state[f"rank_{i}"] = NO_CHOICE
+                st.session_state[f"rank_{i}_select"] = NO_CHOICE
             else:
                 used.add(sel)
 
-    st.text_area("האם קיימת בקשה מיוחדת הקשורה למיקום או תחום ההתמחות? *", height=100, key="special_request")
+@st.fragment
+def step_preferences():
+    count("wizard_reruns", scope="step", step=st.session_state.step)
+    st.selectbox("האם עברת הכשרה מעשית בשנה קודמת? *", PREV_TRAINING, key="prev_training")
+    if st.session_state.get("prev_training") in ["כן","אחר..."]:
+        st.text_input("אם כן, נא ציין שם מקום ותחום ההתמחות *", key="prev_place")
+        st.text_input("שם המדריך והמיקום הגיאוגרפי של ההכשרה *", key="prev_mentor")
+        st.text_input("מי היה/תה בן/בת הזוג להתמחות בשנה הקודמת? *", key="prev_partner")
 
-    st.markdown("---")
-    st.session_state.acks[1] = st.checkbox("אני מצהיר/ה כי העדפתי הוזנו במלואן. *", key="ack_1", value=st.session_state.acks.get(1, False))
-    prev_next()
+    all_domains = DOMAINS + ["אחר..."]
+    st.multiselect("בחרו עד 3 תחומים *", all_domains, max_selections=3,
+                   placeholder="בחר/י עד שלושה תחומים", key="chosen_domains")
+
+    if "אחר..." in (st.session_state.get("chosen_domains") or []):
+        st.text_input("פרט/י תחום אחר *", key="domains_other")
+
+    st.selectbox(
+        "מה התחום הכי מועדף עליך, מבין שלושתם? *",
+        [NO_CHOICE] + (st.session_state.get("chosen_domains") or []) if st.session_state.get("chosen_domains") else [NO_CHOICE],
+        key="top_domain"
+    )
+
+    # ניסוח דירוג — מודגש ובולט
+    st.markdown(
+        "<div style='font-weight:700; font-size:1rem; color:#0f172a;'>הדירוג אינו מחייב את מורי השיטות.</div>",
+        unsafe_allow_html=True
+    )
+    st.markdown("**בחר/י מוסד לכל מקום הכשרה (1 = הכי רוצים, 3 = הכי פחות). הבחירה כובלת קדימה — מוסדות שנבחרו ייעלמו מהבחירות הבאות.**")
+    rank_picker()
+
+    st.text_area("האם קיימת בקשה מיוחדת הקשורה למיקום או תחום ההתמחות? *", height=100, key="special_request")
 
 # ===== שלב 3: נתונים אקדמיים =====
-if step == 2:
+@st.fragment
+def step_academic():
+    count("wizard_reruns", scope="step", step=st.session_state.step)
     st.number_input("ממוצע ציונים *", min_value=0.0, max_value=100.0, step=0.1, key="avg_grade")
-    st.markdown("---")
-    st.session_state.acks[2] = st.checkbox("אני מצהיר/ה כי הממוצע שהזנתי נכון. *", key="ack_2", value=st.session_state.acks.get(2, False))
-    prev_next()
 
 # ===== שלב 4: התאמות =====
-if step == 3:
+@st.fragment
+def step_adjustments():
+    count("wizard_reruns", scope="step", step=st.session_state.step)
     st.multiselect(
         "סוגי התאמות (ניתן לבחור כמה) *",
         ["אין","הריון","מגבלה רפואית (למשל: מחלה כרונית, אוטואימונית)",
@@ -500,35 +729,33 @@ if step == 3:
     if "אין" not in (st.session_state.get("adjustments") or []):
         st.text_area("פרט: *", height=100, key="adjustments_details")
 
-    st.markdown("---")
-    st.session_state.acks[3] = st.checkbox("אני מצהיר/ה כי מסרתי מידע מדויק על התאמות. *", key="ack_3", value=st.session_state.acks.get(3, False))
-    prev_next()
-
-
 # ===== שלב 5: מוטיבציה =====
-if step == 4:
-    likert = ["בכלל לא מסכים/ה","1","2","3","4","מסכים/ה מאוד"]
+@st.fragment
+def step_motivation():
+    count("wizard_reruns", scope="step", step=st.session_state.step)
+    likert = LIKERT
     st.radio("1) מוכן/ה להשקיע מאמץ נוסף להגיע למקום המועדף *", likert, horizontal=True, key="m1")
     st.radio("2) ההכשרה המעשית חשובה לי כהזדמנות משמעותית להתפתחות *", likert, horizontal=True, key="m2")
     st.radio("3) אהיה מחויב/ת להגיע בזמן ולהתמיד גם בתנאים מאתגרים *", likert, horizontal=True, key="m3")
-    st.markdown("---")
-    st.session_state.acks[4] = st.checkbox("אני מצהיר/ה כי עניתי בכנות על שאלות המוטיבציה. *", key="ack_4", value=st.session_state.acks.get(4, False))
-    prev_next()
 
 # ===== שלב 6: סיכום ושליחה =====
-submitted = False
-if step == 5:
+@st.fragment
+def step_summary():
+    import pandas as pd
+
+    count("wizard_reruns", scope="step", step=st.session_state.step)
+
     st.markdown("בדקו את התקציר. אם יש טעות – חזרו לשלבים המתאימים עם הכפתורים למעלה, תקנו וחזרו לכאן. לאחר אישור ולחיצה על **שליחה** המידע יישמר.")
 
     # מיפוי מקום הכשרה->מוסד + מוסד->דירוג
-    rank_to_site = {i: st.session_state.get(f"rank_{i}", "— בחר/י —") for i in range(1, RANK_COUNT + 1)}
+    rank_to_site = {i: st.session_state.get(f"rank_{i}", NO_CHOICE) for i in range(1, RANK_COUNT + 1)}
     site_to_rank = {s: None for s in SITES}
     for i, s in rank_to_site.items():
-        if s and s != "— בחר/י —":
+        if s and s != NO_CHOICE:
             site_to_rank[s] = i
 
     st.markdown("### 📍 העדפות שיבוץ (1=הכי רוצים)")
-    summary_pairs = [f"{rank_to_site[i]} – {i}" if rank_to_site[i] != "— בחר/י —" else f"(לא נבחר) – {i}"
+    summary_pairs = [f"{rank_to_site[i]} – {i}" if rank_to_site[i] != NO_CHOICE else f"(לא נבחר) – {i}"
                      for i in range(1, RANK_COUNT + 1)]
     st.table(pd.DataFrame({"דירוג": summary_pairs}))
 
@@ -556,185 +783,147 @@ if step == 5:
     st.table(pd.DataFrame([{"מוכנות להשקיע מאמץ": st.session_state.get("m1",""), "חשיבות ההכשרה": st.session_state.get("m2",""), "מחויבות והתמדה": st.session_state.get("m3","")}]).T.rename(columns={0: "ערך"}))
 
     st.markdown("---")
-    arrival_confirm = st.checkbox("אני מצהיר/ה שאגיע בכל דרך להכשרה המעשית שתיקבע לי. *", key="arrival_confirm")
-    confirm = st.checkbox("אני מאשר/ת כי המידע שמסרתי נכון ומדויק, וידוע לי שאין התחייבות להתאמה מלאה לבחירותיי. *", key="confirm")
-    submitted = st.button("שליחה ✉️")
-
-# ===== התאמה לזרימת הוולידציה והשמירה המקורית (משתנים לוקאליים) =====
-# ממפים מ-session_state לשמות המקוריים שלך, כדי לא לשנות ולידציה/שמירה קיימות
-first_name       = st.session_state.get("first_name","")
-last_name        = st.session_state.get("last_name","")
-nat_id           = st.session_state.get("nat_id","")
-gender           = st.session_state.get("gender","")
-social_affil     = st.session_state.get("social_affil","")
-mother_tongue    = st.session_state.get("mother_tongue","")
-other_mt         = st.session_state.get("other_mt","")
-extra_langs      = st.session_state.get("extra_langs",[])
-extra_langs_other= st.session_state.get("extra_langs_other","")
-phone            = st.session_state.get("phone","")
-address          = st.session_state.get("address","")
-email            = st.session_state.get("email","")
-study_year       = st.session_state.get("study_year","")
-study_year_other = st.session_state.get("study_year_other","")
-track            = st.session_state.get("track","")
-
-prev_training    = st.session_state.get("prev_training","לא")
-prev_place       = st.session_state.get("prev_place","")
-prev_mentor      = st.session_state.get("prev_mentor","")
-prev_partner     = st.session_state.get("prev_partner","")
-
-chosen_domains   = st.session_state.get("chosen_domains",[])
-domains_other    = st.session_state.get("domains_other","")
-top_domain       = st.session_state.get("top_domain","— בחר/י —")
-
-special_request  = st.session_state.get("special_request","")
-avg_grade        = st.session_state.get("avg_grade", None)
-adjustments      = st.session_state.get("adjustments",[])
-adjustments_other= st.session_state.get("adjustments_other","")
-adjustments_details = st.session_state.get("adjustments_details","")
-
-m1               = st.session_state.get("m1","")
-m2               = st.session_state.get("m2","")
-m3               = st.session_state.get("m3","")
-
-arrival_confirm  = st.session_state.get("arrival_confirm", False)
-confirm          = st.session_state.get("confirm", False)
-
-# ===== ולידציה ושמירה — מיחזור הבלוק שלך =====
-if submitted:
-    errors = []
-
-    # סעיף 1 — פרטים אישיים
-    if not first_name.strip():
-        errors.append("סעיף 1: יש למלא שם פרטי.")
-    if not last_name.strip():
-        errors.append("סעיף 1: יש למלא שם משפחה.")
-    if not valid_id(nat_id):
-        errors.append("סעיף 1: ת״ז חייבת להיות 8–9 ספרות.")
-    if mother_tongue == "אחר..." and not other_mt.strip():
-        errors.append("סעיף 1: יש לציין שפת אם (אחר).")
-    if not extra_langs or ("אחר..." in extra_langs and not extra_langs_other.strip()):
-        errors.append("סעיף 1: יש לבחור שפות נוספות (ואם 'אחר' – לפרט).")
-    if not valid_phone(phone):
-        errors.append("סעיף 1: מספר טלפון אינו תקין.")
-    if not address.strip():
-        errors.append("סעיף 1: יש למלא כתובת מלאה.")
-    if not valid_email(email):
-        errors.append("סעיף 1: כתובת דוא״ל אינה תקינה.")
-    if study_year == "אחר" and not study_year_other.strip():
-        errors.append("סעיף 1: יש לפרט שנת לימודים (אחר).")
-    if not track.strip():
-        errors.append("סעיף 1: יש למלא מסלול לימודים/תואר.")
-
-    # סעיף 2 — העדפת שיבוץ
-    rank_to_site = {i: st.session_state.get(f"rank_{i}", "— בחר/י —") for i in range(1, RANK_COUNT + 1)}
-    missing = [i for i, s in rank_to_site.items() if s == "— בחר/י —"]
-    if missing:
-        errors.append(f"סעיף 2: יש לבחור מוסד לכל מקום הכשרה. חסר/ים: {', '.join(map(str, missing))}.")
-    chosen_sites = [s for s in rank_to_site.values() if s != "— בחר/י —"]
-    if len(set(chosen_sites)) != len(chosen_sites):
-        errors.append("סעיף 2: קיימת כפילות בבחירת מוסדות. כל מוסד יכול להופיע פעם אחת בלבד.")
-
-    if prev_training in ["כן","אחר..."] and not prev_place.strip():
-        errors.append("סעיף 2: יש למלא מקום/תחום אם הייתה הכשרה קודמת.")
-    if prev_training in ["כן","אחר..."] and not prev_mentor.strip():
-        errors.append("סעיף 2: יש למלא שם מדריך ומיקום.")
-    if prev_training in ["כן","אחר..."] and not prev_partner.strip():
-        errors.append("סעיף 2: יש למלא בן/בת זוג להתמחות.")
-
-    if not chosen_domains:
-        errors.append("סעיף 2: יש לבחור עד 3 תחומים (לפחות אחד).")
-    if "אחר..." in chosen_domains and not domains_other.strip():
-        errors.append("סעיף 2: נבחר 'אחר' – יש לפרט תחום.")
-    if chosen_domains and (top_domain not in chosen_domains):
-        errors.append("סעיף 2: יש לבחור תחום מוביל מתוך השלושה.")
-    if any("רווחה" in d for d in chosen_domains) and "שנה ג'" not in study_year:
-        errors.append("סעיף 2: תחום רווחה פתוח לשיבוץ רק לסטודנטים שנה ג׳ ומעלה.")
-
-    if not special_request.strip():
-        errors.append("סעיף 2: יש לציין בקשה מיוחדת (אפשר 'אין').")
-
-    # סעיף 3 — נתונים אקדמיים
-    if avg_grade is None or avg_grade <= 0:
-        errors.append("סעיף 3: יש להזין ממוצע ציונים גדול מ-0.")
-
-    # סעיף 4 — התאמות
-    adj_list = [a.strip() for a in adjustments]
-    has_none = ("אין" in adj_list) and (len([a for a in adj_list if a != "אין"]) == 0)
-
-    if not adj_list:
-        errors.append("סעיף 4: יש לבחור לפחות סוג התאמה אחד (או לציין 'אין').")
-    if "אחר..." in adj_list and not adjustments_other.strip():
-        errors.append("סעיף 4: נבחר 'אחר' – יש לפרט התאמה.")
-    if not has_none and not adjustments_details.strip():
-        errors.append("סעיף 4: יש לפרט התייחסות להתאמות.")
-
-    # סעיף 5 — מוטיבציה
-    if not (m1 and m2 and m3):
-        errors.append("סעיף 5: יש לענות על שלוש שאלות המוטיבציה.")
-
-    # סעיף 6 — הצהרות
-    if not arrival_confirm:
-        errors.append("סעיף 6: יש לסמן את ההצהרה על הגעה להכשרה.")
-    if not confirm:
-        errors.append("סעיף 6: יש לאשר את הצהרת הדיוק וההתאמה.")
+    st.checkbox("אני מצהיר/ה שאגיע בכל דרך להכשרה המעשית שתיקבע לי. *", key="arrival_confirm")
+    st.checkbox("אני מאשר/ת כי המידע שמסרתי נכון ומדויק, וידוע לי שאין התחייבות להתאמה מלאה לבחירותיי. *", key="confirm")
+    if st.button("שליחה ✉️"):
+        with span("submit", stage="total"):
+            submit_form()
+
+STEP_VIEWS = [step_personal, step_preferences, step_academic, step_adjustments, step_motivation, step_summary]
+
+@st.fragment
+def wizard():
+    """Navigation + the current step; a step change reruns only this fragment."""
+    # בלי זה, מעבר שלב מוחק את ערכי הווידג'טים של השלבים שאינם מוצגים
+    keep_answers()
+    # בר עליון לניווט מהיר
+    nav_bar()
+
+    step = st.session_state.step
+    count("wizard_reruns", scope="wizard", step=step)
+    st.subheader(STEPS[step])
+    STEP_VIEWS[step]()
+    if step < len(STEPS) - 1:
+        # ההצהרה והניווט מחוץ ל־fragment של השלב — סימון ההצהרה מעדכן גם את כפתור "הבא"
+        st.markdown("---")
+        st.session_state.acks[step] = st.checkbox(ACK_LABELS[step], key=f"ack_{step}", value=st.session_state.acks.get(step, False))
+        prev_next()
+
+# ===== ולידציה ושמירה =====
+def submit_form():
+    from pipeline import content_token
+    from validation import CONFIRM_FIELD, validate_row
+
+    # ממפים מ-session_state לשמות המקוריים, כדי לא לשנות ולידציה/שמירה קיימות — רק בעת שליחה
+    first_name       = st.session_state.get("first_name","")
+    last_name        = st.session_state.get("last_name","")
+    nat_id           = st.session_state.get("nat_id","")
+    gender           = st.session_state.get("gender","")
+    social_affil     = st.session_state.get("social_affil","")
+    mother_tongue    = st.session_state.get("mother_tongue","")
+    other_mt         = st.session_state.get("other_mt","")
+    extra_langs      = st.session_state.get("extra_langs",[])
+    extra_langs_other= st.session_state.get("extra_langs_other","")
+    phone            = st.session_state.get("phone","")
+    address          = st.session_state.get("address","")
+    email            = st.session_state.get("email","")
+    study_year       = st.session_state.get("study_year","")
+    study_year_other = st.session_state.get("study_year_other","")
+    track            = st.session_state.get("track","")
+
+    prev_training    = st.session_state.get("prev_training","לא")
+    prev_place       = st.session_state.get("prev_place","")
+    prev_mentor      = st.session_state.get("prev_mentor","")
+    prev_partner     = st.session_state.get("prev_partner","")
+
+    chosen_domains   = st.session_state.get("chosen_domains",[])
+    domains_other    = st.session_state.get("domains_other","")
+    top_domain       = st.session_state.get("top_domain",NO_CHOICE)
+
+    special_request  = st.session_state.get("special_request","")
+    avg_grade        = st.session_state.get("avg_grade", None)
+    adjustments      = st.session_state.get("adjustments",[])
+    adjustments_other= st.session_state.get("adjustments_other","")
+    adjustments_details = st.session_state.get("adjustments_details","")
+
+    m1               = st.session_state.get("m1","")
+    m2               = st.session_state.get("m2","")
+    m3               = st.session_state.get("m3","")
+
+    arrival_confirm  = st.session_state.get("arrival_confirm", False)
+    confirm          = st.session_state.get("confirm", False)
+
+    # מפות בחירה לשמירה
+    site_to_rank = {s: None for s in SITES}
+    for i in range(1, RANK_COUNT + 1):
+        site = st.session_state.get(f"rank_{i}")
+        site_to_rank[site] = i
+
+    # בניית שורה לשמירה
+    tz = pytz.timezone("Asia/Jerusalem")
+    row = {
+        "תאריך שליחה": datetime.now(tz).strftime("%d/%m/%Y %H:%M:%S"),
+        "שם פרטי": first_name.strip(),
+        "שם משפחה": last_name.strip(),
+        "תעודת זהות": nat_id.strip(),
+        "מין": gender,
+        "שיוך חברתי": social_affil,
+        "שפת אם": (other_mt.strip() if mother_tongue == "אחר..." else mother_tongue),
+        "שפות נוספות": "; ".join([x for x in extra_langs if x != "אחר..."] + ([extra_langs_other.strip()] if "אחר..." in extra_langs else [])),
+        "טלפון": phone.strip(),
+        "כתובת": address.strip(),
+        "אימייל": email.strip(),
+        "שנת לימודים": (study_year_other.strip() if study_year == "אחר" else study_year),
+        "מסלול לימודים": track.strip(),
+        "הכשרה קודמת": prev_training,
+        "הכשרה קודמת מקום ותחום": prev_place.strip(),
+        "הכשרה קודמת מדריך ומיקום": prev_mentor.strip(),
+        "הכשרה קודמת בן זוג": prev_partner.strip(),
+        "תחומים מועדפים": "; ".join([d for d in chosen_domains if d != "אחר..."] + ([domains_other.strip()] if "אחר..." in chosen_domains else [])),
+        "תחום מוביל": (top_domain if top_domain and top_domain != NO_CHOICE else ""),
+        "בקשה מיוחדת": special_request.strip(),
+        "ממוצע": avg_grade,
+        "התאמות": "; ".join([a for a in adjustments if a != "אחר..."] + ([adjustments_other.strip()] if "אחר..." in adjustments else [])),
+        "התאמות פרטים": adjustments_details.strip(),
+        "מוטיבציה 1": m1,
+        "מוטיבציה 2": m2,
+        "מוטיבציה 3": m3,
+        "אישור הגעה להכשרה": "כן" if arrival_confirm else "לא",
+    }
+
+    # 1) שדות "מקום הכשרה i"
+    for i in range(1, RANK_COUNT + 1):
+        row[f"מקום הכשרה {i}"] = st.session_state.get(f"rank_{i}")
+    # 2) Site -> Rank (לשימוש נוח ב-Excel)
+    for s in SITES:
+        row[f"דירוג_{s}"] = site_to_rank[s]
+
+    # ולידציה לפי הסכמה (validation.SCHEMA) — אותם כללים משמשים גם לבדיקת המאסטר כולו
+    with span("submit", stage="validate"):
+        errors = validate_row({**row, CONFIRM_FIELD: confirm})
 
     # הצגת השגיאות או שמירה
     if errors:
         show_errors(errors)
     else:
-        # מפות בחירה לשמירה
-        site_to_rank = {s: None for s in SITES}
-        for i in range(1, RANK_COUNT + 1):
-            site = st.session_state.get(f"rank_{i}")
-            site_to_rank[site] = i
-
-        # בניית שורה לשמירה
-        tz = pytz.timezone("Asia/Jerusalem")
-        row = {
-            "תאריך שליחה": datetime.now(tz).strftime("%d/%m/%Y %H:%M:%S"),
-            "שם פרטי": first_name.strip(),
-            "שם משפחה": last_name.strip(),
-            "תעודת זהות": nat_id.strip(),
-            "מין": gender,
-            "שיוך חברתי": social_affil,
-            "שפת אם": (other_mt.strip() if mother_tongue == "אחר..." else mother_tongue),
-            "שפות נוספות": "; ".join([x for x in extra_langs if x != "אחר..."] + ([extra_langs_other.strip()] if "אחר..." in extra_langs else [])),
-            "טלפון": phone.strip(),
-            "כתובת": address.strip(),
-            "אימייל": email.strip(),
-            "שנת לימודים": (study_year_other.strip() if study_year == "אחר" else study_year),
-            "מסלול לימודים": track.strip(),
-            "הכשרה קודמת": prev_training,
-            "הכשרה קודמת מקום ותחום": prev_place.strip(),
-            "הכשרה קודמת מדריך ומיקום": prev_mentor.strip(),
-            "הכשרה קודמת בן זוג": prev_partner.strip(),
-            "תחומים מועדפים": "; ".join([d for d in chosen_domains if d != "אחר..."] + ([domains_other.strip()] if "אחר..." in chosen_domains else [])),
-            "תחום מוביל": (top_domain if top_domain and top_domain != "— בחר/י —" else ""),
-            "בקשה מיוחדת": special_request.strip(),
-            "ממוצע": avg_grade,
-            "התאמות": "; ".join([a for a in adjustments if a != "אחר..."] + ([adjustments_other.strip()] if "אחר..." in adjustments else [])),
-            "התאמות פרטים": adjustments_details.strip(),
-            "מוטיבציה 1": m1,
-            "מוטיבציה 2": m2,
-            "מוטיבציה 3": m3,
-            "אישור הגעה להכשרה": "כן" if arrival_confirm else "לא",
-        }
-
-        # 1) שדות "מקום הכשרה i"
-        for i in range(1, RANK_COUNT + 1):
-            row[f"מקום הכשרה {i}"] = st.session_state.get(f"rank_{i}")
-        # 2) Site -> Rank (לשימוש נוח ב-Excel)
-        for s in SITES:
-            row[f"דירוג_{s}"] = site_to_rank[s]
+        # אסימון: אותה שיחה + אותו תוכן => לחיצה חוזרת אינה יוצרת שורה נוספת
+        with span("submit", stage="token"):
+            token = content_token(row, st.session_state.form_session)
 
         try:
-            # שמירה במאסטר + Google Sheets
-            save_master_dataframe(row)
-
-            # יומן Append-Only
-            append_to_log(pd.DataFrame([row]))
-
-            st.success("✅ הטופס נשלח ונשמר בהצלחה! תודה רבה.")
+            # שמירה במאסטר + גיבוי + יומן Append-Only + Google Sheets
+            result = save_master_dataframe(row, token)
+
+            if result.status == "duplicate":
+                st.info("ℹ️ הטופס כבר נשלח — לא נשמר פעם נוספת.")
+            elif result.status == "kept_first":
+                st.warning("⚠ קיימת כבר הגשה עם תעודת זהות זו. ההגשה הראשונה נשמרה; השינויים נרשמו ביומן בלבד.")
+            elif result.status == "replaced":
+                st.success("✅ הטופס עודכן — ההגשה הקודמת עם תעודת זהות זו הוחלפה. תודה רבה.")
+            else:
+                st.success("✅ הטופס נשלח ונשמר בהצלחה! תודה רבה.")
         except Exception as e:
             st.error(f"❌ שמירה נכשלה: {e}")
+
+
+wizard()
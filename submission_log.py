@@ -0,0 +1,360 @@
+# submission_log.py
+# -*- coding: utf-8 -*-
+"""Append-only submission log in rotating CSV segments with a seekable index.
+
+Layout of the log directory:
+    <num>_<day>.csv       one segment: BOM, header, rows (the active one is appended to)
+    <num>_<day>.csv.gz    a closed segment, compressed as independent gzip members
+    index.sqlite3         segment list, one entry per row (submission time, ID,
+                          byte offset and length in the uncompressed segment)
+                          and, for compressed segments, the gzip block map
+
+A new segment is started every day and whenever the active one reaches
+max_bytes; on rotation the closed segments except the newest are compressed.
+Offsets always refer to the uncompressed bytes, so compressing a
+segment does not change the entries; a row is read by decompressing only
+the block that contains it. Every segment is a complete CSV on its own
+(a compressed one is a valid .csv.gz).
+
+Usage:
+    python submission_log.py info
+    python submission_log.py history 012345678
+    python submission_log.py range "01/10/2026 00:00:00" "08/10/2026 00:00:00" [--out week.csv]
+    python submission_log.py compress
+"""
+import argparse
+import csv
+import io
+import sqlite3
+import sys
+import zlib
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pytz
+
+from config import COLUMNS_ORDER, CSV_LOG_FILE, LOG_DIR, LOG_SEGMENT_BYTES
+from loaders import load_csv_safely
+from storage import normalize_id
+
+TZ = pytz.timezone("Asia/Jerusalem")
+DATE_FMT = "%d/%m/%Y %H:%M:%S"
+INDEX_FMT = "%Y-%m-%d %H:%M:%S"      # סדר מילוני = סדר כרונולוגי
+BLOCK_BYTES = 256 * 1024
+ID_COL = "תעודת זהות"
+DATE_COL = "תאריך שליחה"
+CSV_KW = dict(quoting=csv.QUOTE_MINIMAL, escapechar="\\", lineterminator="\n")
+
+
+def _index_time(value) -> str:
+    try:
+        return datetime.strptime(str(value).strip(), DATE_FMT).strftime(INDEX_FMT)
+    except ValueError:
+        return ""
+
+
+class SegmentedLog:
+    def __init__(self, directory: Path, columns: list[str], max_bytes: int = LOG_SEGMENT_BYTES,
+                 compress_closed: bool = True):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.columns = list(columns)
+        self.max_bytes = max_bytes
+        self.compress_closed = compress_closed
+        self._header = b"\xef\xbb\xbf" + self._encode(self.columns)
+        self.index_path = self.dir / "index.sqlite3"
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS segments (
+                    num INTEGER PRIMARY KEY, day TEXT, compressed INTEGER DEFAULT 0, size INTEGER DEFAULT 0);
+                CREATE TABLE IF NOT EXISTS entries (
+                    segment INTEGER, offset INTEGER, length INTEGER, ts TEXT, sid TEXT);
+                CREATE INDEX IF NOT EXISTS entries_ts ON entries (ts);
+                CREATE INDEX IF NOT EXISTS entries_sid ON entries (sid);
+                CREATE TABLE IF NOT EXISTS blocks (
+                    segment INTEGER, raw_start INTEGER, raw_len INTEGER, gz_start INTEGER, gz_len INTEGER,
+                    PRIMARY KEY (segment, raw_start));
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _path(self, num: int, day: str, compressed: bool) -> Path:
+        return self.dir / f"{num:05d}_{day}.csv{'.gz' if compressed else ''}"
+
+    def _encode(self, values: list) -> bytes:
+        buf = io.StringIO()
+        csv.writer(buf, **CSV_KW).writerow(values)
+        return buf.getvalue().encode("utf-8")
+
+    # =========================
+    # מקטעים
+    # =========================
+    def segments(self) -> list[tuple[int, Path, bool]]:
+        """(num, path, compressed) of every segment, oldest first; the last one is the active segment."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT num, day, compressed FROM segments ORDER BY num").fetchall()
+        return [(num, self._path(num, day, bool(c)), bool(c)) for num, day, c in rows]
+
+    def files(self) -> list[Path]:
+        return [p for _, p, _ in self.segments()]
+
+    def is_empty(self) -> bool:
+        return not self.segments()
+
+    def _active(self, conn: sqlite3.Connection, incoming: int) -> tuple[int, Path, bool]:
+        """(num, path, rotated) of the segment the next `incoming` bytes go to."""
+        today = datetime.now(TZ).strftime("%Y%m%d")
+        last = conn.execute("SELECT num, day, size FROM segments ORDER BY num DESC LIMIT 1").fetchone()
+        if last and last[1] == today and (last[2] <= len(self._header) or last[2] + incoming <= self.max_bytes):
+            return last[0], self._path(last[0], last[1], False), False
+        num = (last[0] if last else 0) + 1
+        path = self._path(num, today, False)
+        path.write_bytes(self._header)
+        conn.execute("INSERT INTO segments (num, day, size) VALUES (?, ?, ?)", (num, today, len(self._header)))
+        return num, path, last is not None
+
+    # =========================
+    # כתיבה (המתקשר מחזיק את נעילת הכתיבה)
+    # =========================
+    def append(self, rows: list[dict]) -> None:
+        """Append rows to the active segment (rotating first if needed) and index them."""
+        if not rows:
+            return
+        encoded = [self._encode([r.get(c) for c in self.columns]) for r in rows]
+        with closing(self._connect()) as conn, conn:
+            num, path, rotated = self._active(conn, sum(map(len, encoded)))
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(b"".join(encoded))
+            entries = []
+            for r, data in zip(rows, encoded):
+                entries.append((num, offset, len(data), _index_time(r.get(DATE_COL)), normalize_id(r.get(ID_COL))))
+                offset += len(data)
+            conn.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?)", entries)
+            conn.execute("UPDATE segments SET size = ? WHERE num = ?", (offset, num))
+        if rotated and self.compress_closed:
+            self.compress(keep_plain=1)
+
+    def reconcile(self) -> int:
+        """Index rows that reached the active segment but not the index (crash between the two writes),
+        and cut a partially written last row; returns the number of rows indexed."""
+        with closing(self._connect()) as conn, conn:
+            last = conn.execute("SELECT num, day, size FROM segments WHERE compressed = 0 "
+                                "ORDER BY num DESC LIMIT 1").fetchone()
+            if not last:
+                return 0
+            num, day, size = last
+            path = self._path(num, day, False)
+            with open(path, "rb") as f:
+                f.seek(size)
+                tail = f.read()
+            if not tail:
+                return 0
+            entries, offset = [], size
+            text = tail.decode("utf-8", errors="replace")
+            for values in csv.reader(io.StringIO(text, newline=""), **{k: v for k, v in CSV_KW.items()
+                                                                       if k != "lineterminator"}):
+                data = self._encode(values)
+                if tail[offset - size: offset - size + len(data)] != data:
+                    break
+                row = dict(zip(self.columns, values))
+                entries.append((num, offset, len(data), _index_time(row.get(DATE_COL)), normalize_id(row.get(ID_COL))))
+                offset += len(data)
+            if offset < size + len(tail):
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+            conn.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?)", entries)
+            conn.execute("UPDATE segments SET size = ? WHERE num = ?", (offset, num))
+            return len(entries)
+
+    def import_csv(self, path: Path, chunk: int = 5000) -> int:
+        """Copy a single-file log (the format before segments) into the segments."""
+        df = load_csv_safely(Path(path), dtype=str, keep_default_na=False)
+        if df.empty:
+            return 0
+        rows = df.reindex(columns=self.columns).fillna("").to_dict("records")
+        for i in range(0, len(rows), chunk):
+            self.append(rows[i:i + chunk])
+        return len(rows)
+
+    def compress(self, keep_plain: int = 0) -> list[Path]:
+        """Compress closed segments (all but the active one and the `keep_plain` newest closed ones)."""
+        with closing(self._connect()) as conn:
+            plain = conn.execute("SELECT num, day FROM segments WHERE compressed = 0 ORDER BY num").fetchall()
+        done = []
+        for num, day in plain[:max(0, len(plain) - 1 - keep_plain)]:
+            done.append(self._compress_segment(num, day))
+        return done
+
+    def _compress_segment(self, num: int, day: str) -> Path:
+        src, dst = self._path(num, day, False), self._path(num, day, True)
+        with closing(self._connect()) as conn:
+            offsets = [r[0] for r in conn.execute(
+                "SELECT offset FROM entries WHERE segment = ? ORDER BY offset", (num,))]
+        data = src.read_bytes()
+        # גבולות בלוקים על גבולות שורות, כ־BLOCK_BYTES כל אחד; הכותרת בבלוק הראשון
+        cuts, start = [0], 0
+        for off in offsets:
+            if off - start >= BLOCK_BYTES:
+                cuts.append(off)
+                start = off
+        cuts.append(len(data))
+        blocks, gz_pos = [], 0
+        tmp = dst.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            for a, b in zip(cuts, cuts[1:]):
+                if a == b:
+                    continue
+                comp = zlib.compressobj(6, zlib.DEFLATED, 31)
+                member = comp.compress(data[a:b]) + comp.flush()
+                f.write(member)
+                blocks.append((num, a, b - a, gz_pos, len(member)))
+                gz_pos += len(member)
+        tmp.replace(dst)
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?)", blocks)
+            conn.execute("UPDATE segments SET compressed = 1 WHERE num = ?", (num,))
+        src.unlink(missing_ok=True)
+        return dst
+
+    # =========================
+    # קריאה
+    # =========================
+    def read_all(self, loader=None, lock=None, typed: bool = False) -> pd.DataFrame:
+        """Whole log as one DataFrame; with a CachedCsvLoader closed segments are parsed once
+        and the active one only from where the previous load stopped."""
+        from schema import concat_typed
+
+        for _ in range(2):
+            segs = self.segments()
+            frames = []
+            for i, (_, path, _) in enumerate(segs):
+                if loader is None:
+                    frames.append(load_csv_safely(path))
+                else:
+                    frames.append(loader.load(path, append_only=i == len(segs) - 1, lock=lock, typed=typed))
+            # מקטע שנדחס בזמן הקריאה — קריאה חוזרת לפי רשימת המקטעים החדשה
+            if all(p.exists() for _, p, _ in segs):
+                break
+        df = pd.DataFrame(columns=self.columns)
+        for part in frames:
+            if not part.empty:
+                df = concat_typed(df, part) if typed else (part if df.empty else pd.concat([df, part], ignore_index=True))
+        return df
+
+    def _read_entries(self, entries: list[tuple]) -> pd.DataFrame:
+        """Rows for (segment, offset, length) entries, in the given order, read by seeking."""
+        if not entries:
+            return pd.DataFrame(columns=self.columns)
+        with closing(self._connect()) as conn:
+            segs = {num: (day, bool(c)) for num, day, c in conn.execute("SELECT num, day, compressed FROM segments")}
+            blocks: dict[int, list[tuple]] = {}
+            for seg, raw_start, raw_len, gz_start, gz_len in conn.execute(
+                    "SELECT * FROM blocks ORDER BY segment, raw_start"):
+                blocks.setdefault(seg, []).append((raw_start, raw_len, gz_start, gz_len))
+        parts, opened, inflated = [], {}, {}
+        try:
+            for seg, offset, length in entries:
+                day, compressed = segs[seg]
+                f = opened.get(seg)
+                if f is None:
+                    f = opened[seg] = open(self._path(seg, day, compressed), "rb")
+                if not compressed:
+                    f.seek(offset)
+                    parts.append(f.read(length))
+                    continue
+                # הבלוק שמכיל את השורה — פריסה של בלוק אחד בלבד
+                raw_start, raw_len, gz_start, gz_len = next(
+                    b for b in reversed(blocks[seg]) if b[0] <= offset)
+                raw = inflated.get((seg, raw_start))
+                if raw is None:
+                    f.seek(gz_start)
+                    raw = inflated[(seg, raw_start)] = zlib.decompress(f.read(gz_len), 31)
+                parts.append(raw[offset - raw_start: offset - raw_start + length])
+        finally:
+            for f in opened.values():
+                f.close()
+        text = self._encode(self.columns) + b"".join(parts)
+        return pd.read_csv(io.BytesIO(text), encoding="utf-8", dtype=str, keep_default_na=False, escapechar="\\")
+
+    def history(self, student_id) -> pd.DataFrame:
+        """Every logged submission of one ID, in log order."""
+        with closing(self._connect()) as conn:
+            entries = conn.execute("SELECT segment, offset, length FROM entries WHERE sid = ? "
+                                   "ORDER BY segment, offset", (normalize_id(student_id),)).fetchall()
+        return self._read_entries(entries)
+
+    def between(self, start: datetime, end: datetime) -> pd.DataFrame:
+        """Submissions with start <= submission time < end, in time order."""
+        with closing(self._connect()) as conn:
+            entries = conn.execute("SELECT segment, offset, length FROM entries WHERE ts >= ? AND ts < ? "
+                                   "ORDER BY ts, segment, offset",
+                                   (start.strftime(INDEX_FMT), end.strftime(INDEX_FMT))).fetchall()
+        return self._read_entries(entries)
+
+    def info(self) -> list[dict]:
+        with closing(self._connect()) as conn:
+            counts = dict(conn.execute("SELECT segment, COUNT(*) FROM entries GROUP BY segment"))
+        return [{"segment": num, "file": path.name, "rows": counts.get(num, 0),
+                 "bytes": path.stat().st_size if path.exists() else None, "compressed": c}
+                for num, path, c in self.segments()]
+
+
+def open_log(directory: Path = LOG_DIR, legacy: Path = CSV_LOG_FILE) -> SegmentedLog:
+    """The segmented log; on first use the single-file log is copied in (caller holds the write lock)."""
+    log = SegmentedLog(directory, COLUMNS_ORDER)
+    if log.is_empty() and Path(legacy).exists():
+        log.import_csv(legacy)
+    else:
+        log.reconcile()
+    return log
+
+
+def main(argv: list[str] | None = None) -> int:
+    from writer import FileLock
+    from config import WRITE_LOCK_FILE
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dir", type=Path, default=LOG_DIR)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("info")
+    h = sub.add_parser("history")
+    h.add_argument("id")
+    r = sub.add_parser("range")
+    r.add_argument("start")
+    r.add_argument("end")
+    r.add_argument("--out", type=Path)
+    c = sub.add_parser("compress")
+    c.add_argument("--keep-plain", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    with FileLock(WRITE_LOCK_FILE):
+        log = open_log(args.dir)
+        if args.cmd == "compress":
+            for p in log.compress(args.keep_plain):
+                print(f"compressed {p.name}")
+            return 0
+    if args.cmd == "info":
+        for s in log.info():
+            print(f"{s['file']:32} {s['rows']:>8} rows {s['bytes'] or 0:>12} bytes")
+        return 0
+    if args.cmd == "history":
+        df = log.history(args.id)
+    else:
+        df = log.between(datetime.strptime(args.start, DATE_FMT), datetime.strptime(args.end, DATE_FMT))
+    if getattr(args, "out", None):
+        df.to_csv(args.out, index=False, encoding="utf-8-sig")
+        print(f"{len(df)} rows -> {args.out}")
+    else:
+        print(df.to_string(max_colwidth=30))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
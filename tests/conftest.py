@@ -0,0 +1,18 @@
+# tests/conftest.py
+# -*- coding: utf-8 -*-
+"""Every test runs inside its own empty working directory (the config paths are relative)."""
+import pytest
+
+from tests.fakes import sample_row
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def make_row():
+    """Valid master row for student number n, with the given column changes."""
+    return sample_row
@@ -0,0 +1,172 @@
+# tests/fakes.py
+# -*- coding: utf-8 -*-
+"""Stand-ins shared by the tests and bench_load.py: a Google worksheet kept in a
+local file, valid master rows for synthetic students, and a fresh interpreter
+for tests that need process-wide state of their own (Streamlit caches, imports)."""
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+APP = ROOT / "streamlit_app.py"
+
+from writer import FileLock
+
+
+# =========================
+# Google Sheets מדומה
+# =========================
+class FakeWorksheet:
+    """The worksheet calls the app makes, kept in a JSON-lines file so that every worker process
+    sees the same sheet; every call sleeps `delay` seconds (the API round-trip)."""
+
+    id = 0
+
+    def __init__(self, path: Path, delay: float = 0.0):
+        self.path = Path(path)
+        self.delay = delay
+        self.calls = 0
+        self.col_count = 26
+        self.spreadsheet = self
+        self._lock = FileLock(self.path.with_name(self.path.name + ".lock"))
+
+    def _call(self) -> None:
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+
+    @property
+    def rows(self) -> list[list]:
+        if not self.path.exists():
+            return []
+        with self.path.open(encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def reset(self, rows: list[list]) -> None:
+        with self._lock:
+            self._write(rows)
+
+    def _write(self, rows: list[list]) -> None:
+        self.path.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows), encoding="utf-8")
+
+    def _length(self) -> int:
+        if not self.path.exists():
+            return 0
+        with self.path.open("rb") as f:
+            return sum(1 for _ in f)
+
+    @property
+    def row_count(self) -> int:
+        return max(1000, self._length())
+
+    def row_values(self, n: int) -> list:
+        self._call()
+        with self._lock:
+            rows = self.rows
+        return rows[n - 1] if len(rows) >= n else []
+
+    def get_all_values(self, **kw) -> list[list]:
+        self._call()
+        with self._lock:
+            rows = self.rows
+        width = max(map(len, rows), default=0)
+        return [r + [""] * (width - len(r)) for r in rows]
+
+    def update(self, values: list[list], range_name: str = "A1", **kw) -> dict:
+        """Write `values` from A1 (the only anchor the app uses)."""
+        self._call()
+        with self._lock:
+            rows = self.rows
+            for i, r in enumerate(values):
+                if i < len(rows):
+                    rows[i][:len(r)] = list(r)
+                else:
+                    rows.append(list(r))
+            self._write(rows)
+        return {}
+
+    def add_cols(self, n: int) -> None:
+        self._call()
+        self.col_count += n
+
+    def append_row(self, values: list, **kw) -> dict:
+        return self.append_rows([values], **kw)
+
+    def append_rows(self, values: list[list], value_input_option: str = "RAW", **kw) -> dict:
+        self._call()
+        if value_input_option == "USER_ENTERED":
+            # כמו ב־ Sheets: גרש מוביל מסמן טקסט ואינו נשמר בתא
+            values = [[v[1:] if isinstance(v, str) and v.startswith("'") else v for v in r] for r in values]
+        with self._lock:
+            start = self._length() + 1
+            with self.path.open("a", encoding="utf-8") as f:
+                f.writelines(json.dumps(list(v), ensure_ascii=False) + "\n" for v in values)
+        return {"updates": {"updatedRange": f"Sheet1!A{start}:AN{start + len(values) - 1}"}}
+
+    def fetch_sheet_metadata(self, params=None) -> dict:
+        self._call()
+        return {"sheets": [{"properties": {"sheetId": self.id}}]}
+
+    def batch_update(self, body: dict) -> dict:
+        self._call()
+        return {}
+
+
+
+def install_fake_sheets(ws: FakeWorksheet) -> None:
+    """Make `gspread.authorize(...).open_by_key(...).sheet1` return `ws` in this process."""
+    gspread = types.ModuleType("gspread")
+    gspread.authorize = lambda creds: types.SimpleNamespace(
+        open_by_key=lambda key: types.SimpleNamespace(sheet1=ws))
+    service_account = types.ModuleType("google.oauth2.service_account")
+    service_account.Credentials = types.SimpleNamespace(from_service_account_info=lambda info, scopes=None: info)
+    # מודול העלה בלבד — הייבוא `from google.oauth2.service_account import ...` נפתר מ־sys.modules
+    sys.modules["gspread"] = gspread
+    sys.modules["google.oauth2.service_account"] = service_account
+
+# =========================
+# שורות סינתטיות
+# =========================
+def sample_row(n: int, **changes) -> dict:
+    """A valid master row (as the wizard saves it) for student number n, with `changes` applied."""
+    from config import (
+        COLUMNS_ORDER, DOMAINS, GENDERS, LIKERT, MOTHER_TONGUES, SITES, SOCIAL_AFFILIATIONS, STUDY_YEARS, TRACKS,
+    )
+
+    rng = random.Random(n)
+    domains = rng.sample([d for d in DOMAINS if "רווחה" not in d], 3)
+    sites = rng.sample(SITES, 3)
+    row = dict.fromkeys(COLUMNS_ORDER, "")
+    row.update({
+        "תאריך שליחה": "01/09/2025 10:00:00", "שם פרטי": f"סטודנט{n}", "שם משפחה": "בדיקה",
+        "תעודת זהות": f"{n:09d}", "מין": rng.choice(GENDERS), "שיוך חברתי": rng.choice(SOCIAL_AFFILIATIONS),
+        "שפת אם": rng.choice(MOTHER_TONGUES), "שפות נוספות": "ערבית; אנגלית",
+        "טלפון": f"05{rng.randrange(10)}-{rng.randrange(10**7):07d}", "כתובת": "רחוב הבדיקה 1, חיפה",
+        "אימייל": f"student{n}@example.com", "שנת לימודים": STUDY_YEARS[1], "מסלול לימודים": rng.choice(TRACKS),
+        "הכשרה קודמת": "לא", "תחומים מועדפים": "; ".join(domains), "תחום מוביל": domains[0],
+        "בקשה מיוחדת": "אין", "ממוצע": round(rng.uniform(60, 100), 1), "התאמות": "אין",
+        "מוטיבציה 1": rng.choice(LIKERT), "מוטיבציה 2": rng.choice(LIKERT), "מוטיבציה 3": rng.choice(LIKERT),
+        "אישור הגעה להכשרה": "כן",
+    })
+    for i, s in enumerate(sites, start=1):
+        row[f"מקום הכשרה {i}"] = s
+        row[f"דירוג_{s}"] = i
+    row.update(changes)
+    return row
+
+
+# =========================
+# מפרש נפרד
+# =========================
+def run_isolated(code: str, cwd: Path, timeout: float = 180) -> dict:
+    """Run `code` in a new interpreter inside `cwd`; it prints a JSON object as its last line."""
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(ROOT), os.environ.get("PYTHONPATH", "")])}
+    out = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True,
+                         timeout=timeout)
+    assert out.returncode == 0, out.stderr[-3000:]
+    return json.loads(out.stdout.strip().splitlines()[-1])
@@ -0,0 +1,78 @@
+# tests/test_admin_browser.py
+# -*- coding: utf-8 -*-
+import random
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from admin_browser import IndexCache, SubmissionIndex
+from config import SITES, STUDY_YEARS
+from schema import to_typed
+
+
+@pytest.fixture
+def frame(make_row):
+    rng = random.Random(7)
+    rows = []
+    for n in range(1, 301):
+        rows.append(make_row(n, **{
+            "שם פרטי": rng.choice(["דנה", "רון", "Gal", "נועה"]),
+            "שנת לימודים": rng.choice(STUDY_YEARS[:3]),
+            "תאריך שליחה": f"{rng.randint(1, 28):02d}/09/2025 {rng.randint(0, 23):02d}:00:00",
+        }))
+    rows[5]["תאריך שליחה"] = "לא תאריך"
+    rows[9]["תעודת זהות"] = 10          # ת"ז שנקראה כמספר
+    return pd.DataFrame(rows)
+
+
+def naive(df, nat_id="", name="", site="", year="", date_from=None, date_to=None) -> np.ndarray:
+    ok = pd.Series(True, index=df.index)
+    if nat_id:
+        ok &= df["תעודת זהות"].map(lambda v: str(v).zfill(9)) == nat_id.zfill(9)
+    if name:
+        full = (df["שם פרטי"].astype(str) + " " + df["שם משפחה"].astype(str)).str.lower()
+        ok &= full.str.contains(name.lower(), regex=False)
+    if site:
+        ok &= df[[f"מקום הכשרה {i}" for i in (1, 2, 3)]].astype(object).eq(site).any(axis=1)
+    if year:
+        ok &= df["שנת לימודים"].astype(str) == year
+    when = pd.to_datetime(df["תאריך שליחה"], format="%d/%m/%Y %H:%M:%S", errors="coerce")
+    if date_from:
+        ok &= when.dt.date >= date_from
+    if date_to:
+        ok &= when.dt.date <= date_to
+    return np.flatnonzero(ok.to_numpy())
+
+
+QUERIES = [
+    {}, {"nat_id": "000000010"}, {"nat_id": "10"}, {"nat_id": "999"}, {"name": "gal"}, {"name": "דנה בדיקה"},
+    {"site": SITES[0]}, {"year": STUDY_YEARS[1]}, {"date_from": date(2025, 9, 10)},
+    {"date_from": date(2025, 9, 5), "date_to": date(2025, 9, 5)},
+    {"site": SITES[1], "year": STUDY_YEARS[0], "name": "רון", "date_to": date(2025, 9, 20)},
+]
+
+
+@pytest.mark.parametrize("typed", [False, True])
+@pytest.mark.parametrize("q", QUERIES)
+def test_query_matches_a_full_scan(frame, q, typed):
+    index = SubmissionIndex(to_typed(frame) if typed else frame)
+    assert index.query(**q).tolist() == naive(frame, **q).tolist()
+
+
+def test_page_and_choices(frame):
+    index = SubmissionIndex(frame)
+    rows = index.query(site=SITES[0])
+    assert index.page(rows, 2, 10).index.tolist() == rows[10:20].tolist()
+    assert index.page(rows, 99, 10).empty
+    assert index.years() == sorted(set(frame["שנת לימודים"]))
+    assert set(index.sites()) <= set(SITES)
+
+
+def test_index_cache_rebuilds_only_for_a_new_frame(frame):
+    cache = IndexCache()
+    first = cache.get("master", frame)
+    assert cache.get("master", frame) is first
+    assert cache.get("master", frame.copy()) is not first
+    assert cache.get("log", frame) is not cache.get("master", frame)
@@ -0,0 +1,106 @@
+# tests/test_app.py
+# -*- coding: utf-8 -*-
+"""The Streamlit app, run headless with AppTest, each case in its own interpreter."""
+import textwrap
+
+import pytest
+
+from tests.fakes import run_isolated
+
+# נטענים רק בשליחה ובדף המנהל — לא בדף הסטודנט
+HEAVY = ("pandas", "pyarrow", "gspread", "google.oauth2", "xlsxwriter")
+
+PRELUDE = textwrap.dedent("""
+    import json, sys, threading, time
+    from pathlib import Path
+    from streamlit.testing.v1 import AppTest
+    from tests.fakes import APP, FakeWorksheet, install_fake_sheets, sample_row
+
+    ws = FakeWorksheet(Path("sheet.jsonl"))
+    install_fake_sheets(ws)
+
+    def app(admin=False):
+        at = AppTest.from_file(str(APP), default_timeout=120)
+        at.secrets["sheets"] = {"spreadsheet_id": "test"}
+        at.secrets["gcp_service_account"] = {}
+        if admin:
+            at.query_params["admin"] = "1"
+        return at
+
+    def wait_for(cond, timeout=30):
+        deadline = time.monotonic() + timeout
+        while not cond() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return cond()
+""")
+
+
+def test_leftover_outbox_is_flushed_when_the_process_starts(workdir):
+    out = run_isolated(PRELUDE + textwrap.dedent("""
+        from config import COLUMNS_ORDER, OUTBOX_FILE
+        from sheets_sync import SheetsOutbox
+
+        outbox = SheetsOutbox(OUTBOX_FILE, COLUMNS_ORDER)
+        outbox.put_many([sample_row(1), sample_row(2)])
+        at = app()
+        at.run()
+        flushed = wait_for(lambda: outbox.status()["depth"] == 0)
+        print(json.dumps({"flushed": flushed, "errors": [e.value for e in at.exception],
+                          "ids": [r[COLUMNS_ORDER.index("תעודת זהות")] for r in ws.rows[1:]]}))
+    """), workdir)
+    assert out == {"flushed": True, "errors": [], "ids": ["000000001", "000000002"]}
+
+
+def test_student_page_does_not_start_the_sync_with_an_empty_outbox(workdir):
+    out = run_isolated(PRELUDE + textwrap.dedent("""
+        at = app()
+        at.run()
+        print(json.dumps({"threads": [t.name for t in threading.enumerate() if t.name == "sheets-sync"],
+                          "calls": ws.calls, "errors": [e.value for e in at.exception]}))
+    """), workdir)
+    assert out == {"threads": [], "calls": 0, "errors": []}
+
+
+def test_answers_survive_moving_between_steps(workdir):
+    out = run_isolated(PRELUDE + textwrap.dedent("""
+        at = app()
+        at.run()
+        at.text_input(key="first_name").input("דנה")
+        at.text_input(key="phone").input("050-1234567")
+        at.selectbox(key="track").select_index(1)
+        at.run()
+        at.button(key="jump_2").click()
+        at.run()
+        on_academic = [n.label for n in at.number_input]
+        at.button(key="jump_0").click()
+        at.run()
+        print(json.dumps({"academic": on_academic, "name": at.text_input(key="first_name").value,
+                          "phone": at.text_input(key="phone").value,
+                          "track": at.selectbox(key="track").index, "errors": [e.value for e in at.exception]}))
+    """), workdir)
+    assert out == {"academic": ["ממוצע ציונים *"], "name": "דנה", "phone": "050-1234567", "track": 1,
+                   "errors": []}
+
+
+@pytest.mark.parametrize("admin", [False, True])
+def test_heavy_stacks_load_only_on_the_admin_page(workdir, admin):
+    out = run_isolated(textwrap.dedent(f"""
+        import json, sys
+        from streamlit.testing.v1 import AppTest
+        from tests.fakes import APP
+
+        before = set(sys.modules)
+        at = AppTest.from_file(str(APP), default_timeout=120)
+        at.secrets["sheets"] = {{"spreadsheet_id": "test"}}
+        at.secrets["gcp_service_account"] = {{}}
+        if {admin}:
+            at.query_params["admin"] = "1"
+        at.run()
+        print(json.dumps({{"loaded": [m for m in {HEAVY!r} if m in sys.modules and m not in before],
+                          "errors": [e.value for e in at.exception]}}))
+    """), workdir)
+    assert out["errors"] == []
+    if admin:
+        assert "pandas" in out["loaded"]
+    else:
+        assert out["loaded"] == []
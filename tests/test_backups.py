@@ -0,0 +1,97 @@
+# tests/test_backups.py
+# -*- coding: utf-8 -*-
+import gzip
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+import backups
+from backups import BackupManager, RetentionPolicy
+from config import COLUMNS_ORDER
+from storage import normalize_id
+
+ID = "תעודת זהות"
+T0 = datetime(2025, 9, 1, 8, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """backups._now, moved forward by the test (one minute per `clock.tick()`)."""
+    class Clock:
+        now = T0
+
+        def tick(self, minutes: int = 1) -> datetime:
+            self.now += timedelta(minutes=minutes)
+            return self.now
+    c = Clock()
+    monkeypatch.setattr(backups, "_now", lambda: c.now)
+    return c
+
+
+def ids(df: pd.DataFrame) -> list[str]:
+    return df[ID].map(normalize_id).tolist()
+
+
+def test_restore_applies_delta_and_replacements(workdir, clock, make_row):
+    mgr = BackupManager(workdir / "backups", COLUMNS_ORDER)
+    mgr.snapshot(pd.DataFrame([make_row(1), make_row(2)]), 2)
+    at_snapshot = clock.now
+    clock.tick()
+    mgr.record_many([3], [make_row(3)])
+    at_first_delta = clock.now
+    clock.tick()
+    # הגשה חדשה של סטודנט 1 (keep_latest) — השורה מהסנאפשוט יורדת
+    mgr.record_many([4, 5], [make_row(1, **{"כתובת": "רחוב חדש"}), make_row(4)], ["000000001", None])
+
+    df = mgr.restore()
+    assert ids(df) == ["000000002", "000000003", "000000001", "000000004"]
+    assert df.loc[df[ID].map(normalize_id) == "000000001", "כתובת"].tolist() == ["רחוב חדש"]
+    assert list(df.columns) == COLUMNS_ORDER
+    assert ids(mgr.restore(at_first_delta)) == ["000000001", "000000002", "000000003"]
+    assert ids(mgr.restore(at_snapshot)) == ["000000001", "000000002"]
+    with pytest.raises(LookupError):
+        mgr.restore(T0 - timedelta(seconds=1))
+
+
+def test_restore_replacing_a_row_from_the_same_delta(workdir, clock, make_row):
+    mgr = BackupManager(workdir / "backups", COLUMNS_ORDER)
+    mgr.snapshot(pd.DataFrame(columns=COLUMNS_ORDER), 0)
+    clock.tick()
+    mgr.record_many([1, 2], [make_row(1), make_row(2)])
+    mgr.record_many([3], [make_row(1, **{"כתובת": "רחוב חדש"})], ["000000001"])
+    df = mgr.restore()
+    assert ids(df) == ["000000002", "000000001"]
+    assert df["כתובת"].tolist()[-1] == "רחוב חדש"
+
+
+def test_restore_stops_at_a_torn_delta_record(workdir, clock, make_row):
+    mgr = BackupManager(workdir / "backups", COLUMNS_ORDER)
+    mgr.snapshot(pd.DataFrame([make_row(1)]), 1)
+    clock.tick()
+    mgr.record_many([2], [make_row(2)])
+    (delta,) = (workdir / "backups").glob("delta_*.jsonl.gz")
+    with gzip.open(delta, "at", encoding="utf-8") as f:
+        f.write('{"seq": 3, "ts": "2025-09-01T08:01:00+00:00", "row": {"תעודת')
+    assert ids(mgr.restore()) == ["000000001", "000000002"]
+
+
+def test_new_snapshot_starts_a_new_delta_and_prunes(workdir, clock, make_row):
+    mgr = BackupManager(workdir / "backups", COLUMNS_ORDER, RetentionPolicy.from_mapping({"keep_snapshots": 2}))
+    for n in range(1, 4):
+        mgr.snapshot(pd.DataFrame([make_row(i) for i in range(1, n + 1)]), n)
+        clock.tick()
+        mgr.record_many([10 + n], [make_row(10 + n)])
+        clock.tick()
+    assert [s.seq for s in mgr.snapshots()] == [2, 3]
+    assert len(mgr.files()) == 4
+    assert ids(mgr.restore()) == ["000000001", "000000002", "000000003", "000000013"]
+    # מופע חדש ממשיך מאותו בסיס ומונה את הדלתא שכבר נכתבה
+    again = BackupManager(workdir / "backups", COLUMNS_ORDER)
+    assert again._rows_since_snapshot == 1
+
+
+def test_restore_cli_without_snapshot_fails_cleanly(workdir, capsys):
+    assert backups.main(["--dir", str(workdir / "empty"), "restore", "--out", "out.csv"]) == 1
+    assert capsys.readouterr().err.startswith("cannot restore: no snapshot")
+    assert not (workdir / "out.csv").exists()
@@ -0,0 +1,144 @@
+# tests/test_exports.py
+# -*- coding: utf-8 -*-
+import gzip
+import re
+import zipfile
+from io import BytesIO
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import SITES
+from exports import (
+    SITE_RANK_COL, ExportCache, column_widths, df_to_excel_bytes, iter_csv_gz, iter_parquet, iter_site_workbooks,
+    site_groups, write_excel_book,
+)
+from schema import to_typed
+
+NS = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+def read_xlsx(data: bytes) -> dict[str, list[list]]:
+    """Cell values per worksheet (inline or shared strings, numbers as float) — no openpyxl needed."""
+    zf = zipfile.ZipFile(BytesIO(data))
+    shared = []
+    if "xl/sharedStrings.xml" in zf.namelist():
+        root = ElementTree.fromstring(zf.read("xl/sharedStrings.xml"))
+        shared = ["".join(t.text or "" for t in si.iter(f"{{{NS['m']}}}t")) for si in root.findall("m:si", NS)]
+    book = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+    names = [s.get("name") for s in book.find("m:sheets", NS)]
+    out = {}
+    for i, name in enumerate(names, start=1):
+        root = ElementTree.fromstring(zf.read(f"xl/worksheets/sheet{i}.xml"))
+        rows = []
+        for row in root.iter(f"{{{NS['m']}}}row"):
+            cells = {}
+            for c in row.findall("m:c", NS):
+                col = re.match(r"[A-Z]+", c.get("r")).group()
+                col = sum((ord(ch) - 64) * 26 ** k for k, ch in enumerate(reversed(col))) - 1
+                kind, v = c.get("t"), c.find("m:v", NS)
+                if kind == "inlineStr":
+                    cells[col] = "".join(t.text or "" for t in c.iter(f"{{{NS['m']}}}t"))
+                elif kind == "s":
+                    cells[col] = shared[int(v.text)]
+                elif v is not None:
+                    cells[col] = float(v.text)
+            rows.append([cells.get(j) for j in range(max(cells) + 1)] if cells else [])
+        out[name] = rows
+    return out
+
+
+def test_excel_round_trip_keeps_text_and_blanks():
+    df = pd.DataFrame({"תעודת זהות": ["012345678", "000000002"], "ממוצע": [88.5, np.nan],
+                       "טלפון": ["050-1234567", "=1+1"],
+                       "מקום הכשרה 1": pd.Categorical(["א", None], categories=["א", "ב"])})
+    (rows,) = read_xlsx(df_to_excel_bytes(df, "מאסטר")).values()
+    assert rows[0] == list(df.columns)
+    # ת"ז נשארת טקסט עם אפסים מובילים, נוסחה אינה מחושבת, NaN -> תא ריק
+    assert rows[1] == ["012345678", 88.5, "050-1234567", "א"]
+    assert rows[2] == ["000000002", None, "=1+1"]
+
+
+def test_workbook_with_several_sheets():
+    data = BytesIO()
+    write_excel_book({"a": pd.DataFrame({"x": [1]}), "b": pd.DataFrame({"y": ["z"]})}, data)
+    assert read_xlsx(data.getvalue()) == {"a": [["x"], [1.0]], "b": [["y"], ["z"]]}
+
+
+def test_column_widths_are_clamped_and_sampled():
+    long = "א" * 200
+    df = pd.DataFrame({"id": ["1"] * 5000, "text": ["ab"] * 4999 + [long],
+                       "cat": pd.Categorical(["כן"] * 5000, categories=["כן", "ארוך מאוד מאוד מאוד"])})
+    # הדגימה כוללת את השורות האחרונות; קטגוריה שאינה בשימוש לא נמדדת
+    assert column_widths(df) == [12, 60, 12]
+
+
+def test_export_cache_builds_once_per_fingerprint(workdir):
+    src = workdir / "master.csv"
+    src.write_text("a\n1\n")
+    cache, built = ExportCache(workdir / "exports"), []
+
+    def build(path):
+        built.append(path)
+        path.write_bytes(b"xlsx")
+    key = ExportCache.fingerprint(src)
+    first = cache.get("master", ".xlsx", key, build)
+    assert cache.get("master", ".xlsx", key, build) == first and len(built) == 1
+    src.write_text("a\n1\n2\n")
+    second = cache.get("master", ".xlsx", ExportCache.fingerprint(src), build)
+    assert second != first and len(built) == 2
+    assert [p.name for p in (workdir / "exports").iterdir()] == [second.name]
+
+
+def students(make_row, n: int) -> pd.DataFrame:
+    return to_typed(pd.DataFrame([make_row(i) for i in range(1, n + 1)]))
+
+
+def test_csv_gz_in_chunks_round_trip(make_row):
+    df = students(make_row, 7)
+    text = gzip.decompress(b"".join(iter_csv_gz(df, chunk_rows=2))).decode("utf-8")
+    # כותרת אחת בלבד, גם כשהשורות נכתבות בכמה חלקים
+    assert text.startswith("\ufeff") and text.count("\n") == 8 and text.count("תעודת זהות") == 1
+    back = pd.read_csv(BytesIO(text.encode("utf-8")), dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    assert back["תעודת זהות"].tolist() == df["תעודת זהות"].tolist()
+    assert list(back.columns) == list(df.columns)
+
+
+def test_parquet_row_groups_keep_the_types(make_row):
+    df = students(make_row, 5)
+    data = b"".join(iter_parquet(df, row_group=2))
+    f = pq.ParquetFile(pa.BufferReader(data))
+    assert f.metadata.num_row_groups == 3
+    back = f.read().to_pandas()
+    assert isinstance(back["מין"].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(back, df, check_categorical=False)
+
+
+def test_site_groups_match_a_filter_per_site(make_row):
+    df = students(make_row, 40)
+    # אותו אתר פעמיים — נשאר הדירוג הטוב יותר
+    df.loc[0, "מקום הכשרה 3"] = df.loc[0, "מקום הכשרה 1"]
+    groups = site_groups(df)
+    for site in SITES:
+        ranks = pd.Series(np.nan, index=df.index)
+        for r in (3, 2, 1):
+            ranks[df[f"מקום הכשרה {r}"].astype(object) == site] = r
+        ranks = ranks.fillna(pd.to_numeric(df[f"דירוג_{site}"], errors="coerce").astype(float))
+        expected = ranks.dropna().sort_values(kind="stable")
+        rows, rank = groups[site]
+        assert rows.tolist() == expected.index.tolist()
+        assert rank.tolist() == expected.tolist()
+
+
+def test_site_workbooks_zip(make_row):
+    df = students(make_row, 12)
+    zf = zipfile.ZipFile(BytesIO(b"".join(iter_site_workbooks(df))))
+    assert len(zf.namelist()) == len(SITES)
+    rows, ranks = site_groups(df)[SITES[0]]
+    (sheet,) = read_xlsx(zf.read(zf.namelist()[0])).values()
+    assert sheet[0] == [SITE_RANK_COL, *df.columns]
+    assert [r[0] for r in sheet[1:]] == ranks.tolist()
+    assert [r[1 + list(df.columns).index("תעודת זהות")] for r in sheet[1:]] == df["תעודת זהות"].iloc[rows].tolist()
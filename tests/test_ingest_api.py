@@ -0,0 +1,98 @@
+# tests/test_ingest_api.py
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import json
+
+import pandas as pd
+import pytest
+
+import ingest_api
+from config import COLUMNS_ORDER
+
+AUTH = {"Authorization": "Bearer secret"}
+
+
+@pytest.fixture
+def client(workdir, monkeypatch):
+    # רכיבים חדשים בכל בדיקה, בתיקיית העבודה שלה; בלי קובץ סודות — בלי Google Sheets
+    monkeypatch.setattr(ingest_api, "_components", {})
+    monkeypatch.setenv("INGEST_TOKEN", "secret")
+    monkeypatch.setenv("INGEST_BATCH_ROWS", "2")
+    return ingest_api.app.test_client()
+
+
+def post_csv(client, rows, **kw):
+    body = pd.DataFrame(rows, columns=COLUMNS_ORDER).to_csv(index=False).encode("utf-8")
+    return client.post("/ingest", data=body, content_type="text/csv", headers=AUTH, **kw)
+
+
+def lines(response) -> list[dict]:
+    return [json.loads(x) for x in response.get_data(as_text=True).splitlines()]
+
+
+def test_csv_rows_are_committed_and_rejected_rows_reported(client, make_row):
+    rows = [make_row(1), make_row(2, **{"אימייל": "not-an-email"}), make_row(3)]
+    out = lines(post_csv(client, rows))
+    assert [x["status"] for x in out[:-1]] == ["inserted", "rejected", "inserted"]
+    assert out[1]["errors"]
+    assert out[-1]["summary"]["rows"] == 3 and out[-1]["summary"]["rejected"] == 1
+    assert "error" not in out[-1]
+    # ת"ז נשמרת כטקסט, עם האפסים המובילים
+    assert set(ingest_api.components()["store"].to_dataframe()["תעודת זהות"]) == {"000000001", "000000003"}
+
+
+def test_uploading_the_same_file_twice_stores_it_once(client, make_row):
+    rows = [make_row(1), make_row(2)]
+    post_csv(client, rows)
+    out = lines(post_csv(client, rows))
+    assert [x["status"] for x in out[:-1]] == ["duplicate", "duplicate"]
+    assert ingest_api.components()["store"].count() == 2
+
+
+def test_jsonl_with_a_broken_line(client, make_row):
+    body = "\n".join([json.dumps(make_row(1), ensure_ascii=False), "{not json", "[1, 2]"]).encode()
+    out = lines(client.post("/ingest", data=body, content_type="application/x-ndjson", headers=AUTH))
+    assert [x["status"] for x in out[:-1]] == ["inserted", "rejected", "rejected"]
+    assert out[1]["errors"][0].startswith("invalid JSON")
+
+
+def test_request_errors(client, make_row):
+    assert client.post("/ingest", data=b"", content_type="text/csv").status_code == 401
+    assert client.post("/ingest", data=b"a,b\n1,2\n", content_type="text/csv", headers=AUTH).status_code == 400
+    assert client.post("/ingest", data=b"x", content_type="text/plain", headers=AUTH).status_code == 415
+
+
+def test_a_failure_mid_stream_ends_with_an_error_summary(client, make_row, monkeypatch):
+    commit = ingest_api.commit_local_batch
+    calls = []
+
+    def flaky(items, *args, **kw):
+        calls.append(len(items))
+        if len(calls) == 2:
+            raise TimeoutError("write lock busy")
+        return commit(items, *args, **kw)
+    monkeypatch.setattr(ingest_api, "commit_local_batch", flaky)
+    out = lines(post_csv(client, [make_row(n) for n in range(1, 6)]))
+    # האצווה הראשונה נשמרה; השנייה נכשלה והזרם הסתיים בשורת סיכום עם השגיאה
+    assert [x.get("status") for x in out[:-1]] == ["inserted", "inserted", "error"]
+    assert out[-2]["row"] == 3
+    assert out[-1]["summary"]["rows"] == 2
+    assert out[-1]["error"] == "TimeoutError: write lock busy"
+    assert ingest_api.components()["store"].count() == 2
+
+
+def test_health_and_metrics(client, make_row):
+    post_csv(client, [make_row(1)])
+    assert client.get("/health").get_json()["rows"] == 1
+    assert client.get("/metrics").status_code == 200
+
+
+def test_export_streams_the_master(client, make_row):
+    post_csv(client, [make_row(1), make_row(2)])
+    assert client.get("/export/master.csv.gz").status_code == 401
+    assert client.get("/export/master.xlsx", headers=AUTH).status_code == 404
+    response = client.get("/export/master.csv.gz", headers=AUTH)
+    assert response.headers["Content-Disposition"] == "attachment; filename=master.csv.gz"
+    back = pd.read_csv(io.BytesIO(gzip.decompress(response.data)), dtype=str, encoding="utf-8-sig")
+    assert back["תעודת זהות"].tolist() == ["000000001", "000000002"]
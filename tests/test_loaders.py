@@ -0,0 +1,89 @@
+# tests/test_loaders.py
+# -*- coding: utf-8 -*-
+import codecs
+import gzip
+import os
+
+import pandas as pd
+import pytest
+
+from loaders import CachedCsvLoader, load_csv_safely, sniff_csv
+
+HEADER = "תעודת זהות,שם פרטי\n"
+
+
+@pytest.mark.parametrize("head, encoding, sep", [
+    (codecs.BOM_UTF8 + "a,b\n1,2\n".encode(), "utf-8-sig", ","),
+    ("שם;עיר\nדנה;חיפה\n".encode(), "utf-8", ";"),
+    # תו עברי שנחתך בסוף הדגימה עדיין UTF-8
+    ("שם\tעיר\n".encode() + "ד".encode()[:1], "utf-8", "\t"),
+    (b"name|city\n\xe9t\xe9|x\n", "latin-1", "|"),
+])
+def test_sniff_csv(head, encoding, sep):
+    d = sniff_csv(head)
+    assert (d.encoding, d.sep) == (encoding, sep)
+
+
+def test_load_csv_safely_falls_back_and_cleans_headers(workdir):
+    p = workdir / "a.csv"
+    p.write_bytes(codecs.BOM_UTF8 + " תעודת זהות ,שם\n1,דנה\n2,רון,עודף\n3,גל\n".encode())
+    df = load_csv_safely(p)
+    assert list(df.columns) == ["תעודת זהות", "שם"]
+    assert df["שם"].tolist() == ["דנה", "גל"]      # השורה השבורה דולגה
+    assert load_csv_safely(workdir / "missing.csv").empty
+
+
+def _touch_later(path):
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+
+def test_cached_loader_reuses_the_frame_until_the_file_changes(workdir):
+    p = workdir / "master.csv"
+    p.write_text(HEADER + "1,דנה\n", encoding="utf-8-sig")
+    loader = CachedCsvLoader()
+    first = loader.load(p)
+    assert loader.load(p) is first
+    p.write_text(HEADER + "2,רון\n", encoding="utf-8-sig")
+    _touch_later(p)
+    assert loader.load(p)["שם פרטי"].tolist() == ["רון"]
+    p.unlink()
+    assert loader.load(p).empty
+
+
+def test_append_only_file_parses_only_the_new_complete_rows(workdir, monkeypatch):
+    p = workdir / "log.csv"
+    p.write_text(HEADER + "1,דנה\n", encoding="utf-8-sig")
+    loader = CachedCsvLoader()
+    assert len(loader.load(p, append_only=True)) == 1
+
+    parsed = []
+    parse = CachedCsvLoader._parse
+    monkeypatch.setattr(CachedCsvLoader, "_parse",
+                        staticmethod(lambda data, *a: parsed.append(data) or parse(data, *a)))
+    with open(p, "a", encoding="utf-8") as f:
+        f.write("2,רון\n3,ג")          # השורה האחרונה עוד נכתבת
+    df = loader.load(p, append_only=True)
+    assert parsed == ["2,רון\n".encode()]
+    assert df["שם פרטי"].tolist() == ["דנה", "רון"]
+    with open(p, "a", encoding="utf-8") as f:
+        f.write("ל\n")
+    df = loader.load(p, append_only=True)
+    assert df["שם פרטי"].tolist() == ["דנה", "רון", "גל"]
+    assert df["תעודת זהות"].tolist() == [1, 2, 3]
+
+
+def test_gzip_file_is_decompressed(workdir):
+    p = workdir / "segment.csv.gz"
+    p.write_bytes(gzip.compress((HEADER + "1,דנה\n").encode("utf-8-sig")))
+    assert CachedCsvLoader().load(p)["שם פרטי"].tolist() == ["דנה"]
+
+
+def test_typed_load_converts_with_the_schema(workdir):
+    p = workdir / "master.csv"
+    pd.DataFrame({"תעודת זהות": ["012345678"], "ממוצע": ["88.5"], "מקום הכשרה 1": [""]}).to_csv(
+        p, index=False, encoding="utf-8-sig")
+    df = CachedCsvLoader().load(p, typed=True)
+    assert df["תעודת זהות"].tolist() == ["012345678"]
+    assert df["ממוצע"].tolist() == [88.5]
+    assert isinstance(df["מקום הכשרה 1"].dtype, pd.CategoricalDtype) and df["מקום הכשרה 1"].isna().all()
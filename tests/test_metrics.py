@@ -0,0 +1,92 @@
+# tests/test_metrics.py
+# -*- coding: utf-8 -*-
+import math
+import textwrap
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import BUCKETS, CONTENT_TYPE, Histogram, Registry, serve
+from tests.fakes import run_isolated
+
+
+def test_histogram_quantiles_stay_inside_the_bucket_and_the_max():
+    h = Histogram()
+    for ms in range(1, 101):
+        h.observe(ms / 1000)
+    assert h.count == 100 and h.max == 0.1
+    assert 0.025 <= h.quantile(0.5) <= 0.05
+    assert h.quantile(0.99) <= h.max
+    assert math.isnan(Histogram().quantile(0.5))
+    h.observe(100.0)
+    assert h.counts[-1] == 1 and h.quantile(1.0) == BUCKETS[-1]
+
+
+def test_span_count_and_summary():
+    reg = Registry()
+    with reg.span("commit_stage", stage="log"):
+        pass
+    with pytest.raises(ValueError):
+        with reg.span("commit_stage", stage="log"):
+            raise ValueError
+    reg.count("commits", status="inserted")
+    reg.count("commits", by=2, status="inserted")
+    (row,) = reg.summary()
+    assert (row["name"], row["labels"], row["count"]) == ("commit_stage", "stage=log", 2)
+    assert {(c["name"], c["value"]) for c in reg.counters()} == {("commit_stage_errors", 1), ("commits", 3)}
+    reg.reset()
+    assert reg.summary() == [] and reg.counters() == []
+
+
+def test_disabled_registry_records_nothing():
+    reg = Registry(enabled=False)
+    with reg.span("x"):
+        pass
+    reg.count("y")
+    reg.observe("z", 1.0)
+    assert reg.summary() == [] and reg.counters() == [] and reg.prometheus() == "\n"
+
+
+def test_prometheus_text():
+    reg = Registry(buckets=(0.1, 1.0))
+    reg.observe("submit", 0.05, stage="total")
+    reg.observe("submit", 0.5, stage="total")
+    reg.count("wizard_reruns", step=2, scope='a"b')
+    assert reg.prometheus().splitlines() == [
+        "# TYPE students_submit_seconds histogram",
+        'students_submit_seconds_bucket{stage="total",le="0.1"} 1',
+        'students_submit_seconds_bucket{stage="total",le="1.0"} 2',
+        'students_submit_seconds_bucket{stage="total",le="+Inf"} 2',
+        'students_submit_seconds_sum{stage="total"} 0.55',
+        'students_submit_seconds_count{stage="total"} 2',
+        "# TYPE students_wizard_reruns_total counter",
+        'students_wizard_reruns_total{scope="a\\"b",step="2"} 1',
+    ]
+
+
+def test_serve_metrics_endpoint():
+    reg = Registry()
+    reg.count("commits", status="inserted")
+    server = serve(0, registry=reg)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(base + "/metrics") as resp:
+            assert resp.headers["Content-Type"] == CONTENT_TYPE
+            assert 'students_commits_total{status="inserted"} 1' in resp.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(base + "/other")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("value, enabled", [("0", False), ("no", False), ("1", True)])
+def test_metrics_enabled_from_the_environment(workdir, monkeypatch, value, enabled):
+    monkeypatch.setenv("METRICS_ENABLED", value)
+    out = run_isolated(textwrap.dedent("""
+        import json
+        from metrics import REGISTRY
+        print(json.dumps({"enabled": REGISTRY.enabled}))
+    """), workdir)
+    assert out == {"enabled": enabled}
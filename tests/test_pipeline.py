@@ -0,0 +1,82 @@
+# tests/test_pipeline.py
+# -*- coding: utf-8 -*-
+import pytest
+
+from backups import BackupManager
+from config import COLUMNS_ORDER
+from pipeline import commit_local_batch, open_snapshot
+from sheets_sync import SheetsOutbox
+from snapshot import ParquetSnapshot
+from stats import RunningStats, StatsFile
+from storage import KEEP_LATEST, MasterStore, normalize_id
+from submission_log import SegmentedLog
+
+
+@pytest.fixture
+def parts(workdir):
+    store = MasterStore(workdir / "master.sqlite3", COLUMNS_ORDER)
+    backups = BackupManager(workdir / "backups", COLUMNS_ORDER)
+    backups.snapshot(store.to_dataframe(), 0)
+    stats = StatsFile(workdir / "stats.json")
+    stats.replace(RunningStats())
+    return (store, backups, SheetsOutbox(workdir / "outbox.sqlite3", COLUMNS_ORDER), stats,
+            SegmentedLog(workdir / "log", COLUMNS_ORDER))
+
+
+def test_failed_step_stays_pending_and_is_retried_with_the_next_batch(parts, make_row, monkeypatch):
+    store, backups, outbox, stats, log = parts
+    append = log.append
+
+    def broken(rows):
+        raise OSError("disk full")
+    monkeypatch.setattr(log, "append", broken)
+    results = commit_local_batch([(make_row(1), "a"), (make_row(2), "b")], *parts, policy=KEEP_LATEST)
+    assert [r.status for r in results] == ["inserted", "inserted"]
+    # המאסטר והשלבים האחרים הצליחו; רק היומן ממתין
+    assert store.count() == 2
+    assert outbox.status()["depth"] == 2
+    assert stats.load().counters["total"][""] == 2
+    assert store.pending_status() == {"rows": 2, "last_error": "log: disk full"}
+    assert log.read_all().empty
+
+    monkeypatch.setattr(log, "append", append)
+    # קבוצה של כפילויות בלבד עדיין משלימה את העבודה שנשארה
+    assert [r.status for r in commit_local_batch([(make_row(1), "a")], *parts)] == ["duplicate"]
+    assert store.pending_status()["rows"] == 0
+    assert log.read_all()["תעודת זהות"].map(normalize_id).tolist() == ["000000001", "000000002"]
+    assert outbox.status()["depth"] == 2
+    assert backups.restore()["תעודת זהות"].map(normalize_id).tolist() == ["000000001", "000000002"]
+
+
+def test_replacement_updates_stats_and_logs_both_versions(parts, make_row):
+    store, _, outbox, stats, log = parts
+    commit_local_batch([(make_row(1), None), (make_row(2), None)], *parts)
+    commit_local_batch([(make_row(1, **{"מסלול לימודים": "אחר"}), None)], *parts)
+    assert stats.load().diff(RunningStats.from_frame(store.to_dataframe())) == []
+    assert len(log.read_all()) == 3
+    assert outbox.status()["depth"] == 3
+
+
+def test_failed_parquet_refresh_stays_pending(parts, make_row, monkeypatch, workdir):
+    store = parts[0]
+    snap = ParquetSnapshot(workdir / "parquet")
+    refresh = snap.refresh
+
+    def broken(store):
+        raise OSError("disk full")
+    monkeypatch.setattr(snap, "refresh", broken)
+    commit_local_batch([(make_row(1), "a")], *parts, snapshot=snap)
+    assert store.pending_status() == {"rows": 1, "last_error": "parquet: disk full"}
+    monkeypatch.setattr(snap, "refresh", refresh)
+    # גם אצווה של כפילויות בלבד משלימה את הרענון
+    results = commit_local_batch([(make_row(1), "a")], *parts, snapshot=snap)
+    assert [r.status for r in results] == ["duplicate"]
+    assert store.pending_status()["rows"] == 0
+    assert snap.read()["תעודת זהות"].tolist() == ["000000001"]
+
+
+def test_open_snapshot_survives_a_failed_refresh(parts, monkeypatch):
+    def broken(self, store):
+        raise OSError("disk full")
+    monkeypatch.setattr(ParquetSnapshot, "refresh", broken)
+    assert isinstance(open_snapshot(parts[0]), ParquetSnapshot)
@@ -0,0 +1,97 @@
+# tests/test_placement.py
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from placement import deferred_acceptance
+
+
+def random_market(seed: int, n: int = 60, m: int = 8, ranks: int = 3):
+    rng = np.random.default_rng(seed)
+    R = np.zeros((n, m), dtype=int)
+    for s in range(n):
+        R[s, rng.choice(m, ranks, replace=False)] = np.arange(1, ranks + 1)
+    E = rng.random((n, m)) > 0.15
+    capacity = rng.integers(0, 10, m)
+    priority = rng.permutation(n).astype(float)
+    return R, E, capacity, priority
+
+
+def blocking_pairs(R, E, capacity, priority, assigned) -> list[tuple[int, int]]:
+    """(student, site) pairs that would both rather be matched to each other."""
+    out = []
+    for s in range(len(R)):
+        mine = R[s, assigned[s]] if assigned[s] >= 0 else np.inf
+        for j in np.flatnonzero((R[s] > 0) & (R[s] < mine) & E[s]):
+            held = np.flatnonzero(assigned == j)
+            if len(held) < capacity[j] or (len(held) and priority[held].min() < priority[s]):
+                out.append((s, int(j)))
+    return out
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matching_is_stable_and_within_capacity(seed):
+    R, E, capacity, priority = random_market(seed)
+    assigned = deferred_acceptance(R, E, capacity, priority, fill_unranked=False)
+    assert (np.bincount(assigned[assigned >= 0], minlength=R.shape[1]) <= capacity).all()
+    ok = assigned >= 0
+    # רק מוסדות שהסטודנט דירג ושהוא כשיר אליהם
+    assert (R[ok, assigned[ok]] > 0).all() and E[ok, assigned[ok]].all()
+    assert blocking_pairs(R, E, capacity, priority, assigned) == []
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_fill_unranked_places_everyone_when_there_is_room(seed):
+    R, _, capacity, priority = random_market(seed)
+    E = np.ones_like(R, dtype=bool)
+    capacity = capacity + len(R) // R.shape[1] + 1
+    assigned = deferred_acceptance(R, E, capacity, priority)
+    assert (assigned >= 0).all()
+    assert (np.bincount(assigned, minlength=R.shape[1]) <= capacity).all()
+
+
+def test_higher_priority_wins_the_last_seat():
+    R = np.array([[1, 2], [1, 2], [1, 2]])
+    E = np.ones_like(R, dtype=bool)
+    assigned = deferred_acceptance(R, E, np.array([1, 1]), np.array([1.0, 3.0, 2.0]), fill_unranked=False)
+    assert assigned.tolist() == [-1, 0, 1]
+
+
+def test_former_partners_are_not_placed_together():
+    R = np.array([[1, 2], [1, 2]])
+    E = np.ones_like(R, dtype=bool)
+    partners = {0: {1}, 1: {0}}
+    assigned = deferred_acceptance(R, E, np.array([2, 2]), np.array([1.0, 2.0]), partners)
+    assert assigned.tolist() == [1, 0]
+
+
+def test_every_former_partner_at_the_site_is_evicted():
+    # 1 ו־2 (שאינם בני זוג זה של זה) כבר במוסד 0; 0 — בעל העדיפות הגבוהה — בן זוג לשעבר של שניהם
+    R = np.array([[1, 2], [1, 2], [1, 2]])
+    E = np.ones_like(R, dtype=bool)
+    partners = {0: {1, 2}, 1: {0}, 2: {0}}
+    assigned = deferred_acceptance(R, E, np.array([3, 3]), np.array([3.0, 1.0, 2.0]), partners)
+    assert assigned.tolist() == [0, 1, 1]
+    for s, others in partners.items():
+        assert all(assigned[s] != assigned[t] for t in others)
+
+
+def test_a_student_with_a_stronger_former_partner_at_the_site_moves_on():
+    R = np.array([[1, 2], [1, 2], [1, 2]])
+    E = np.ones_like(R, dtype=bool)
+    partners = {0: {1, 2}, 1: {0}, 2: {0}}
+    assigned = deferred_acceptance(R, E, np.array([3, 3]), np.array([2.0, 1.0, 3.0]), partners)
+    assert assigned.tolist() == [1, 0, 0]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_no_site_ever_holds_two_former_partners(seed):
+    R, E, capacity, priority = random_market(seed, n=40, m=3)
+    rng = np.random.default_rng(seed)
+    partners: dict[int, set[int]] = {}
+    for a, b in rng.integers(0, len(R), (30, 2)):
+        if a != b:
+            partners.setdefault(int(a), set()).add(int(b))
+            partners.setdefault(int(b), set()).add(int(a))
+    assigned = deferred_acceptance(R, E, capacity + 5, priority, partners)
+    assert all(assigned[s] < 0 or assigned[s] != assigned[t] for s, ts in partners.items() for t in ts)
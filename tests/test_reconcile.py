@@ -0,0 +1,89 @@
+# tests/test_reconcile.py
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+from config import COLUMNS_ORDER
+from reconcile import diff, reconcile, sheet_frame
+from sheets_sync import SheetsOutbox, sheet_values
+from storage import MasterStore
+from tests.fakes import FakeWorksheet
+
+ID, DATE = "תעודת זהות", "תאריך שליחה"
+
+
+def serial(when: str) -> float:
+    """Google Sheets serial number of a time."""
+    return (pd.Timestamp(when) - pd.Timestamp("1899-12-30")) / pd.Timedelta(days=1)
+
+
+def frame(*pairs) -> pd.DataFrame:
+    return pd.DataFrame([{ID: i, DATE: d} for i, d in pairs], columns=[ID, DATE])
+
+
+def test_diff_finds_missing_and_sheet_only_rows():
+    local = frame(("000000001", "01/09/2025 10:00:00"), ("000000002", "01/09/2025 11:00:00"),
+                  ("000000003", "01/09/2025 12:00:00"), ("000000004", "02/09/2025 09:00:00"))
+    sheet = frame(("000000001", "01/09/2025 10:00:00"),
+                  ("000000002", "01/09/2025 10:30:00"),     # גרסה קודמת של אותה ת"ז
+                  ("000000009", "01/09/2025 08:00:00"))
+    pending = frame(("000000003", "01/09/2025 12:00:00"))
+    missing, sheet_only = diff(local, sheet, pending)
+    assert missing[ID].tolist() == ["000000002", "000000004"]
+    assert sheet_only[ID].tolist() == ["000000009"]
+
+
+def test_diff_matches_values_the_sheet_converted():
+    local = frame(("012345678", "01/09/2025 10:00:00"), ("000000002", "13/09/2025 10:00:00"))
+    # ת"ז שאיבדה את האפס המוביל, ותאריך שנקרא כמספר סידורי — גם בסדר חודש/יום הפוך
+    sheet = pd.DataFrame({ID: [12345678, "2"],
+                          DATE: [serial("2025-01-09 10:00:00"), serial("2025-09-13 10:00:00")]})
+    missing, sheet_only = diff(local, sheet, frame())
+    assert missing.empty
+    assert sheet_only.empty
+    assert diff(local, sheet.iloc[:1], frame())[0][ID].tolist() == ["000000002"]
+
+
+def test_diff_of_empty_frames():
+    local = frame(("000000001", "01/09/2025 10:00:00"))
+    missing, sheet_only = diff(local, frame(), frame())
+    assert missing[ID].tolist() == ["000000001"] and sheet_only.empty
+    missing, sheet_only = diff(frame(), local, frame())
+    assert missing.empty and sheet_only[ID].tolist() == ["000000001"]
+
+
+@pytest.fixture
+def setup(workdir, make_row):
+    store = MasterStore(workdir / "master.sqlite3", COLUMNS_ORDER)
+    store.commit([(make_row(n, **{DATE: f"01/09/2025 10:00:{n:02d}"}), None) for n in range(1, 6)])
+    outbox = SheetsOutbox(workdir / "outbox.sqlite3", COLUMNS_ORDER)
+    ws = FakeWorksheet(workdir / "sheet.jsonl")
+    sheet_rows = [sheet_values(make_row(n, **{DATE: f"01/09/2025 10:00:{n:02d}"}), COLUMNS_ORDER) for n in (1, 9)]
+    ws.reset([COLUMNS_ORDER] + sheet_rows)
+    outbox.put_many([make_row(5, **{DATE: "01/09/2025 10:00:05"})])
+    return store, outbox, ws
+
+
+def test_reconcile_appends_only_what_the_sheet_and_outbox_lack(setup):
+    store, outbox, ws = setup
+    res = reconcile(ws, store, outbox)
+    assert (res.sheet_rows, res.local_rows, res.pending, res.missing, res.pushed) == (2, 5, 1, 3, 3)
+    assert res.sheet_only[ID].tolist() == ["000000009"]
+    ids = [r[COLUMNS_ORDER.index(ID)] for r in ws.rows[1:]]
+    assert ids == ["000000001", "000000009", "000000002", "000000003", "000000004"]
+    assert reconcile(ws, store, outbox).missing == 0
+
+
+def test_reconcile_refuses_a_large_push(setup):
+    store, outbox, ws = setup
+    with pytest.raises(RuntimeError, match="3 rows missing"):
+        reconcile(ws, store, outbox, max_push=2)
+    assert len(ws.rows) == 3
+    assert reconcile(ws, store, outbox, dry_run=True, max_push=2).pushed == 0
+    assert reconcile(ws, store, outbox, max_push=3).pushed == 3
+
+
+def test_sheet_frame_aligns_columns_by_header():
+    values = [["b", "a", "extra"], ["2", "1", "x"], ["", "", ""], ["4"]]
+    df = sheet_frame(values, ["a", "b", "c"])
+    assert df.to_dict("records") == [{"a": "1", "b": "2", "c": ""}, {"a": "", "b": "4", "c": ""}]
@@ -0,0 +1,74 @@
+# tests/test_recover.py
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import recover
+from backups import BackupManager
+from config import COLUMNS_ORDER
+from submission_log import SegmentedLog
+
+ID = "תעודת זהות"
+DATE = "תאריך שליחה"
+
+
+@pytest.fixture
+def sources(workdir, make_row):
+    """A snapshot, its delta (with a torn last record) and a log segment, oldest file first."""
+    mgr = BackupManager(workdir / "backups", COLUMNS_ORDER)
+    mgr.snapshot(pd.DataFrame([make_row(1), make_row(2)]), 2)
+    mgr.record_many([3, 4], [make_row(3), make_row(1, **{DATE: "02/09/2025 10:00:00", "כתובת": "רחוב חדש"})],
+                    ["", "000000001"])
+    delta = next((workdir / "backups").glob("delta_*.jsonl.gz"))
+    with gzip.open(delta, "at", encoding="utf-8") as f:
+        f.write(json.dumps({"seq": 5, "row": make_row(5)}, ensure_ascii=False)[:40])
+    log = SegmentedLog(workdir / "log", COLUMNS_ORDER)
+    # היומן מחזיק גם את הגרסאות שכבר בגיבוי — הן נספרות פעם אחת
+    log.append([make_row(3), make_row(4, **{DATE: "03/09/2025 10:00:00"})])
+    files = recover.source_files(workdir / "backups", workdir / "missing.csv", workdir / "log")
+    for k, p in enumerate(files):
+        os.utime(p, ns=(k * 10**9, k * 10**9))
+    return files
+
+
+def test_source_files_in_order(sources):
+    assert [p.name.split("_")[0] for p in sources] == ["snapshot", "delta", "00001"]
+
+
+def test_read_delta_stops_at_a_torn_record(sources):
+    df = recover.read_delta(sources[1])
+    assert df[ID].tolist() == ["000000003", "000000001"]
+    assert list(df.columns) == COLUMNS_ORDER
+
+
+def test_merge_keeps_every_version_once_and_the_latest_per_id(workdir, sources):
+    manifest = recover.Manifest(workdir / "work")
+    recover.parse_all(sources, manifest, workers=1, progress=lambda msg: None)
+    history, master = recover.merge(sources, manifest, policy="keep_latest")
+    assert len(history) == 5
+    assert master[ID].tolist() == ["000000002", "000000003", "000000001", "000000004"]
+    assert master.loc[master[ID] == "000000001", "כתובת"].item() == "רחוב חדש"
+    _, kept_first = recover.merge(sources, manifest, policy="keep_first")
+    assert kept_first.loc[kept_first[ID] == "000000001", DATE].item() == "01/09/2025 10:00:00"
+
+
+def test_cli_writes_the_master_and_resumes_from_checkpoints(workdir, sources, capsys):
+    argv = ["--backups", str(workdir / "backups"), "--log", str(workdir / "missing.csv"),
+            "--log-dir", str(workdir / "log"), "--work-dir", str(workdir / "work"),
+            "--out", str(workdir / "out.csv"), "--history", str(workdir / "history.csv"), "--workers", "1"]
+    assert recover.main(argv) == 0
+    out = pd.read_csv(workdir / "out.csv", dtype=str, keep_default_na=False)
+    assert sorted(out[ID]) == ["000000001", "000000002", "000000003", "000000004"]
+    assert len(pd.read_csv(workdir / "history.csv")) == 5
+    capsys.readouterr()
+    # הרצה שנייה: כל הקבצים כבר פוענחו ולא השתנו
+    recover.main(argv)
+    assert "3 files, 3 already parsed, 0 to parse" in capsys.readouterr().out
+    # קובץ שהשתנה מפוענח מחדש
+    sources[0].touch()
+    recover.main(argv)
+    assert "1 to parse" in capsys.readouterr().out
@@ -0,0 +1,71 @@
+# tests/test_schema.py
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+import schema
+from config import LIKERT, SITES
+from schema import as_text, concat_typed, ordinal, to_typed
+
+ID = "תעודת זהות"
+
+
+def frame(rows) -> pd.DataFrame:
+    return pd.DataFrame(rows).astype(object)
+
+
+def test_to_typed_dtypes(make_row):
+    raw = frame([make_row(n) for n in range(1, 6)])
+    raw[ID] = [int(v) for v in raw[ID]]   # ת"ז שנקראה כמספר
+    typed = to_typed(raw)
+    assert isinstance(typed["מין"].dtype, pd.CategoricalDtype)
+    assert typed["מוטיבציה 1"].cat.ordered and list(typed["מוטיבציה 1"].cat.categories) == LIKERT
+    assert typed[f"דירוג_{SITES[0]}"].dtype == "Int8"
+    assert typed["ממוצע"].dtype == np.float64
+    assert typed[ID].tolist() == [f"{n:09d}" for n in range(1, 6)]
+    # ערכי הטקסט נשמרים
+    for col in ("מין", "מקום הכשרה 1", "מוטיבציה 2"):
+        assert as_text(typed[col]).tolist() == as_text(raw[col]).tolist()
+
+
+@pytest.mark.parametrize("rows", [5, schema.SMALL_FRAME + 50])
+def test_unknown_values_extend_the_categories(make_row, rows):
+    raw = frame([make_row(n) for n in range(rows)])
+    raw.loc[0, "מין"] = "אחר"
+    raw.loc[1, "מוטיבציה 1"] = "לא ידוע"
+    raw.loc[2, "מין"] = ""
+    typed = to_typed(raw)
+    assert list(typed["מין"].cat.categories)[-1] == "אחר"
+    assert typed["מין"].iloc[0] == "אחר" and pd.isna(typed["מין"].iloc[2])
+    # ערך לא מוכר בשאלת ליקרט — בלי סדר
+    assert not typed["מוטיבציה 1"].cat.ordered
+
+
+def test_small_and_large_frames_give_the_same_values(make_row):
+    raw = frame([make_row(n) for n in range(schema.SMALL_FRAME + 10)])
+    raw.loc[3, "שפת אם"] = "יידיש"
+    large = to_typed(raw)
+    small = to_typed(raw.iloc[:10])
+    for col in schema.CATEGORIES:
+        assert as_text(small[col]).tolist() == as_text(large[col].iloc[:10]).tolist()
+
+
+def test_concat_typed_widens_categories(make_row):
+    a = to_typed(frame([make_row(1)]))
+    b_raw = frame([make_row(2)])
+    b_raw.loc[0, "שפת אם"] = "יידיש"
+    both = concat_typed(a, to_typed(b_raw))
+    assert isinstance(both["שפת אם"].dtype, pd.CategoricalDtype)
+    assert "יידיש" in both["שפת אם"].cat.categories
+    assert both["שפת אם"].tolist() == [a["שפת אם"].iloc[0], "יידיש"]
+    assert concat_typed(a.iloc[:0], a) is a
+
+
+def test_as_text_and_ordinal():
+    assert as_text(pd.Series([3.0, None, " x ", 2.5])).tolist() == ["3", "", "x", "2.5"]
+    raw = pd.Series([LIKERT[0], LIKERT[-1], "", None], dtype=object)
+    expected = [0.0, float(len(LIKERT) - 1), np.nan, np.nan]
+    np.testing.assert_array_equal(ordinal(raw).to_numpy(), expected)
+    typed = to_typed(pd.DataFrame({"מוטיבציה 1": raw}))["מוטיבציה 1"]
+    np.testing.assert_array_equal(ordinal(typed).to_numpy(), expected)
@@ -0,0 +1,196 @@
+# tests/test_sheets_sync.py
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from tests.fakes import FakeWorksheet
+from config import COLUMNS_ORDER
+from sheets_sync import (
+    SheetsConnection, SheetsOutbox, SheetsSyncWorker, SheetStyler, migrate_header, sheet_values,
+)
+
+ID = "תעודת זהות"
+
+
+class FlakySheet(FakeWorksheet):
+    """FakeWorksheet whose next `fail_appends` appends (and `fail_styles` batch updates) raise."""
+
+    def __init__(self, path, fail_appends: int = 0, fail_styles: int = 0):
+        super().__init__(path)
+        self.fail_appends = fail_appends
+        self.fail_styles = fail_styles
+
+    def append_rows(self, values, **kw):
+        if self.fail_appends:
+            self.fail_appends -= 1
+            raise ConnectionError("connection reset")
+        return super().append_rows(values, **kw)
+
+    def batch_update(self, body):
+        if self.fail_styles:
+            self.fail_styles -= 1
+            raise RuntimeError("quota exceeded")
+        return super().batch_update(body)
+
+
+def wait_for(cond, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def outbox(workdir):
+    return SheetsOutbox(workdir / "outbox.sqlite3", COLUMNS_ORDER)
+
+
+def start_worker(outbox, ws, workdir, **kw):
+    """A worker driven by the test: its own thread finds no worksheet on the first pass
+    and then idles for an hour, so only the test's calls reach the sheet."""
+    polled = threading.Event()
+
+    def connect():
+        if threading.current_thread().name == "sheets-sync":
+            polled.set()
+            return None
+        return ws
+
+    kw.setdefault("idle_seconds", 3600)
+    conn = SheetsConnection(connect, lambda w: migrate_header(w, COLUMNS_ORDER))
+    worker = SheetsSyncWorker(outbox, conn, workdir / ".sheets.lock", base_backoff=0.01, **kw)
+    polled.wait(5)
+    return worker
+
+
+def test_outbox_ack_removes_rows_up_to_id(outbox, make_row):
+    outbox.put_many([make_row(1), make_row(2), make_row(3)])
+    batch = outbox.peek(2)
+    assert [v[COLUMNS_ORDER.index(ID)] for _, v in batch] == ["000000001", "000000002"]
+    outbox.set_error("boom")
+    outbox.ack(batch[-1][0])
+    status = outbox.status()
+    assert status["depth"] == 1
+    assert status["last_error"] is None and status["last_sync"] is not None
+    assert outbox.rows() == [sheet_values(make_row(3), COLUMNS_ORDER)]
+
+
+def test_worker_retries_a_failed_append_and_acks(outbox, workdir, make_row):
+    ws = FlakySheet(workdir / "sheet.jsonl", fail_appends=2)
+    worker = SheetsSyncWorker(outbox, SheetsConnection(lambda: ws, lambda w: migrate_header(w, COLUMNS_ORDER)),
+                              workdir / ".sheets.lock", idle_seconds=3600, base_backoff=0.01)
+    outbox.put_many([make_row(1), make_row(2)])
+    worker.notify()
+    wait_for(lambda: outbox.status()["depth"] == 0)
+    rows = ws.rows
+    assert rows[0] == COLUMNS_ORDER
+    assert [r[COLUMNS_ORDER.index(ID)] for r in rows[1:]] == ["000000001", "000000002"]
+    # התאריך נשלח כטקסט (גרש מוביל) ונשמר בגיליון בלי הגרש
+    assert rows[1][COLUMNS_ORDER.index("תאריך שליחה")] == "01/09/2025 10:00:00"
+    assert outbox.status()["last_error"] is None
+
+
+def test_flush_once_keeps_the_batch_when_the_append_fails(outbox, workdir, make_row):
+    ws = FlakySheet(workdir / "sheet.jsonl", fail_appends=1)
+    worker = start_worker(outbox, ws, workdir)
+    outbox.put_many([make_row(1)])
+    with pytest.raises(ConnectionError):
+        worker.flush_once()
+    assert outbox.status()["depth"] == 1
+    assert worker.flush_once() == 1
+    assert worker.flush_once() == 0
+    assert outbox.status()["depth"] == 0
+    assert len(ws.rows) == 2
+
+
+def test_style_failure_is_not_a_sync_failure(outbox, workdir, make_row):
+    ws = FlakySheet(workdir / "sheet.jsonl", fail_styles=1)
+    worker = start_worker(outbox, ws, workdir, styler=SheetStyler(COLUMNS_ORDER, ID))
+    outbox.put_many([make_row(1)])
+    assert worker.flush_once() == 1
+    assert outbox.status()["depth"] == 0
+    assert outbox.status()["last_error"] is None
+    assert worker.last_style_error == "RuntimeError: quota exceeded"
+
+
+def test_reconcile_failure_is_recorded_and_does_not_block_the_outbox(outbox, workdir, make_row):
+    ws = FakeWorksheet(workdir / "sheet.jsonl")
+    calls = []
+
+    def reconcile(w):
+        calls.append(w)
+        raise RuntimeError("600 rows missing")
+    worker = start_worker(outbox, ws, workdir, reconcile=reconcile)
+    assert worker.reconcile_due() is False
+    assert calls == [ws]
+    assert outbox.status()["reconcile_error"] == "RuntimeError: 600 rows missing"
+    # הניסיון הבא רק אחרי המרווח — והתור ממשיך להישלח
+    assert worker.reconcile_due() is False and len(calls) == 1
+    outbox.put_many([make_row(1)])
+    assert worker.flush_once() == 1
+    assert outbox.status()["last_error"] is None
+
+
+def test_migrate_header_moves_columns_without_losing_data(workdir):
+    ws = FakeWorksheet(workdir / "sheet.jsonl")
+    old = [c for c in COLUMNS_ORDER if c != "אימייל"] + ["עמודה ישנה"]
+    row = dict(zip(COLUMNS_ORDER, map(str, range(len(COLUMNS_ORDER)))))
+    ws.reset([old, [row.get(c, "x") for c in old]])
+    assert migrate_header(ws, COLUMNS_ORDER) is True
+    header, values = ws.rows
+    assert header == COLUMNS_ORDER + ["עמודה ישנה"]
+    assert dict(zip(header, values)) == {**row, "אימייל": "", "עמודה ישנה": "x"}
+    assert migrate_header(ws, COLUMNS_ORDER) is False
+
+
+def test_connection_is_cached_and_reconnects_after_invalidate(workdir):
+    ws = FakeWorksheet(workdir / "sheet.jsonl")
+    connects, headers = [], []
+    conn = SheetsConnection(lambda: connects.append(1) or ws, headers.append)
+    assert conn.worksheet() is ws and conn.worksheet() is ws
+    conn.ensure_header(ws)
+    conn.ensure_header(ws)
+    assert (len(connects), len(headers)) == (1, 1)
+    conn.invalidate()
+    conn.worksheet()
+    conn.ensure_header(ws)
+    assert (len(connects), len(headers)) == (2, 2)
+
+
+def test_failed_connect_is_retried_only_after_a_pause(workdir):
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        raise PermissionError("no access")
+    conn = SheetsConnection(connect, lambda w: None, retry_after=3600)
+    assert conn.worksheet() is None and conn.worksheet() is None
+    assert len(attempts) == 1
+    assert conn.last_error == "PermissionError: no access"
+
+
+def test_styler_sends_one_batch_and_only_when_the_data_outgrows_it(workdir):
+    class Recording(FakeWorksheet):
+        def __init__(self, path):
+            super().__init__(path)
+            self.bodies = []
+
+        def batch_update(self, body):
+            self.bodies.append(body)
+            return super().batch_update(body)
+
+    ws = Recording(workdir / "sheet.jsonl")
+    styler = SheetStyler(COLUMNS_ORDER, ID, row_step=1000)
+    assert styler.apply(ws, 10) is True
+    (body,) = ws.bodies
+    kinds = [next(iter(r)) for r in body["requests"]]
+    assert kinds == ["updateSheetProperties", "repeatCell", "addConditionalFormatRule", "repeatCell"]
+    assert styler.apply(ws, 1000) is False
+    assert styler.apply(ws, 1001) is True
+    kinds = [next(iter(r)) for r in ws.bodies[-1]["requests"]]
+    assert kinds == ["updateSheetProperties", "updateConditionalFormatRule", "repeatCell"]
+    assert ws.bodies[-1]["requests"][0]["updateSheetProperties"]["properties"]["gridProperties"]["rowCount"] == 2000
+    styler.invalidate(ws)
+    assert styler.apply(ws, 5) is True and len(ws.bodies) == 3
@@ -0,0 +1,51 @@
+# tests/test_simulation.py
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import SITES
+from simulation import NO_FIRST_CHOICE, Scenario, run_scenarios, scenario_grid
+
+
+@pytest.fixture
+def master(make_row):
+    rows = [make_row(n) for n in range(1, 41)]
+    for r in rows[:3]:
+        r["מקום הכשרה 1"] = ""           # בלי בחירה ראשונה
+    return pd.DataFrame(rows)
+
+
+def test_results_do_not_depend_on_the_number_of_processes(master):
+    scenarios = [Scenario("tight", (1,) * len(SITES)), Scenario("lottery", (3,) * len(SITES), "lottery")]
+    one = run_scenarios(master, scenarios, replications=6, processes=1, base_seed=3)
+    two = run_scenarios(master, scenarios, replications=6, processes=2, base_seed=3)
+    for a, b in zip(one, two):
+        pd.testing.assert_frame_equal(a, b)
+
+
+def test_every_student_is_counted_once_per_replication(master):
+    caps = (1,) * len(SITES)
+    overview, per_site = run_scenarios(master, [Scenario("tight", caps)], replications=4, processes=1)
+    outcomes = per_site.columns[3:]
+    assert per_site[outcomes].to_numpy().sum() == pytest.approx(len(master))
+    placed = per_site.loc[per_site["מוסד"] != NO_FIRST_CHOICE, outcomes[:-1]].sum(axis=1).to_numpy()
+    assert (placed <= np.array(caps) + 1e-9).all()
+    # לא שובצו ובלי בחירה ראשונה — בשורה משלהם, בלי קיבולת
+    extra = per_site[per_site["מוסד"] == NO_FIRST_CHOICE]
+    assert len(extra) == 1 and extra["קיבולת"].isna().all() and extra["לא שובצו"].iloc[0] > 0
+    assert overview.loc[0, "קיבולת כוללת"] == sum(caps)
+    unplaced = per_site["לא שובצו"].sum()
+    assert overview.loc[0, "ממוצע לא שובצו"] == pytest.approx(unplaced) and unplaced >= len(master) - sum(caps)
+
+
+def test_no_extra_row_when_everyone_is_placed(master):
+    _, per_site = run_scenarios(master, [Scenario("roomy", (40,) * len(SITES))], replications=2, processes=1)
+    assert NO_FIRST_CHOICE not in set(per_site["מוסד"])
+    assert per_site["לא שובצו"].sum() == 0
+
+
+def test_scenario_grid():
+    grid = scenario_grid({SITES[0]: 10, SITES[1]: 3}, [1, 1.5], ["grade", "lottery"])
+    assert [s.name for s in grid] == ["grade ×1", "lottery ×1", "grade ×1.5", "lottery ×1.5"]
+    assert grid[2].capacities[:3] == (15, 4, 0) and len(grid[2].capacities) == len(SITES)
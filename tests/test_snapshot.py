@@ -0,0 +1,54 @@
+# tests/test_snapshot.py
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+import snapshot
+from config import COLUMNS_ORDER, SITES
+from snapshot import ParquetSnapshot
+from storage import KEEP_LATEST, MasterStore
+
+ID = "תעודת זהות"
+PHONE = "טלפון"
+
+
+@pytest.fixture
+def store(workdir):
+    return MasterStore(workdir / "master.sqlite3", COLUMNS_ORDER)
+
+
+def commit(store, *rows):
+    return store.commit([(r, None) for r in rows], KEEP_LATEST)
+
+
+def test_refresh_writes_only_new_rows_and_hides_replaced_ones(workdir, store, make_row):
+    snap = ParquetSnapshot(workdir / "parquet")
+    commit(store, make_row(1), make_row(2))
+    assert snap.refresh(store)
+    assert not snap.refresh(store)
+    commit(store, make_row(1, **{"כתובת": "רחוב חדש"}))
+    snap.refresh(store)
+    df = snap.read()
+    assert df[ID].tolist() == ["000000002", "000000001"]
+    assert df["כתובת"].tolist()[-1] == "רחוב חדש"
+    assert isinstance(df["מין"].dtype, pd.CategoricalDtype)
+    assert df[f"דירוג_{SITES[0]}"].dtype == "Int8"
+    assert snap.read([ID, "ממוצע"]).columns.tolist() == [ID, "ממוצע"]
+
+
+def test_mixed_text_and_numbers_survive_compaction_and_rebuild(workdir, store, make_row, monkeypatch):
+    # טלפון שהגיע פעם כטקסט ופעם כמספר (למשל מ־ JSON) — SQLite שומר את שני הסוגים באותה עמודה
+    monkeypatch.setattr(snapshot, "MAX_PARTS", 2)
+    snap = ParquetSnapshot(workdir / "parquet")
+    phones = ["0501234567", 521234567, "", None, 31.5]
+    for n, phone in enumerate(phones, start=1):
+        commit(store, make_row(n, **{PHONE: phone}))
+        snap.refresh(store)
+    assert len(snap._state()["parts"]) <= 2
+    expected = ["0501234567", "521234567", "", "", "31.5"]
+    assert snap.read()[PHONE].tolist() == expected
+    commit(store, make_row(6, **{PHONE: 7}), make_row(7, **{"כתובת": 12}))
+    snap.rebuild(store)
+    df = snap.read()
+    assert df[PHONE].tolist() == expected + ["7", df[PHONE].iloc[-1]]
+    assert df["כתובת"].iloc[-1] == "12"
@@ -0,0 +1,71 @@
+# tests/test_stats.py
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+import stats
+from config import COLUMNS_ORDER, SITES
+from schema import to_typed
+from stats import RunningStats, StatsFile
+from storage import KEEP_ALL, KEEP_FIRST, KEEP_LATEST
+from submission_log import SegmentedLog
+
+
+@pytest.fixture
+def rows(make_row):
+    out = [make_row(n) for n in range(1, 31)]
+    out[3].update({"ממוצע": "", "התאמות": "לקות למידה; אחר: זמן", "מסלול לימודים": ""})
+    out[4]["מקום הכשרה 1"] = None
+    return out
+
+
+def test_incremental_counters_match_a_full_recompute(rows):
+    running = RunningStats()
+    for r in rows:
+        running.add(r)
+    df = pd.DataFrame(rows)
+    assert running.diff(RunningStats.from_frame(df)) == []
+    assert running.diff(RunningStats.from_frame(to_typed(df))) == []
+    running.add(rows[0], -1)
+    assert running.diff(RunningStats.from_frame(df.iloc[1:])) == []
+    assert running.total == len(rows) - 1
+
+
+def test_tables_and_grade_by_track(make_row):
+    running = RunningStats()
+    for n, (site, track, grade) in enumerate([(SITES[0], "א", 80), (SITES[0], "א", 90), (SITES[1], "ב", 70)]):
+        running.add(make_row(n, **{"מקום הכשרה 1": site, "מסלול לימודים": track, "ממוצע": grade}))
+    first = running.table("rank_1", "מוסד")
+    assert first.values.tolist() == [[SITES[0], 2], [SITES[1], 1]]
+    assert running.grade_by_track().values.tolist() == [["א", 85.0, 2], ["ב", 70.0, 1]]
+
+
+@pytest.mark.parametrize("policy, kept", [(KEEP_LATEST, "new"), (KEEP_FIRST, "old"), (KEEP_ALL, None)])
+def test_from_log_applies_the_dedupe_policy(make_row, policy, kept):
+    log = pd.DataFrame([make_row(1, **{"תחום מוביל": "old"}), make_row(2), make_row(1, **{"תחום מוביל": "new"})])
+    counts = RunningStats.from_log(log, policy).counters["top_domain"]
+    if kept is None:
+        assert counts["old"] == counts["new"] == 1
+    else:
+        assert counts[kept] == 1 and counts.get({"new": "old", "old": "new"}[kept], 0) == 0
+
+
+def test_stats_file_reloads_changes_made_by_another_process(workdir, rows):
+    a, b = StatsFile(workdir / "stats.json"), StatsFile(workdir / "stats.json")
+    a.replace(RunningStats())
+    assert b.load().total == 0
+    a.apply(rows[:2], [])
+    b.apply(rows[2:3], rows[:1])
+    assert a.load().total == 2
+    assert a.load().diff(RunningStats.from_frame(pd.DataFrame(rows[1:3]))) == []
+
+
+def test_cli_verify_and_rebuild(workdir, rows, capsys):
+    SegmentedLog(workdir / "log", COLUMNS_ORDER).append(rows)
+    args = ["--file", str(workdir / "stats.json"), "--log-dir", str(workdir / "log")]
+    StatsFile(workdir / "stats.json").apply(rows[:-1], [])
+    assert stats.main([*args, "verify"]) == 1
+    assert capsys.readouterr().out.strip().endswith("differences")
+    assert stats.main([*args, "rebuild"]) == 0
+    assert stats.main([*args, "verify"]) == 0
+    assert capsys.readouterr().out.strip().endswith("ok")
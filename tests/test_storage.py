@@ -0,0 +1,153 @@
+# tests/test_storage.py
+# -*- coding: utf-8 -*-
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+import pytest
+
+from config import COLUMNS_ORDER, CSV_FILE, DB_FILE
+from pipeline import open_master_store
+from storage import KEEP_FIRST, KEEP_LATEST, MasterStore, normalize_id
+
+ID = "תעודת זהות"
+
+
+@pytest.fixture
+def store(workdir):
+    return MasterStore(workdir / "master.sqlite3", COLUMNS_ORDER)
+
+
+def test_append_and_read_back_in_order(store, make_row):
+    assert store.is_empty() and store.last_seq() == 0
+    first = store.append(make_row(1))
+    seqs = store.append_many([make_row(2), make_row(3)])
+    assert seqs == [first + 1, first + 2]
+    assert store.count() == 3 and store.last_seq() == seqs[-1]
+    df = store.to_dataframe()
+    assert list(df.columns) == COLUMNS_ORDER
+    assert df[ID].tolist() == ["000000001", "000000002", "000000003"]
+    assert store.to_dataframe(upto=first)[ID].tolist() == ["000000001"]
+    assert store.rows_since(first)[["seq", ID]].values.tolist() == [[seqs[0], "000000002"], [seqs[1], "000000003"]]
+    assert store.to_dataframe(columns=["seq", ID]).columns.tolist() == ["seq", ID]
+
+
+def test_new_columns_are_added_to_an_existing_table(workdir, make_row):
+    MasterStore(workdir / "m.sqlite3", COLUMNS_ORDER[:-1]).append(make_row(1))
+    store = MasterStore(workdir / "m.sqlite3", COLUMNS_ORDER)
+    df = store.to_dataframe()
+    assert df[ID].tolist() == ["000000001"]
+    assert df[COLUMNS_ORDER[-1]].isna().all()
+
+
+def test_export_csv_only_when_the_store_changed(store, workdir, make_row):
+    store.append(make_row(1))
+    path = store.export_csv(workdir / "master.csv")
+    written = path.stat().st_mtime_ns
+    store.export_csv(path)
+    assert path.stat().st_mtime_ns == written
+    store.append(make_row(2))
+    store.export_csv(path, force=True)
+    assert pd.read_csv(path, dtype=str, encoding="utf-8-sig")[ID].tolist() == ["000000001", "000000002"]
+
+
+def test_legacy_csv_keeps_leading_zeros(workdir, make_row):
+    CSV_FILE.parent.mkdir(parents=True)
+    legacy = [make_row(12345678, **{"טלפון": "0501234567"}), make_row(2, **{"טלפון": "", "ממוצע": ""})]
+    pd.DataFrame(legacy, columns=COLUMNS_ORDER).to_csv(CSV_FILE, index=False, encoding="utf-8-sig")
+
+    store = open_master_store()
+    df = store.to_dataframe()
+    assert df[ID].tolist() == ["012345678", "000000002"]
+    assert df["טלפון"].tolist() == ["0501234567", ""]
+    # נשמר כטקסט, כמו שורות מהטופס — לא מספר בחלק מהשורות
+    with closing(sqlite3.connect(DB_FILE)) as conn:
+        types = conn.execute(f'SELECT DISTINCT typeof("{ID}"), typeof("טלפון") FROM submissions').fetchall()
+    assert types == [("text", "text")]
+    # פתיחה חוזרת אינה מייבאת שוב
+    assert open_master_store().count() == 2
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("012345678", "012345678"), (12345678, "012345678"), (12345678.0, "012345678"), ("12345678.0", "012345678"),
+    (" 000000001 ", "000000001"), (None, ""), (float("nan"), ""), ("abc", "abc"),
+])
+def test_normalize_id(value, expected):
+    assert normalize_id(value) == expected
+
+
+def test_keep_latest_replaces_row_and_records_tombstone(store, make_row):
+    first = store.commit([(make_row(1), None), (make_row(2), None)], KEEP_LATEST)
+    assert [r.status for r in first] == ["inserted", "inserted"]
+
+    newer = make_row(1, **{"כתובת": "רחוב חדש 2, חיפה"})
+    (res,) = store.commit([(newer, None)], KEEP_LATEST)
+    assert res.status == "replaced"
+    assert res.replaced_id == "000000001"
+    assert res.previous["כתובת"] == "רחוב הבדיקה 1, חיפה"
+
+    df = store.to_dataframe()
+    assert len(df) == 2
+    assert df.loc[df[ID] == "000000001", "כתובת"].tolist() == ["רחוב חדש 2, חיפה"]
+    assert store.deleted_since(0) == [first[0].seq]
+    # לפי ה־ seq של השורה המחליפה: עותק נגזר שכבר ראה אותה אינו צריך למחוק שוב
+    assert store.deleted_since(res.seq - 1) == [first[0].seq]
+    assert store.deleted_since(res.seq) == []
+
+
+def test_keep_first_keeps_the_stored_row(store, make_row):
+    (first,) = store.commit([(make_row(1), None)], KEEP_FIRST)
+    (res,) = store.commit([(make_row(1, **{"כתובת": "רחוב אחר"}), None)], KEEP_FIRST)
+    assert res.status == "kept_first"
+    assert res.seq == first.seq
+    assert not res.changed_master
+    assert store.to_dataframe()["כתובת"].tolist() == ["רחוב הבדיקה 1, חיפה"]
+    assert store.deleted_since(0) == []
+
+
+def test_id_matching_ignores_lost_leading_zeros(store, make_row):
+    store.commit([(make_row(1), None)], KEEP_LATEST)
+    (res,) = store.commit([(make_row(1, **{ID: 1}), None)], KEEP_LATEST)
+    assert res.status == "replaced"
+    assert store.count() == 1
+
+
+def test_token_makes_a_retry_a_no_op(store, make_row):
+    (res,) = store.commit([(make_row(1), "tok-1")], KEEP_LATEST)
+    assert res.status == "inserted"
+    # אותו אסימון — גם בתוך אותה קבוצה וגם בקריאה חוזרת, ובכל מדיניות
+    again = store.commit([(make_row(1), "tok-1"), (make_row(2), "tok-2"), (make_row(2), "tok-2")], KEEP_FIRST)
+    assert [r.status for r in again] == ["duplicate", "inserted", "duplicate"]
+    assert store.count() == 2
+
+
+def test_failed_transaction_rolls_back_everything(store, make_row):
+    store.commit([(make_row(1), None)], KEEP_LATEST)
+    with pytest.raises(ValueError):
+        store.commit([(make_row(2), None)], "no-such-policy")
+    bad = make_row(3)
+    bad[ID] = object()      # SQLite לא יודע לשמור את הערך
+    with pytest.raises(Exception):
+        store.commit([(make_row(2), "tok-2"), (bad, None)], KEEP_LATEST)
+    assert store.count() == 1
+    # האסימון של הקבוצה שנכשלה לא נשמר, והאינדקס נבנה מחדש
+    assert [r.status for r in store.commit([(make_row(2), "tok-2")], KEEP_LATEST)] == ["inserted"]
+    assert store.commit([(make_row(1), None)], KEEP_LATEST)[0].status == "replaced"
+
+
+def test_pending_steps_are_recorded_with_the_commit(store, make_row):
+    steps = {"inserted": 3, "replaced": 3, "kept_first": 2}
+    store.commit([(make_row(1), None), (make_row(2), "tok")], KEEP_LATEST, steps)
+    store.commit([(make_row(2), "tok")], KEEP_LATEST, steps)     # duplicate — אין שלבי המשך
+    work = store.pending_work()
+    assert [(w.status, w.steps) for w in work] == [("inserted", 3), ("inserted", 3)]
+    assert work[0].row[ID] == "000000001"
+
+    store.work_done([w.id for w in work], 1)
+    store.work_failed([work[0].id], "log: disk full")
+    assert [w.steps for w in store.pending_work()] == [2, 2]
+    assert store.pending_status() == {"rows": 2, "last_error": "log: disk full"}
+
+    store.work_done([w.id for w in work], 2)
+    assert store.pending_work() == []
+    assert store.pending_status() == {"rows": 0, "last_error": None}
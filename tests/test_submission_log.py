@@ -0,0 +1,52 @@
+# tests/test_submission_log.py
+# -*- coding: utf-8 -*-
+from config import COLUMNS_ORDER
+from storage import normalize_id
+from submission_log import SegmentedLog
+
+ID = "תעודת זהות"
+
+
+def ids(df) -> list[str]:
+    return df[ID].map(normalize_id).tolist()
+
+
+def test_reconcile_indexes_unindexed_rows_and_cuts_a_torn_row(workdir, make_row):
+    log = SegmentedLog(workdir / "log", COLUMNS_ORDER)
+    log.append([make_row(1), make_row(2)])
+    (_, path, _), = log.segments()
+    # קריסה בין כתיבת הקובץ לעדכון האינדקס, והשורה האחרונה נקטעה באמצע
+    torn = log._encode([make_row(4).get(c) for c in COLUMNS_ORDER])
+    with open(path, "ab") as f:
+        f.write(log._encode([make_row(3).get(c) for c in COLUMNS_ORDER]) + torn[:len(torn) // 2])
+
+    assert log.reconcile() == 1
+    assert path.read_bytes().endswith(log._encode([make_row(3).get(c) for c in COLUMNS_ORDER]))
+    assert log.reconcile() == 0
+    log.append([make_row(5)])
+    assert ids(log.read_all()) == ["000000001", "000000002", "000000003", "000000005"]
+    assert ids(log.history("000000003")) == ["000000003"]
+
+
+def test_reconcile_of_a_torn_first_row(workdir, make_row):
+    log = SegmentedLog(workdir / "log", COLUMNS_ORDER)
+    log.append([make_row(1)])
+    (_, path, _), = log.segments()
+    size = path.stat().st_size
+    with open(path, "ab") as f:
+        f.write(b'"000000002,\xd7')
+    assert log.reconcile() == 0
+    assert path.stat().st_size == size
+    assert ids(log.read_all()) == ["000000001"]
+
+
+def test_rows_with_quotes_and_newlines_survive_reconcile(workdir, make_row):
+    log = SegmentedLog(workdir / "log", COLUMNS_ORDER)
+    log.append([make_row(1)])
+    (_, path, _), = log.segments()
+    odd = make_row(2, **{"בקשה מיוחדת": 'קרוב לבית, "חיפה"\nאו הקריות'})
+    with open(path, "ab") as f:
+        f.write(log._encode([odd.get(c) for c in COLUMNS_ORDER]))
+    assert log.reconcile() == 1
+    df = log.read_all()
+    assert df["בקשה מיוחדת"].tolist()[-1] == 'קרוב לבית, "חיפה"\nאו הקריות'
@@ -0,0 +1,88 @@
+# tests/test_validation.py
+# -*- coding: utf-8 -*-
+import pandas as pd
+import pytest
+
+from config import SITES
+from validation import CONFIRM_FIELD, load_for_validation, validate_frame, validate_row
+
+# שינויים שכל אחד מהם שובר כלל אחד או יותר (או אף אחד — מקרי קצה תקינים)
+MUTATIONS = [
+    {},
+    {"שם פרטי": "  "},
+    {"תעודת זהות": "12345"},
+    {"תעודת זהות": "12345678"},
+    {"שפות נוספות": ""},
+    {"שפות נוספות": "ערבית; "},
+    {"טלפון": "12-3"},
+    {"אימייל": "no-at-sign"},
+    {"מקום הכשרה 2": ""},
+    {"מקום הכשרה 3": "מוסד לא קיים"},
+    {"מקום הכשרה 1": SITES[0], "מקום הכשרה 2": SITES[0]},
+    {"הכשרה קודמת": "כן"},
+    {"הכשרה קודמת": "כן", "הכשרה קודמת מקום ותחום": "x", "הכשרה קודמת מדריך ומיקום": "y",
+     "הכשרה קודמת בן זוג": "z"},
+    {"תחומים מועדפים": ""},
+    {"תחומים מועדפים": "זקנה; ", "תחום מוביל": "זקנה"},
+    {"תחומים מועדפים": "זקנה; ילדים ונוער", "תחום מוביל": "מוגבלות"},
+    {"תחומים מועדפים": "זקנה; ילדים ונוער", "תחום מוביל": "אחר..."},
+    {"תחומים מועדפים": "רווחה; זקנה", "תחום מוביל": "רווחה", "שנת לימודים": "שנה א'"},
+    {"תחומים מועדפים": "רווחה; זקנה", "תחום מוביל": "רווחה", "שנת לימודים": "שנה ג'"},
+    # טקסט חופשי תחת "אחר..." שמכיל את המילה אינו תחום הרווחה שברשימה
+    {"תחומים מועדפים": "זקנה; רווחה קהילתית", "תחום מוביל": "זקנה", "שנת לימודים": "שנה א'"},
+    {"בקשה מיוחדת": ""},
+    {"ממוצע": 0},
+    {"ממוצע": "לא מספר"},
+    {"התאמות": ""},
+    {"התאמות": "אחר...; ", "התאמות פרטים": "x"},
+    {"התאמות": "לקות למידה"},
+    {"התאמות": "לקות למידה", "התאמות פרטים": "זמן נוסף"},
+    {"מוטיבציה 3": ""},
+    {"אישור הגעה להכשרה": "לא"},
+    {CONFIRM_FIELD: False},
+]
+
+
+@pytest.fixture
+def rows(make_row):
+    return [make_row(n, **{CONFIRM_FIELD: True, **m}) for n, m in enumerate(MUTATIONS, start=10_000_000)]
+
+
+def failing(issues) -> set[tuple[int, str]]:
+    return {(i.section, i.field) for i in issues}
+
+
+def by_row(report: pd.DataFrame) -> dict[int, set[tuple[int, str]]]:
+    return {i: set(zip(g["סעיף"], g["שדה"])) for i, g in report.groupby("שורה")}
+
+
+def test_row_and_frame_checks_agree(rows):
+    report = by_row(validate_frame(pd.DataFrame(rows)))
+    for i, row in enumerate(rows):
+        assert report.get(i, set()) == failing(validate_row(row)), MUTATIONS[i]
+    assert 0 not in report
+    assert len(report) > len(MUTATIONS) // 2
+
+
+def test_agreement_on_a_csv_read_as_text(rows, workdir):
+    """The admin validates the master CSV, where numbers and IDs come back as text."""
+    df = pd.DataFrame(rows).drop(columns=CONFIRM_FIELD)
+    df.to_csv(workdir / "master.csv", index=False, encoding="utf-8-sig")
+    report = by_row(validate_frame(load_for_validation(workdir / "master.csv")))
+    for i, row in enumerate(rows):
+        expected = {(s, f) for s, f in failing(validate_row(row)) if f != CONFIRM_FIELD}
+        assert report.get(i, set()) == expected, MUTATIONS[i]
+
+
+def test_welfare_rule_only_for_the_listed_domain(rows):
+    welfare = {i: failing(validate_row(r)) for i, r in enumerate(rows) if "רווחה" in r["תחומים מועדפים"]}
+    assert [(2, "תחומים מועדפים") in v for v in welfare.values()] == [True, False, False]
+
+
+def test_ranks_message_lists_the_missing_slots(make_row):
+    issues = validate_row(make_row(1, **{"מקום הכשרה 2": "", "מקום הכשרה 3": "?"}))
+    assert [i.message for i in issues if i.field == "מקום הכשרה 1"] == \
+        ["יש לבחור מוסד לכל מקום הכשרה. חסר/ים: 2, 3."]
+    report = validate_frame(pd.DataFrame([make_row(1, **{"מקום הכשרה 2": ""})]))
+    assert report["שגיאה"].tolist() == ["יש לבחור מוסד לכל מקום הכשרה."]
+    assert report["תעודת זהות"].tolist() == ["000000001"]
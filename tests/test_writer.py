@@ -0,0 +1,66 @@
+# tests/test_writer.py
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from writer import FileLock, SubmissionWriter
+
+
+def test_file_lock_excludes_other_holders(workdir):
+    path = workdir / ".write.lock"
+    order = []
+
+    def other():
+        with FileLock(path):
+            order.append("other")
+
+    with FileLock(path):
+        t = threading.Thread(target=other)
+        t.start()
+        time.sleep(0.2)
+        order.append("main")
+    t.join(5)
+    assert order == ["main", "other"]
+
+
+def test_concurrent_submits_are_committed_in_groups(workdir):
+    gate = threading.Event()
+    batches = []
+
+    def commit(items):
+        gate.wait(5)
+        batches.append(list(items))
+        return [f"ok {i}" for i in items]
+
+    writer = SubmissionWriter(commit, workdir / ".write.lock")
+    first = writer.submit(0)
+    time.sleep(0.1)            # הכותב ממתין כעת בתוך האצווה הראשונה
+    rest = [writer.submit(i) for i in range(1, 6)]
+    assert writer.pending() == 5
+    gate.set()
+    assert [f.result(5) for f in [first, *rest]] == [f"ok {i}" for i in range(6)]
+    assert batches == [[0], [1, 2, 3, 4, 5]]
+
+
+def test_a_failed_batch_fails_every_future_and_the_writer_goes_on(workdir):
+    def commit(items):
+        if "bad" in items:
+            raise OSError("disk full")
+        return None
+
+    writer = SubmissionWriter(commit, workdir / ".write.lock")
+    with pytest.raises(OSError, match="disk full"):
+        writer.submit("bad").result(5)
+    assert writer.submit("good").result(5) is None
+
+
+def test_commit_runs_under_the_cross_process_lock(workdir):
+    path = workdir / ".write.lock"
+    writer = SubmissionWriter(lambda items: items, path)
+    with FileLock(path):
+        fut = writer.submit("x")
+        time.sleep(0.2)
+        assert not fut.done()
+    assert fut.result(5) == "x"
@@ -0,0 +1,85 @@
+# theme.py
+# -*- coding: utf-8 -*-
+"""Page styling (RTL layout, background, Hebrew web fonts) as one <head> snippet.
+
+Built once per process at import; the app sends it with a single st.markdown
+call per full script run (fragment reruns do not resend it).
+"""
+import re
+
+FONT_LINKS = """
+<link rel="preconnect" href="https://fonts.googleapis.com">
+<link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
+<link href="https://fonts.googleapis.com/css2?family=Assistant:wght@300;400;600;700&family=Noto+Sans+Hebrew:wght@400;600&display=swap" rel="stylesheet">
+"""
+
+CSS = """
+:root{
+  --ink:#0f172a; 
+  --muted:#475569; 
+  --ring:rgba(99,102,241,.25); 
+  --card:rgba(255,255,255,.85);
+}
+html, body, [class*="css"] { font-family: system-ui, "Segoe UI", Arial; }
+.stApp, .main, [data-testid="stSidebar"]{ direction:rtl; text-align:right; }
+[data-testid="stAppViewContainer"]{
+  background:
+    radial-gradient(1200px 600px at 8% 8%, #e0f7fa 0%, transparent 65%),
+    radial-gradient(1000px 500px at 92% 12%, #ede7f6 0%, transparent 60%),
+    radial-gradient(900px 500px at 20% 90%, #fff3e0 0%, transparent 55%);
+}
+.block-container{ padding-top:1.1rem; }
+[data-testid="stForm"]{
+  background:var(--card);
+  border:1px solid #e2e8f0;
+  border-radius:16px;
+  padding:18px 20px;
+  box-shadow:0 8px 24px rgba(2,6,23,.06);
+}
+[data-testid="stWidgetLabel"] p{ text-align:right; margin-bottom:.25rem; color:var(--muted); }
+[data-testid="stWidgetLabel"] p::after{ content: " :"; }
+input, textarea, select{ direction:rtl; text-align:right; }
+
+:root { --app-font: 'Assistant', 'Noto Sans Hebrew', 'Segoe UI', -apple-system, sans-serif; }
+
+/* בסיס האפליקציה */
+html, body, .stApp, [data-testid="stAppViewContainer"], .main {
+  font-family: var(--app-font) !important;
+}
+
+/* ודא שכל הצאצאים יורשים את הפונט */
+.stApp * {
+  font-family: var(--app-font) !important;
+}
+
+/* רכיבי קלט/בחירה של Streamlit */
+div[data-baseweb], /* select/radio/checkbox */
+.stTextInput input,
+.stTextArea textarea,
+.stSelectbox div,
+.stMultiSelect div,
+.stRadio,
+.stCheckbox,
+.stButton > button {
+  font-family: var(--app-font) !important;
+}
+
+/* טבלאות DataFrame/Arrow */
+div[data-testid="stDataFrame"] div {
+  font-family: var(--app-font) !important;
+}
+
+/* כותרות */
+h1, h2, h3, h4, h5, h6 {
+  font-family: var(--app-font) !important;
+}
+"""
+
+
+def _minify(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)      # הערות
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};])\s*", r"\1", css).strip()
+
+
+APP_HEAD = FONT_LINKS.strip() + "<style>" + _minify(CSS) + "</style>"
@@ -0,0 +1,408 @@
+# validation.py
+# -*- coding: utf-8 -*-
+"""Declarative validation schema for a submission row (COLUMNS_ORDER keys).
+
+Every rule has a scalar check, used for the interactive errors of the wizard,
+and a vectorised check over a DataFrame, used to re-validate the whole master
+in one pass. Patterns are compiled once, at import.
+
+Usage:
+    python validation.py data/שאלון_שיבוץ.csv [--out bad_rows.csv]
+"""
+import argparse
+import re
+import sys
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from config import CSV_FILE, DOMAINS, RANK_COUNT, SITES
+from schema import as_text
+
+LIST_SEP = ";"
+CONFIRM_FIELD = "אישור נכונות"      # שדה של הטופס בלבד — לא נשמר במאסטר
+RANK_FIELDS = tuple(f"מקום הכשרה {i}" for i in range(1, RANK_COUNT + 1))
+
+
+@dataclass(frozen=True)
+class Issue:
+    section: int
+    field: str
+    message: str
+
+    def __str__(self) -> str:
+        return f"סעיף {self.section}: {self.message}"
+
+
+# =========================
+# המרה לטקסט
+# =========================
+def _s(v) -> str:
+    if v is None or (isinstance(v, float) and v != v):
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v).strip()
+
+
+def _items(v) -> list[str]:
+    return [x.strip() for x in _s(v).split(LIST_SEP)] if _s(v) else []
+
+
+def _col(df: pd.DataFrame, name: str) -> pd.Series:
+    return as_text(df[name])
+
+
+def _blank_item(s: pd.Series) -> pd.Series:
+    """Non-empty list value with an empty item (an "אחר..." whose detail was left blank)."""
+    parts = s.str.split(LIST_SEP).explode().str.strip()
+    return (parts == "").groupby(level=0).any().reindex(s.index, fill_value=False) & (s != "")
+
+
+# =========================
+# סוגי כללים
+# =========================
+@dataclass(frozen=True)
+class Rule(ABC):
+    section: int
+    field: str
+    message: str
+
+    @property
+    def fields(self) -> tuple[str, ...]:
+        return (self.field,)
+
+    @property
+    def summary(self) -> str:
+        """Message used in the batch report."""
+        return self.message
+
+    def row_error(self, row: dict) -> str | None:
+        return None if self.row_ok(row) else self.message
+
+    @abstractmethod
+    def row_ok(self, row: dict) -> bool:
+        """Scalar check of one submission."""
+
+    @abstractmethod
+    def bad(self, df: pd.DataFrame) -> pd.Series:
+        """Vectorised check: True for the rows that break the rule."""
+
+
+@dataclass(frozen=True)
+class Required(Rule):
+    also: tuple[str, ...] = ()       # שדות נוספים שחייבים להיות מלאים יחד
+
+    @property
+    def fields(self):
+        return (self.field, *self.also)
+
+    def row_ok(self, row):
+        return all(_s(row.get(f)) for f in self.fields)
+
+    def bad(self, df):
+        return np.logical_or.reduce([_col(df, f) == "" for f in self.fields])
+
+
+@dataclass(frozen=True)
+class Matches(Rule):
+    pattern: re.Pattern = None
+
+    def row_ok(self, row):
+        return bool(self.pattern.fullmatch(_s(row.get(self.field))))
+
+    def bad(self, df):
+        return ~_col(df, self.field).str.fullmatch(self.pattern)
+
+
+@dataclass(frozen=True)
+class ListRequired(Rule):
+    def row_ok(self, row):
+        return any(_items(row.get(self.field)))
+
+    def bad(self, df):
+        return _col(df, self.field).str.replace(LIST_SEP, "", regex=False).str.strip() == ""
+
+
+@dataclass(frozen=True)
+class ListDetailed(Rule):
+    """Every selected item has a value (the "אחר..." detail field was filled)."""
+
+    def row_ok(self, row):
+        return "" not in _items(row.get(self.field))
+
+    def bad(self, df):
+        return _blank_item(_col(df, self.field))
+
+
+@dataclass(frozen=True)
+class RequiredWhen(Rule):
+    when: str = ""
+    values: tuple[str, ...] = ()
+
+    @property
+    def fields(self):
+        return (self.field, self.when)
+
+    def row_ok(self, row):
+        return _s(row.get(self.when)) not in self.values or bool(_s(row.get(self.field)))
+
+    def bad(self, df):
+        return _col(df, self.when).isin(self.values) & (_col(df, self.field) == "")
+
+
+@dataclass(frozen=True)
+class RequiredUnlessOnly(Rule):
+    """Required unless the list field holds exactly `only` (e.g. התאמות == "אין")."""
+    when: str = ""
+    only: str = ""
+
+    @property
+    def fields(self):
+        return (self.field, self.when)
+
+    def row_ok(self, row):
+        return _items(row.get(self.when)) == [self.only] or bool(_s(row.get(self.field)))
+
+    def bad(self, df):
+        return (_col(df, self.when) != self.only) & (_col(df, self.field) == "")
+
+
+@dataclass(frozen=True)
+class MemberOf(Rule):
+    """Value is one of the items of another list field (checked only when that list is not empty)."""
+    of: str = ""
+    extra: tuple[str, ...] = ()
+
+    @property
+    def fields(self):
+        return (self.field, self.of)
+
+    def row_ok(self, row):
+        items = _items(row.get(self.of))
+        v = _s(row.get(self.field))
+        return not items or v in items or v in self.extra
+
+    def bad(self, df):
+        v, lst = _col(df, self.field), _col(df, self.of)
+        parts = lst.str.split(LIST_SEP).explode().str.strip()
+        hit = (parts == v.reindex(parts.index)).groupby(level=0).any().reindex(v.index, fill_value=False)
+        return (lst != "") & ~hit & ~v.isin(self.extra)
+
+
+@dataclass(frozen=True)
+class Positive(Rule):
+    def row_ok(self, row):
+        try:
+            return float(row.get(self.field)) > 0
+        except (TypeError, ValueError):
+            return False
+
+    def bad(self, df):
+        return ~(pd.to_numeric(df[self.field], errors="coerce") > 0)
+
+
+@dataclass(frozen=True)
+class Equals(Rule):
+    value: object = None
+
+    def row_ok(self, row):
+        return row.get(self.field) == self.value
+
+    def bad(self, df):
+        return (as_text(df[self.field]) if isinstance(self.value, str) else df[self.field]) != self.value
+
+
+@dataclass(frozen=True)
+class ItemRequiresMark(Rule):
+    """If an item of `field` contains `item_mark`, `other` must contain `mark` (רווחה -> שנה ג').
+
+    With `choices`, only items from that list count — free text typed under
+    "אחר..." does not trigger the rule.
+    """
+    item_mark: str = ""
+    other: str = ""
+    mark: str = ""
+    choices: frozenset = frozenset()
+
+    @property
+    def fields(self):
+        return (self.field, self.other)
+
+    def _marked(self, item: str) -> bool:
+        return self.item_mark in item and (not self.choices or item in self.choices)
+
+    def row_ok(self, row):
+        return not any(self._marked(d) for d in _items(row.get(self.field))) or self.mark in _s(row.get(self.other))
+
+    def bad(self, df):
+        parts = _col(df, self.field).str.split(LIST_SEP).explode().str.strip()
+        hit = parts.str.contains(self.item_mark, regex=False)
+        if self.choices:
+            hit &= parts.isin(self.choices)
+        marked = hit.groupby(level=0).any().reindex(df.index, fill_value=False)
+        return marked & ~_col(df, self.other).str.contains(self.mark, regex=False)
+
+
+@dataclass(frozen=True)
+class RanksComplete(Rule):
+    """Every rank slot holds a known site; the message lists the missing slots."""
+    ranks: tuple[str, ...] = RANK_FIELDS
+    choices: frozenset = field(default_factory=lambda: frozenset(SITES))
+
+    @property
+    def fields(self):
+        return self.ranks
+
+    @property
+    def summary(self):
+        return self.message.split(".")[0] + "."
+
+    def row_ok(self, row):
+        return all(_s(row.get(f)) in self.choices for f in self.ranks)
+
+    def row_error(self, row):
+        missing = [str(i) for i, f in enumerate(self.ranks, start=1) if _s(row.get(f)) not in self.choices]
+        return self.message.format(missing=", ".join(missing)) if missing else None
+
+    def bad(self, df):
+        return np.logical_or.reduce([~_col(df, f).isin(self.choices) for f in self.ranks])
+
+
+@dataclass(frozen=True)
+class Distinct(Rule):
+    ranks: tuple[str, ...] = RANK_FIELDS
+
+    @property
+    def fields(self):
+        return self.ranks
+
+    def row_ok(self, row):
+        chosen = [_s(row.get(f)) for f in self.ranks if _s(row.get(f)) in SITES]
+        return len(set(chosen)) == len(chosen)
+
+    def bad(self, df):
+        cols = [_col(df, f) for f in self.ranks]
+        out = pd.Series(False, index=df.index)
+        for i in range(len(cols)):
+            for j in range(i + 1, len(cols)):
+                out |= (cols[i] == cols[j]) & cols[i].isin(SITES)
+        return out
+
+
+# =========================
+# הסכמה
+# =========================
+PREV_YES = ("כן", "אחר...")
+
+SCHEMA: tuple[Rule, ...] = (
+    # סעיף 1 — פרטים אישיים
+    Required(1, "שם פרטי", "יש למלא שם פרטי."),
+    Required(1, "שם משפחה", "יש למלא שם משפחה."),
+    Matches(1, "תעודת זהות", "ת״ז חייבת להיות 8–9 ספרות.", re.compile(r"\d{8,9}")),
+    Required(1, "שפת אם", "יש לציין שפת אם (אחר)."),
+    ListRequired(1, "שפות נוספות", "יש לבחור שפות נוספות (ואם 'אחר' – לפרט)."),
+    ListDetailed(1, "שפות נוספות", "יש לבחור שפות נוספות (ואם 'אחר' – לפרט)."),
+    Matches(1, "טלפון", "מספר טלפון אינו תקין.", re.compile(r"0\d{1,2}-?\d{6,7}")),
+    Required(1, "כתובת", "יש למלא כתובת מלאה."),
+    Matches(1, "אימייל", "כתובת דוא״ל אינה תקינה.", re.compile(r"[^@]+@[^@]+\.[^@]+")),
+    Required(1, "שנת לימודים", "יש לפרט שנת לימודים (אחר)."),
+    Required(1, "מסלול לימודים", "יש למלא מסלול לימודים/תואר."),
+
+    # סעיף 2 — העדפת שיבוץ
+    RanksComplete(2, RANK_FIELDS[0], "יש לבחור מוסד לכל מקום הכשרה. חסר/ים: {missing}."),
+    Distinct(2, RANK_FIELDS[0], "קיימת כפילות בבחירת מוסדות. כל מוסד יכול להופיע פעם אחת בלבד."),
+    RequiredWhen(2, "הכשרה קודמת מקום ותחום", "יש למלא מקום/תחום אם הייתה הכשרה קודמת.",
+                 when="הכשרה קודמת", values=PREV_YES),
+    RequiredWhen(2, "הכשרה קודמת מדריך ומיקום", "יש למלא שם מדריך ומיקום.",
+                 when="הכשרה קודמת", values=PREV_YES),
+    RequiredWhen(2, "הכשרה קודמת בן זוג", "יש למלא בן/בת זוג להתמחות.",
+                 when="הכשרה קודמת", values=PREV_YES),
+    ListRequired(2, "תחומים מועדפים", "יש לבחור עד 3 תחומים (לפחות אחד)."),
+    ListDetailed(2, "תחומים מועדפים", "נבחר 'אחר' – יש לפרט תחום."),
+    MemberOf(2, "תחום מוביל", "יש לבחור תחום מוביל מתוך השלושה.", of="תחומים מועדפים", extra=("אחר...",)),
+    ItemRequiresMark(2, "תחומים מועדפים", "תחום רווחה פתוח לשיבוץ רק לסטודנטים שנה ג׳ ומעלה.",
+                     item_mark="רווחה", other="שנת לימודים", mark="שנה ג'", choices=frozenset(DOMAINS)),
+    Required(2, "בקשה מיוחדת", "יש לציין בקשה מיוחדת (אפשר 'אין')."),
+
+    # סעיף 3 — נתונים אקדמיים
+    Positive(3, "ממוצע", "יש להזין ממוצע ציונים גדול מ-0."),
+
+    # סעיף 4 — התאמות
+    ListRequired(4, "התאמות", "יש לבחור לפחות סוג התאמה אחד (או לציין 'אין')."),
+    ListDetailed(4, "התאמות", "נבחר 'אחר' – יש לפרט התאמה."),
+    RequiredUnlessOnly(4, "התאמות פרטים", "יש לפרט התייחסות להתאמות.", when="התאמות", only="אין"),
+
+    # סעיף 5 — מוטיבציה
+    Required(5, "מוטיבציה 1", "יש לענות על שלוש שאלות המוטיבציה.", also=("מוטיבציה 2", "מוטיבציה 3")),
+
+    # סעיף 6 — הצהרות
+    Equals(6, "אישור הגעה להכשרה", "יש לסמן את ההצהרה על הגעה להכשרה.", value="כן"),
+    Equals(6, CONFIRM_FIELD, "יש לאשר את הצהרת הדיוק וההתאמה.", value=True),
+)
+
+
+# =========================
+# הרצה
+# =========================
+def validate_row(row: dict, schema: tuple[Rule, ...] = SCHEMA) -> list[Issue]:
+    """Errors of a single submission, in schema order (one per failing rule)."""
+    out = []
+    for rule in schema:
+        msg = rule.row_error(row)
+        if msg and not any(i.message == msg and i.section == rule.section for i in out):
+            out.append(Issue(rule.section, rule.field, msg))
+    return out
+
+
+def validate_frame(df: pd.DataFrame, schema: tuple[Rule, ...] = SCHEMA,
+                   id_column: str = "תעודת זהות") -> pd.DataFrame:
+    """One vectorised pass per rule; returns a long table of (row, ID, section, field, error).
+
+    Rules whose fields are not columns of `df` (e.g. the form-only confirmation) are skipped.
+    """
+    parts = []
+    for rule in schema:
+        if not all(f in df for f in rule.fields):
+            continue
+        bad = np.asarray(rule.bad(df), dtype=bool)
+        if bad.any():
+            idx = df.index[bad]
+            parts.append(pd.DataFrame({
+                "שורה": idx, "סעיף": rule.section, "שדה": rule.field,
+                "שגיאה": rule.summary,
+            }))
+    cols = ["שורה", id_column, "סעיף", "שדה", "שגיאה"]
+    if not parts:
+        return pd.DataFrame(columns=cols)
+    out = pd.concat(parts, ignore_index=True)
+    out[id_column] = df.loc[out["שורה"], id_column].to_numpy() if id_column in df else ""
+    return out.sort_values(["שורה", "סעיף"], kind="stable", ignore_index=True)[cols]
+
+
+def load_for_validation(path: Path) -> pd.DataFrame:
+    """Read a CSV as text, so IDs and phone numbers keep their leading zeros."""
+    return pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("csv", type=Path, nargs="?", default=CSV_FILE)
+    ap.add_argument("--out", type=Path, default=None)
+    args = ap.parse_args(argv)
+
+    df = load_for_validation(args.csv)
+    report = validate_frame(df)
+    print(f"{len(df)} rows, {report['שורה'].nunique()} with errors, {len(report)} errors")
+    if not report.empty:
+        print(report.groupby(["סעיף", "שגיאה"]).size().to_string())
+    if args.out:
+        report.to_csv(args.out, index=False, encoding="utf-8-sig")
+    return 1 if len(report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# writer.py
+# -*- coding: utf-8 -*-
+"""Cross-process file lock and a single-writer queue for local commits."""
+import fcntl
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable
+
+from metrics import count, observe, span
+
+
+class FileLock:
+    """Exclusive advisory lock on a file (fcntl.flock), shared by all server processes.
+
+    flock locks belong to the open file description, so two threads of the same
+    process that each open the lock file also exclude each other.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd: int | None = None
+
+    def acquire(self) -> None:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class SubmissionWriter:
+    """Single background writer thread per process.
+
+    Sessions enqueue items and get a Future back. The writer drains everything
+    that is waiting, takes the cross-process lock once and commits the whole
+    batch (group commit), so concurrent submits share one round of I/O instead
+    of queueing behind each other's writes. `commit_batch` returns one result
+    per item (or None), which becomes the result of that item's Future.
+    """
+
+    def __init__(self, commit_batch: Callable[[list], list | None], lock_path: Path,
+                 max_batch: int = 500):
+        self._commit_batch = commit_batch
+        self._lock = FileLock(lock_path)
+        self._max_batch = max_batch
+        self._q: "queue.Queue[tuple[object, Future, float]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="submission-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        fut: Future = Future()
+        self._q.put((item, fut, time.perf_counter()))
+        return fut
+
+    def pending(self) -> int:
+        return self._q.qsize()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._q.get()]
+            while len(batch) < self._max_batch:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            started = time.perf_counter()
+            for _, _, queued in batch:
+                observe("writer", started - queued, phase="queue_wait")
+            count("writer_batches")
+            count("writer_items", by=len(batch))
+            try:
+                with span("writer", phase="lock_wait"):
+                    self._lock.acquire()
+                try:
+                    with span("writer", phase="commit"):
+                        results = self._commit_batch([item for item, _, _ in batch])
+                finally:
+                    self._lock.release()
+            except Exception as e:
+                for _, fut, _ in batch:
+                    fut.set_exception(e)
+            else:
+                results = results or [None] * len(batch)
+                for (_, fut, _), res in zip(batch, results):
+                    fut.set_result(res)